@@ -2,12 +2,12 @@ from datetime import timedelta
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 
 from app.core.config import settings
 from app.core.security import create_access_token
-from app.database.session import get_db
+from app.database.routing import db_router, get_async_write_db
 from app.services.user_service import user_service
 
 # 配置日志
@@ -16,13 +16,13 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.post("/token")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_write_db)):
     """用户登录获取访问令牌"""
     logger.info(f"登录尝试: username={form_data.username}")
     
     try:
         # 尝试通过邮箱或用户名验证用户
-        user = user_service.authenticate_user(db, form_data.username, form_data.password)
+        user = await user_service.aauthenticate_user(db, form_data.username, form_data.password)
         
         if not user:
             logger.warning(f"登录失败: 用户不存在或密码错误, username={form_data.username}")
@@ -63,18 +63,18 @@ class RegisterRequest(BaseModel):
     password: str
 
 @router.post("/register")
-def register(register_data: RegisterRequest, db: Session = Depends(get_db)):
+async def register(register_data: RegisterRequest, db: AsyncSession = Depends(get_async_write_db)):
     """用户注册"""
     logger.info(f"注册尝试: username={register_data.username}, email={register_data.email}")
     
     try:
         # 检查用户名是否已存在
-        if user_service.get_user_by_username(db, register_data.username):
+        if await user_service.aget_user_by_username(db, register_data.username):
             logger.warning(f"注册失败: 用户名已存在, username={register_data.username}")
             raise HTTPException(status_code=400, detail="用户名已存在")
         
         # 检查邮箱是否已存在
-        if user_service.get_user_by_email(db, register_data.email):
+        if await user_service.aget_user_by_email(db, register_data.email):
             logger.warning(f"注册失败: 邮箱已被注册, email={register_data.email}")
             raise HTTPException(status_code=400, detail="邮箱已被注册")
         
@@ -83,7 +83,9 @@ def register(register_data: RegisterRequest, db: Session = Depends(get_db)):
         user_create = UserCreate(username=register_data.username, email=register_data.email, password=register_data.password)
         
         logger.info(f"开始创建用户: username={register_data.username}, email={register_data.email}")
-        user = user_service.create_user(db, user_create)
+        user = await user_service.acreate_user(db, user_create)
+        # 注册后立即登录和读取用户信息时读主库
+        db_router.pin(user.id)
         
         logger.info(f"注册成功: user_id={user.id}, username={user.username}, email={user.email}")
         return {"id": user.id, "username": user.username, "email": user.email}
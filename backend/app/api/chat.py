@@ -1,250 +1,247 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.session import get_current_active_user
-from app.database.session import get_db
-from app.models.user import User
-from app.models.conversation import Conversation
-from app.models.message import Message
+from app.database.routing import get_async_read_db, get_async_write_db
+from app.schemas.conversation import BulkDeleteResponse, ConversationDetail, ConversationPage, ConversationResponse
+from app.schemas.message import MessagePage, MessageResponse, SendMessageResponse
+from app.services.archive import conversation_archiver
+from app.services.bulk_delete import DeleteJob, bulk_deleter
 from app.services.chat import ChatService
+from app.services.llm_profile import LLMProfile, llm_profiles
+from app.services.llm_service import LLMUnavailable, llm_service
+from app.services.pagination import InvalidCursor
+from app.services.principal_cache import UserSnapshot
+from app.services.stream_coalescer import stream_coalescer
 
 router = APIRouter()
 
-@router.post("/conversations")
-def create_conversation(title: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+@router.post("/conversations", response_model=ConversationResponse)
+async def create_conversation(title: str, db: AsyncSession = Depends(get_async_write_db), current_user: UserSnapshot = Depends(get_current_active_user)):
     """创建新对话"""
-    conversation = ChatService.create_conversation(db, current_user.id, title)
-    # 转换为字典
+    return await ChatService.acreate_conversation(db, current_user.id, title)
+
+@router.get("/conversations", response_model=ConversationPage)
+async def get_conversations(
+    limit: Optional[int] = Query(None, ge=1),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: UserSnapshot = Depends(get_current_active_user)
+):
+    """分页获取用户的对话（按最近活动时间倒序，before翻到更早的对话）"""
+    try:
+        page = await ChatService.aget_conversations(db, current_user.id, limit, before, after)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
-        "id": conversation.id,
-        "user_id": conversation.user_id,
-        "title": conversation.title,
-        "created_at": conversation.created_at.isoformat() if conversation.created_at else None,
-        "updated_at": conversation.updated_at.isoformat() if conversation.updated_at else None
+        "items": page.items,
+        "before": page.before,
+        "after": page.after,
+        "has_more": page.has_more
     }
 
-@router.get("/conversations")
-def get_conversations(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    """获取用户的所有对话"""
-    conversations = ChatService.get_conversations(db, current_user.id)
-    # 转换为字典列表
-    return [
-        {
-            "id": conv.id,
-            "user_id": conv.user_id,
-            "title": conv.title,
-            "created_at": conv.created_at.isoformat() if conv.created_at else None,
-            "updated_at": conv.updated_at.isoformat() if conv.updated_at else None
-        }
-        for conv in conversations
-    ]
-
-@router.get("/conversations/{conversation_id}")
-def get_conversation(conversation_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    """获取对话详情"""
-    conversation = ChatService.get_conversation(db, conversation_id, current_user.id)
+@router.get("/conversations/{conversation_id}", response_model=ConversationDetail)
+async def get_conversation(
+    conversation_id: int,
+    limit: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: UserSnapshot = Depends(get_current_active_user)
+):
+    """获取对话详情和最新的一页消息（更早的消息通过messages_before游标加载）"""
+    conversation = await ChatService.aget_conversation(db, conversation_id, current_user.id)
     if not conversation:
         raise HTTPException(status_code=404, detail="对话不存在")
     
-    # 获取对话的所有消息
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.created_at.asc()).all()
-    
-    # 转换为字典
+    page = await ChatService.aget_conversation_messages(db, conversation_id, limit)
     return {
         "id": conversation.id,
         "user_id": conversation.user_id,
         "title": conversation.title,
-        "created_at": conversation.created_at.isoformat() if conversation.created_at else None,
-        "updated_at": conversation.updated_at.isoformat() if conversation.updated_at else None,
-        "messages": [
-            {
-                "id": msg.id,
-                "conversation_id": msg.conversation_id,
-                "role": msg.role,
-                "content": msg.content,
-                "created_at": msg.created_at.isoformat() if msg.created_at else None,
-                "token_count": msg.token_count
-            }
-            for msg in messages
-        ]
+        "created_at": conversation.created_at,
+        "updated_at": conversation.updated_at,
+        "messages": page.items,
+        "messages_before": page.before,
+        "has_more_messages": page.has_more
     }
 
+@router.get("/conversations/{conversation_id}/messages", response_model=MessagePage)
+async def get_messages(
+    conversation_id: int,
+    limit: Optional[int] = Query(None, ge=1),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: UserSnapshot = Depends(get_current_active_user)
+):
+    """分页获取对话的消息（按时间顺序，before加载更早的消息，after加载更新的消息）"""
+    if not await ChatService.ais_conversation_owner(db, conversation_id, current_user.id):
+        raise HTTPException(status_code=404, detail="对话不存在")
+    try:
+        page = await ChatService.aget_conversation_messages(db, conversation_id, limit, before, after)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "items": page.items,
+        "before": page.before,
+        "after": page.after,
+        "has_more": page.has_more
+    }
+
+def _bulk_delete_response(result, empty_detail: str, message: str):
+    """批量删除的响应：后台删除返回202和任务信息，同步删除返回实际删除的数量"""
+    if isinstance(result, DeleteJob):
+        return ORJSONResponse(status_code=202, content={
+            "message": f"正在后台删除 {len(result.conversation_ids)} 个对话",
+            **result.to_dict()
+        })
+    if result.conversations == 0:
+        raise HTTPException(status_code=404, detail=empty_detail)
+    return {
+        "message": message.format(count=result.conversations),
+        "deleted_conversations": result.conversations,
+        "deleted_messages": result.messages
+    }
+
+# 需要注册在/conversations/{conversation_id}之前，否则"all"会被当作对话ID
+@router.delete("/conversations/all", response_model=BulkDeleteResponse)
+async def delete_all_conversations(background: Optional[bool] = None, db: AsyncSession = Depends(get_async_write_db), current_user: UserSnapshot = Depends(get_current_active_user)):
+    """删除用户的所有对话（消息很多时在后台删除，background可强制指定）"""
+    result = await ChatService.adelete_conversations(db, current_user.id, background=background)
+    return _bulk_delete_response(result, "没有找到对话记录", "成功删除所有 {count} 个对话")
+
 @router.delete("/conversations/{conversation_id}")
-def delete_conversation(conversation_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+async def delete_conversation(conversation_id: int, db: AsyncSession = Depends(get_async_write_db), current_user: UserSnapshot = Depends(get_current_active_user)):
     """删除对话"""
-    success = ChatService.delete_conversation(db, conversation_id, current_user.id)
+    success = await ChatService.adelete_conversation(db, conversation_id, current_user.id)
     if not success:
         raise HTTPException(status_code=404, detail="对话不存在")
     return {"message": "对话删除成功"}
 
 class BatchDeleteRequest(BaseModel):
     conversation_ids: List[int]
+    background: Optional[bool] = None
 
-@router.delete("/conversations")
-def delete_conversations_batch(request: BatchDeleteRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+@router.delete("/conversations", response_model=BulkDeleteResponse)
+async def delete_conversations_batch(request: BatchDeleteRequest, db: AsyncSession = Depends(get_async_write_db), current_user: UserSnapshot = Depends(get_current_active_user)):
     """批量删除对话"""
     if not request.conversation_ids:
         raise HTTPException(status_code=400, detail="请提供要删除的对话ID列表")
     
-    deleted_count = ChatService.delete_conversations_by_ids(db, request.conversation_ids, current_user.id)
-    
-    if deleted_count == 0:
-        raise HTTPException(status_code=404, detail="未找到指定的对话")
-    
-    return {"message": f"成功删除 {deleted_count} 个对话"}
+    result = await ChatService.adelete_conversations(db, current_user.id, request.conversation_ids, request.background)
+    return _bulk_delete_response(result, "未找到指定的对话", "成功删除 {count} 个对话")
 
-@router.delete("/conversations/all")
-def delete_all_conversations(db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
-    """删除用户的所有对话"""
-    deleted_count = ChatService.delete_all_conversations(db, current_user.id)
-    
-    if deleted_count == 0:
-        raise HTTPException(status_code=404, detail="没有找到对话记录")
-    
-    return {"message": f"成功删除所有 {deleted_count} 个对话"}
-
-@router.post("/conversations/batch-delete")
-def batch_delete_conversations(request: BatchDeleteRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+@router.post("/conversations/batch-delete", response_model=BulkDeleteResponse)
+async def batch_delete_conversations(request: BatchDeleteRequest, db: AsyncSession = Depends(get_async_write_db), current_user: UserSnapshot = Depends(get_current_active_user)):
     """批量删除对话（POST方式）"""
     if not request.conversation_ids:
         raise HTTPException(status_code=400, detail="请提供要删除的对话ID列表")
     
-    deleted_count = ChatService.delete_conversations_by_ids(db, request.conversation_ids, current_user.id)
-    
-    if deleted_count == 0:
-        raise HTTPException(status_code=404, detail="未找到指定的对话")
-    
-    return {"message": f"成功删除 {deleted_count} 个对话"}
+    result = await ChatService.adelete_conversations(db, current_user.id, request.conversation_ids, request.background)
+    return _bulk_delete_response(result, "未找到指定的对话", "成功删除 {count} 个对话")
 
-from fastapi.responses import StreamingResponse
-import json
+@router.get("/conversations/delete-jobs/{job_id}")
+async def get_delete_job(job_id: str, current_user: UserSnapshot = Depends(get_current_active_user)):
+    """查询后台删除任务的进度和删除数量"""
+    job = bulk_deleter.get_job(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="删除任务不存在")
+    return job.to_dict()
+
+def _ndjson(event: dict) -> bytes:
+    """流式响应的一行事件（orjson直接输出UTF-8字节，datetime按ISO 8601格式输出）"""
+    return orjson.dumps(event) + b"\n"
 
 class MessageRequest(BaseModel):
     content: str
     use_stream: bool = False
 
-@router.post("/conversations/{conversation_id}/messages")
-def send_message(conversation_id: int, request: MessageRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_active_user)):
+@router.post("/conversations/{conversation_id}/messages", response_model=SendMessageResponse)
+async def send_message(conversation_id: int, request: MessageRequest, db: AsyncSession = Depends(get_async_write_db), current_user: UserSnapshot = Depends(get_current_active_user)):
     """发送消息并获取回复"""
-    # 验证对话是否属于当前用户
-    conversation = ChatService.get_conversation(db, conversation_id, current_user.id)
-    if not conversation:
+    # 验证对话是否属于当前用户（在主库上按主键查询）
+    is_owner = await ChatService.ais_conversation_owner(db, conversation_id, current_user.id)
+    if not is_owner:
         raise HTTPException(status_code=404, detail="对话不存在")
     
+    # 已归档的对话先恢复，新消息写在恢复的历史之后
+    await conversation_archiver.aensure_restored(db, conversation_id)
+    
+    # 用户的生成参数（已缓存时不查询设置）
+    profile = await llm_profiles.aget(db, current_user.id)
+    
     # 添加用户消息
-    user_message = ChatService.add_message(db, conversation_id, "user", request.content)
+    user_message = await ChatService.aadd_message(db, conversation_id, "user", request.content)
     
     # 如果是流式响应
     if request.use_stream:
         return StreamingResponse(
-            stream_response(db, conversation_id, request.content, user_message),
+            stream_response(db, conversation_id, request.content, user_message, profile),
             media_type="text/plain; charset=utf-8"
         )
     
     # 非流式响应
     try:
-        ai_response = ChatService.generate_answer(db, conversation_id, request.content)
+        usage = {}
+        ai_response = await ChatService.agenerate_answer(db, conversation_id, request.content, usage, profile)
         # 添加AI回复消息
-        ai_message = ChatService.add_message(db, conversation_id, "assistant", ai_response)
-        
-        # 将SQLAlchemy对象转换为字典
-        user_message_dict = {
-            "id": user_message.id,
-            "conversation_id": user_message.conversation_id,
-            "role": user_message.role,
-            "content": user_message.content,
-            "created_at": user_message.created_at.isoformat() if user_message.created_at else None,
-            "token_count": user_message.token_count
-        }
-        
-        ai_message_dict = {
-            "id": ai_message.id,
-            "conversation_id": ai_message.conversation_id,
-            "role": ai_message.role,
-            "content": ai_response,
-            "created_at": ai_message.created_at.isoformat() if ai_message.created_at else None,
-            "token_count": ai_message.token_count
-        }
-        
-        return {"user_message": user_message_dict, "ai_message": ai_message_dict}
+        ai_message = await ChatService.aadd_message(db, conversation_id, "assistant", ai_response, usage)
+        return {"user_message": user_message, "ai_message": ai_message}
+    except LLMUnavailable as e:
+        # 上游不可用时不保存助手消息，返回502/503（过载时带Retry-After）
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after is not None else None
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def stream_response(db: Session, conversation_id: int, content: str, user_message):
-    """流式响应生成器"""
-    from app.services.llm_service import LLMService
-    
+async def stream_response(db: AsyncSession, conversation_id: int, content: str, user_message, profile: LLMProfile):
+    """流式响应生成器 - 上游读取和数据库操作都不阻塞事件循环"""
     # 获取对话历史
-    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-    if not conversation:
-        yield json.dumps({"error": "对话不存在"})
+    try:
+        messages = await ChatService.abuild_llm_messages(db, conversation_id, content, profile)
+    except ValueError:
+        yield _ndjson({"error": "对话不存在"})
         return
     
-    # 获取历史消息
-    history_messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.created_at.desc()).limit(20).all()
-    
-    # 反转列表，使消息按时间顺序排列
-    history_messages.reverse()
-    
-    # 构建消息列表
-    messages = []
-    for msg in history_messages:
-        messages.append({"role": msg.role, "content": msg.content})
-    
-    # 添加最新用户消息
-    if not history_messages or history_messages[-1].role != 'user' or history_messages[-1].content != content:
-        messages.append({"role": "user", "content": content})
-    
-    # 使用LLM服务生成流式响应
-    llm_service = LLMService()
-    
+    # 使用共享的LLM服务生成流式响应（复用上游连接池）
     try:
         # 发送开始标记
-        yield json.dumps({
+        yield _ndjson({
             "type": "start",
-            "user_message": {
-                "id": user_message.id,
-                "conversation_id": user_message.conversation_id,
-                "role": user_message.role,
-                "content": user_message.content,
-                "created_at": user_message.created_at.isoformat() if user_message.created_at else None,
-                "token_count": user_message.token_count
-            }
-        }) + "\n"
+            "user_message": MessageResponse.model_validate(user_message).model_dump()
+        })
         
-        # 流式生成响应
+        # 流式生成响应（上游的细小片段按时间窗口合并后输出，帧格式不变）
         full_response = ""
-        for chunk in llm_service.generate_stream_response(messages):
+        usage = {}
+        async for chunk in stream_coalescer.coalesce(llm_service.agenerate_stream_response(messages, usage, profile)):
             full_response += chunk
-            yield json.dumps({
+            yield _ndjson({
                 "type": "chunk",
                 "content": chunk
-            }) + "\n"
+            })
         
         # 添加AI回复消息到数据库
-        ai_message = ChatService.add_message(db, conversation_id, "assistant", full_response)
+        ai_message = await ChatService.aadd_message(db, conversation_id, "assistant", full_response, usage)
         
         # 发送结束标记
-        yield json.dumps({
+        yield _ndjson({
             "type": "end",
-            "ai_message": {
-                "id": ai_message.id,
-                "conversation_id": ai_message.conversation_id,
-                "role": ai_message.role,
-                "content": full_response,
-                "created_at": ai_message.created_at.isoformat() if ai_message.created_at else None,
-                "token_count": ai_message.token_count
-            }
-        }) + "\n"
+            "ai_message": MessageResponse.model_validate(ai_message).model_dump()
+        })
         
+    except LLMUnavailable as e:
+        # 上游不可用时不保存助手消息（已发送的片段只在客户端显示）
+        event = {"type": "error", "error": str(e), "status": e.status_code}
+        if e.retry_after is not None:
+            event["retry_after"] = e.retry_after
+        yield _ndjson(event)
     except Exception as e:
-        yield json.dumps({
+        yield _ndjson({
             "type": "error",
             "error": str(e)
-        }) + "\n"
\ No newline at end of file
+        })
\ No newline at end of file
@@ -1,27 +1,25 @@
-from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.database import get_db
-from app.models.user import User
-from app.schemas.user import TokenData
-from app.utils.auth import verify_token
-from app.services import user_service
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.routing import get_async_read_db
+from app.services.principal_cache import UserSnapshot, principal_cache
 
 # OAuth2密码Bearer令牌
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_read_db)) -> UserSnapshot:
     """
     获取当前用户
     
+    优先使用认证主体缓存（解码后的令牌和用户快照），命中时不查询数据库。
+    
     Args:
         token: JWT令牌
-        db: 数据库会话
+        db: 数据库会话（缓存未命中时使用）
     
     Returns:
-        当前用户对象
+        当前用户快照
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -29,14 +27,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    token_data = verify_token(token, credentials_exception)
-    user = user_service.get_user_by_id(db, user_id=token_data.user_id)
+    user = await principal_cache.aauthenticate(db, token)
     if user is None:
         raise credentials_exception
     return user
 
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: UserSnapshot = Depends(get_current_user)) -> UserSnapshot:
     """
     获取当前活跃用户
     
@@ -44,7 +41,7 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         current_user: 当前用户
     
     Returns:
-        当前活跃用户对象
+        当前活跃用户快照
     """
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="用户未激活")
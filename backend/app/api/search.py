@@ -0,0 +1,45 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.session import get_current_active_user
+from app.database.routing import get_async_read_db
+from app.services.pagination import InvalidCursor
+from app.services.principal_cache import UserSnapshot
+from app.services.search import search_index
+
+router = APIRouter()
+
+@router.get("/search")
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    conversation_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: UserSnapshot = Depends(get_current_active_user)
+):
+    """
+    搜索当前用户的对话历史（按相关度排序，cursor翻到下一页）
+
+    空白分隔的多个词需要同时出现；snippet为HTML转义后的片段，匹配部分用<mark>包裹。
+    """
+    try:
+        page = await search_index.asearch(db, current_user.id, q, limit, cursor, conversation_id)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "items": [
+            {
+                "message_id": hit.message_id,
+                "conversation_id": hit.conversation_id,
+                "conversation_title": hit.conversation_title,
+                "role": hit.role,
+                "created_at": hit.created_at.isoformat() if hit.created_at else None,
+                "snippet": hit.snippet
+            }
+            for hit in page.items
+        ],
+        "next": page.next,
+        "has_more": page.has_more
+    }
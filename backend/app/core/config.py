@@ -15,6 +15,37 @@ class Settings:
     
     # 数据库配置
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./assistant.db")
+    # 只读副本URL（逗号分隔，为空时读写都使用主库）
+    DATABASE_REPLICA_URLS: str = os.getenv("DATABASE_REPLICA_URLS", "")
+    # 用户写入后读会话固定使用主库的时间（秒），保证读到自己刚写入的数据
+    DB_READ_YOUR_WRITES_SECONDS: float = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+    # 复制延迟超过这个值（秒）的只读副本不分配读会话
+    DB_REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "10"))
+    DB_REPLICA_LAG_CHECK_INTERVAL: float = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "5"))
+
+    # 数据库连接池配置
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+    # PostgreSQL连接配置（每个连接建立时设置）
+    PG_APPLICATION_NAME: str = os.getenv("PG_APPLICATION_NAME", "my-chat-assistant")
+    PG_CONNECT_TIMEOUT: int = int(os.getenv("PG_CONNECT_TIMEOUT", "10"))
+    # 单条语句和事务中空闲的超时时间（毫秒，0表示不限制），避免慢查询和未结束的事务占住连接
+    PG_STATEMENT_TIMEOUT_MS: int = int(os.getenv("PG_STATEMENT_TIMEOUT_MS", "30000"))
+    PG_IDLE_IN_TRANSACTION_TIMEOUT_MS: int = int(os.getenv("PG_IDLE_IN_TRANSACTION_TIMEOUT_MS", "60000"))
+    # asyncpg每个连接缓存的预编译语句数
+    PG_STATEMENT_CACHE_SIZE: int = int(os.getenv("PG_STATEMENT_CACHE_SIZE", "256"))
+
+    # SQLite连接PRAGMA配置（每个连接建立时执行）
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT: int = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+    SQLITE_CACHE_SIZE: int = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    # aiosqlite每个连接占用一个线程，SQLite只有一个写者，异步连接池保持较小
+    SQLITE_ASYNC_POOL_SIZE: int = int(os.getenv("SQLITE_ASYNC_POOL_SIZE", "4"))
     
     # Redis配置
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -24,12 +55,128 @@ class Settings:
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     REFRESH_TOKEN_EXPIRE_DAYS: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+
+    # 密码哈希配置（bcrypt成本因子；哈希和校验在独立的进程池中执行，超出进程数的请求排队，
+    # 排队已满或等待超时时返回503）
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_QUEUE_SIZE: int = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "64"))
+    PASSWORD_HASH_TIMEOUT: float = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+    # 认证主体缓存配置（进程内缓存解码后的令牌和用户快照，命中时认证不查询数据库）
+    AUTH_CACHE_ENABLED: bool = os.getenv("AUTH_CACHE_ENABLED", "True").lower() == "true"
+    AUTH_CACHE_SIZE: int = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+    AUTH_CACHE_TTL: int = int(os.getenv("AUTH_CACHE_TTL", "60"))
     
     # DeepSeek API配置
     DEEPSEEK_API_KEY: str = os.getenv("DEEPSEEK_API_KEY", "default-api-key-change-in-production")
     DEEPSEEK_MODEL: str = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
     DEEPSEEK_API_BASE: str = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com")
-    
+
+    # 生成参数默认值；用户可在设置中（settings["llm"]）选择模型、max_tokens、temperature
+    # 和自定义系统提示词，模型必须在LLM_ALLOWED_MODELS中（逗号分隔，为空时只允许DEEPSEEK_MODEL）
+    LLM_MAX_TOKENS: int = int(os.getenv("LLM_MAX_TOKENS", "2048"))
+    LLM_TEMPERATURE: float = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+    LLM_ALLOWED_MODELS: str = os.getenv("LLM_ALLOWED_MODELS", "")
+    LLM_MAX_TOKENS_LIMIT: int = int(os.getenv("LLM_MAX_TOKENS_LIMIT", "8192"))
+    LLM_SYSTEM_PROMPT_MAX_CHARS: int = int(os.getenv("LLM_SYSTEM_PROMPT_MAX_CHARS", "2000"))
+    # 解析后的用户生成参数缓存（修改设置时失效）
+    LLM_PROFILE_CACHE_SIZE: int = int(os.getenv("LLM_PROFILE_CACHE_SIZE", "10000"))
+    LLM_PROFILE_CACHE_TTL: int = int(os.getenv("LLM_PROFILE_CACHE_TTL", "600"))
+
+    # LLM上游HTTP连接池配置
+    LLM_HTTP_MAX_CONNECTIONS: int = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+    LLM_HTTP_MAX_KEEPALIVE: int = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+    LLM_HTTP_CONNECT_TIMEOUT: float = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+    LLM_HTTP2: bool = os.getenv("LLM_HTTP2", "True").lower() == "true"
+    LLM_HTTP_WARMUP: bool = os.getenv("LLM_HTTP_WARMUP", "True").lower() == "true"
+
+    # LLM上游自适应并发限制（AIMD）和排队配置
+    LLM_LIMIT_INITIAL: int = int(os.getenv("LLM_LIMIT_INITIAL", "16"))
+    LLM_LIMIT_MIN: int = int(os.getenv("LLM_LIMIT_MIN", "2"))
+    LLM_LIMIT_MAX: int = int(os.getenv("LLM_LIMIT_MAX", "64"))
+    LLM_LIMIT_DECREASE_RATIO: float = float(os.getenv("LLM_LIMIT_DECREASE_RATIO", "0.7"))
+    LLM_LIMIT_QUEUE_SIZE: int = int(os.getenv("LLM_LIMIT_QUEUE_SIZE", "200"))
+    LLM_LIMIT_QUEUE_TIMEOUT: float = float(os.getenv("LLM_LIMIT_QUEUE_TIMEOUT", "30"))
+
+    # LLM上游重试配置（429/5xx和连接失败，带抖动的指数退避，遵循Retry-After）
+    LLM_RETRY_MAX_ATTEMPTS: int = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "3"))
+    LLM_RETRY_BASE_DELAY: float = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+    LLM_RETRY_MAX_DELAY: float = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+
+    # LLM回答缓存配置（LLM_CACHE_DISK_PATH为空时只使用内存缓存）
+    # 默认关闭；开启后也只缓存temperature为0的请求，采样生成的回答（如默认的0.7）不复用
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "False").lower() == "true"
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", "3600"))
+    LLM_CACHE_DISK_PATH: str = os.getenv("LLM_CACHE_DISK_PATH", "")
+    LLM_CACHE_DISK_MAX_BYTES: int = int(os.getenv("LLM_CACHE_DISK_MAX_BYTES", str(64 * 1024 * 1024)))
+    LLM_CACHE_REPLAY_CHUNK_SIZE: int = int(os.getenv("LLM_CACHE_REPLAY_CHUNK_SIZE", "16"))
+
+    # 相同的并发LLM请求合并为一次上游调用
+    LLM_SINGLE_FLIGHT_ENABLED: bool = os.getenv("LLM_SINGLE_FLIGHT_ENABLED", "True").lower() == "true"
+
+    # 流式响应片段合并（距上一帧不足窗口时间的片段先缓冲，达到字节数或窗口到期时合并为一帧，单位秒）
+    STREAM_COALESCE_ENABLED: bool = os.getenv("STREAM_COALESCE_ENABLED", "True").lower() == "true"
+    STREAM_COALESCE_WINDOW: float = float(os.getenv("STREAM_COALESCE_WINDOW", "0.05"))
+    STREAM_COALESCE_MAX_BYTES: int = int(os.getenv("STREAM_COALESCE_MAX_BYTES", "512"))
+
+    # Token计数配置（estimate为无依赖估算，tiktoken为精确BPE计数）
+    TOKENIZER_BACKEND: str = os.getenv("TOKENIZER_BACKEND", "estimate")
+    TOKENIZER_ENCODING: str = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+    TOKENIZER_CACHE_SIZE: int = int(os.getenv("TOKENIZER_CACHE_SIZE", "10000"))
+
+    # LLM上下文组装配置（历史消息按token预算选取，预算包含系统提示词）
+    LLM_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "8000"))
+    LLM_CONTEXT_MAX_MESSAGES: int = int(os.getenv("LLM_CONTEXT_MAX_MESSAGES", "200"))
+    # 超出预算时上下文起点后移，只保留该比例的预算，使之后多轮对话的提示词前缀保持不变
+    LLM_CONTEXT_RETAIN_RATIO: float = float(os.getenv("LLM_CONTEXT_RETAIN_RATIO", "0.6"))
+
+    # 对话历史缓存配置（进程内缓存活跃对话最近的消息窗口）
+# 多进程部署时命中前会核对对话最新的消息ID，其他进程写入的消息不会被漏掉；TTL只限制空闲窗口占用的内存
+    HISTORY_CACHE_ENABLED: bool = os.getenv("HISTORY_CACHE_ENABLED", "True").lower() == "true"
+    HISTORY_CACHE_SIZE: int = int(os.getenv("HISTORY_CACHE_SIZE", "500"))
+    HISTORY_CACHE_TTL: int = int(os.getenv("HISTORY_CACHE_TTL", "600"))
+
+    # 分页配置（对话列表和消息历史使用键集分页）
+    CONVERSATION_PAGE_SIZE: int = int(os.getenv("CONVERSATION_PAGE_SIZE", "50"))
+    MESSAGE_PAGE_SIZE: int = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+    PAGE_SIZE_MAX: int = int(os.getenv("PAGE_SIZE_MAX", "200"))
+
+    # 批量删除配置（每个事务删除的对话数；消息数超过阈值时在后台删除）
+    BULK_DELETE_CHUNK_SIZE: int = int(os.getenv("BULK_DELETE_CHUNK_SIZE", "200"))
+    BULK_DELETE_BACKGROUND_THRESHOLD: int = int(os.getenv("BULK_DELETE_BACKGROUND_THRESHOLD", "20000"))
+
+    # 消息写入配置（合并多个请求的消息写入为一次提交）
+    MESSAGE_WRITER_ENABLED: bool = os.getenv("MESSAGE_WRITER_ENABLED", "True").lower() == "true"
+    # 收到第一条消息后等待更多消息的时间窗口（毫秒）和每批最多消息数
+    MESSAGE_WRITER_WINDOW_MS: float = float(os.getenv("MESSAGE_WRITER_WINDOW_MS", "2"))
+    MESSAGE_WRITER_MAX_BATCH: int = int(os.getenv("MESSAGE_WRITER_MAX_BATCH", "128"))
+    # 写入连接的持久性：为空时与SQLITE_SYNCHRONOUS相同；FULL每次提交都fsync，
+    # OFF不fsync（PostgreSQL上对应synchronous_commit=off）
+    MESSAGE_WRITER_SYNCHRONOUS: str = os.getenv("MESSAGE_WRITER_SYNCHRONOUS", "")
+
+    # 全文搜索配置（SQLite FTS5；每页条数、片段长度、参与相关度排序的最新匹配数）
+    SEARCH_ENABLED: bool = os.getenv("SEARCH_ENABLED", "True").lower() == "true"
+    SEARCH_PAGE_SIZE: int = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+    SEARCH_SNIPPET_CHARS: int = int(os.getenv("SEARCH_SNIPPET_CHARS", "80"))
+    SEARCH_MAX_CANDIDATES: int = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+
+    # 消息内容压缩配置（none、zlib或zstd；压缩级别；短于该字节数的消息不压缩）
+    # 已有消息和压缩字典用scripts/compress_messages.py处理
+    MESSAGE_COMPRESSION: str = os.getenv("MESSAGE_COMPRESSION", "none")
+    MESSAGE_COMPRESSION_LEVEL: int = int(os.getenv("MESSAGE_COMPRESSION_LEVEL", "3"))
+    MESSAGE_COMPRESSION_MIN_BYTES: int = int(os.getenv("MESSAGE_COMPRESSION_MIN_BYTES", "256"))
+
+    # 冷归档配置（超过该天数未活动的对话归档；每批归档的对话数）
+    # 归档由scripts/archive_conversations.py执行（如每天一次的定时任务）
+    ARCHIVE_IDLE_DAYS: int = int(os.getenv("ARCHIVE_IDLE_DAYS", "90"))
+    ARCHIVE_BATCH_SIZE: int = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+
+    # 运行时指标接口/metrics（默认关闭；开启后只有管理员可以访问）
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "False").lower() == "true"
+
     # CORS配置
     BACKEND_CORS_ORIGINS: list = ["http://localhost:3000", "http://localhost:3001"]
 
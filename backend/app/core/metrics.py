@@ -0,0 +1,39 @@
+import logging
+import threading
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsRegistry:
+    """运行时指标注册表
+
+    各组件注册一个返回字典的统计函数，/metrics 端点汇总输出。
+    """
+
+    def __init__(self):
+        self._providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, provider: Callable[[], Dict[str, Any]]) -> None:
+        """注册指标提供者，同名注册会覆盖旧的提供者"""
+        with self._lock:
+            self._providers[name] = provider
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取所有指标的快照"""
+        with self._lock:
+            providers = dict(self._providers)
+
+        result: Dict[str, Any] = {}
+        for name, provider in providers.items():
+            try:
+                result[name] = provider()
+            except Exception as e:
+                logger.warning(f"获取指标失败: name={name}, error={str(e)}")
+                result[name] = {"error": str(e)}
+        return result
+
+
+# 创建全局指标注册表
+metrics = MetricsRegistry()
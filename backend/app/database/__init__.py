@@ -1,4 +1,4 @@
-from .db import Base, engine, get_db, SessionLocal
+from .db import AsyncSessionLocal, Base, async_engine, engine, get_async_db, get_db, SessionLocal
 from .config import settings
 
-__all__ = ["Base", "engine", "get_db", "settings", "SessionLocal"]
\ No newline at end of file
+__all__ = ["AsyncSessionLocal", "Base", "async_engine", "engine", "get_async_db", "get_db", "settings", "SessionLocal"]
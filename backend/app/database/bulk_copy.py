@@ -0,0 +1,224 @@
+import csv
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence
+
+from sqlalchemy import Boolean, DateTime, Integer, JSON, LargeBinary, Table, func, select
+from sqlalchemy.engine import Engine
+
+import app.models  # noqa: F401 注册模型
+from app.database.session import Base
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 默认导出/导入的表，按外键依赖排列（导入时先导入被引用的表）
+TABLES = ("users", "user_settings", "conversations", "messages", "compression_dictionaries", "archived_conversations")
+# 非PostgreSQL数据库逐批读写的行数
+BATCH_SIZE = 5000
+
+
+class CopyResult(NamedTuple):
+    """一个表的导出/导入结果"""
+    table: str
+    rows: int
+    seconds: float
+
+
+def _table(name: str) -> Table:
+    table = Base.metadata.tables.get(name)
+    if table is None:
+        raise ValueError(f"未知的表: {name}")
+    return table
+
+
+def _csv_path(directory: str, name: str) -> str:
+    return os.path.join(directory, f"{name}.csv")
+
+
+# ---- CSV格式 ----
+# 与PostgreSQL的COPY ... WITH (FORMAT csv, HEADER true)相同：第一行为列名，
+# NULL为不带引号的空字段，空字符串为""，布尔值为t/f，二进制为\x开头的十六进制。
+# 其他数据库导出时非数值字段都加引号，因此可以区分NULL和空字符串
+# （csv.QUOTE_NONNUMERIC会把None也写成""，不能使用）。
+
+def _to_csv(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        value = "t" if value else "f"
+    elif isinstance(value, (int, float)):
+        return str(value)
+    elif isinstance(value, datetime):
+        value = value.isoformat(sep=" ")
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        value = "\\x" + bytes(value).hex()
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def _csv_line(values: Sequence[Any]) -> str:
+    return ",".join(_to_csv(value) for value in values) + "\n"
+
+
+def _parser(column) -> Callable[[str], Any]:
+    """CSV字段到列值的转换（csv模块不区分NULL和空字符串：可为空的列视为NULL）"""
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        convert = lambda value: value.lower() in ("t", "true", "1")  # noqa: E731
+    elif isinstance(column_type, Integer):
+        convert = int
+    elif isinstance(column_type, DateTime):
+        convert = datetime.fromisoformat
+    elif isinstance(column_type, JSON):
+        convert = json.loads
+    elif isinstance(column_type, LargeBinary):
+        convert = lambda value: bytes.fromhex(value[2:]) if value.startswith("\\x") else value.encode()  # noqa: E731
+    else:
+        return (lambda value: value or None) if column.nullable else (lambda value: value)
+    return lambda value: convert(value) if value != "" else None
+
+
+def _read_header(path: str, table: Table) -> List[str]:
+    with open(path, encoding="utf-8", newline="") as f:
+        header = next(csv.reader(f), [])
+    unknown = [name for name in header if name not in table.columns]
+    if not header or unknown:
+        raise ValueError(f"{path}的列与表{table.name}不匹配: {unknown or '缺少列名'}")
+    return header
+
+
+def _quoted_columns(engine: Engine, names: Sequence[str]) -> str:
+    quote = engine.dialect.identifier_preparer.quote
+    return ", ".join(quote(name) for name in names)
+
+
+# ---- 导出 ----
+
+def _copy_out(engine: Engine, table: Table, path: str) -> int:
+    columns = _quoted_columns(engine, [column.name for column in table.columns])
+    order = _quoted_columns(engine, [column.name for column in table.primary_key.columns])
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor, open(path, "w", encoding="utf-8", newline="") as f:
+            # 时间统一按UTC输出，导入到其他数据库时与SQLite中保存的UTC时间一致
+            cursor.execute("SET LOCAL TIME ZONE 'UTC'")
+            cursor.copy_expert(
+                f"COPY (SELECT {columns} FROM {table.name} ORDER BY {order}) TO STDOUT WITH (FORMAT csv, HEADER true)", f
+            )
+            rows = cursor.rowcount
+        raw.commit()
+    finally:
+        raw.close()
+    return rows
+
+
+def _write_csv(engine: Engine, table: Table, path: str) -> int:
+    rows = 0
+    with engine.connect() as conn, open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(_csv_line([column.name for column in table.columns]))
+        result = conn.execution_options(yield_per=BATCH_SIZE).execute(
+            select(table).order_by(*table.primary_key.columns)
+        )
+        for batch in result.partitions():
+            f.writelines(_csv_line(row) for row in batch)
+            rows += len(batch)
+    return rows
+
+
+def export_tables(engine: Engine, directory: str, tables: Sequence[str] = TABLES) -> List[CopyResult]:
+    """
+    把表导出为目录下的<表名>.csv
+
+    PostgreSQL上使用COPY ... TO STDOUT（服务端直接生成CSV并流式传输）；
+    其他数据库按主键顺序流式读取后写出相同格式的CSV（消息内容为解压后的文本）。
+    """
+    os.makedirs(directory, exist_ok=True)
+    results = []
+    for name in tables:
+        table = _table(name)
+        start = time.perf_counter()
+        path = _csv_path(directory, name)
+        rows = _copy_out(engine, table, path) if engine.dialect.name == "postgresql" else _write_csv(engine, table, path)
+        results.append(CopyResult(name, rows, time.perf_counter() - start))
+        logger.info(f"已导出: table={name}, rows={rows}")
+    return results
+
+
+# ---- 导入 ----
+
+def _copy_in(engine: Engine, table: Table, path: str, header: List[str]) -> int:
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cursor, open(path, encoding="utf-8", newline="") as f:
+            # 不带时区的时间（如从SQLite导出的）按UTC解释
+            cursor.execute("SET LOCAL TIME ZONE 'UTC'")
+            cursor.copy_expert(
+                f"COPY {table.name} ({_quoted_columns(engine, header)}) FROM STDIN WITH (FORMAT csv, HEADER true)", f
+            )
+            rows = cursor.rowcount
+            # 导入时指定了ID，把自增序列推进到最大ID之后
+            if "id" in table.columns and isinstance(table.c.id.type, Integer) and table.c.id.autoincrement:
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), COALESCE(MAX(id), 1), "
+                    f"MAX(id) IS NOT NULL) FROM {table.name}"
+                )
+        raw.commit()
+    finally:
+        raw.close()
+    return rows
+
+
+def _insert_csv(engine: Engine, table: Table, path: str, header: List[str]) -> int:
+    parsers = [_parser(table.columns[name]) for name in header]
+    rows = 0
+    with engine.begin() as conn, open(path, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        batch: List[Dict[str, Any]] = []
+        for record in reader:
+            batch.append({name: parse(value) for name, parse, value in zip(header, parsers, record)})
+            if len(batch) == BATCH_SIZE:
+                conn.execute(table.insert(), batch)
+                rows += len(batch)
+                batch = []
+        if batch:
+            conn.execute(table.insert(), batch)
+            rows += len(batch)
+    return rows
+
+
+def import_tables(engine: Engine, directory: str, tables: Sequence[str] = TABLES) -> List[CopyResult]:
+    """
+    从目录下的<表名>.csv导入（缺少的文件跳过，目标表必须为空，保留原有ID）
+
+    PostgreSQL上使用COPY ... FROM STDIN，并把自增序列推进到导入的最大ID之后；
+    其他数据库按批插入（消息内容按当前配置压缩），导入消息后重建SQLite全文索引。
+    """
+    results = []
+    for name in tables:
+        path = _csv_path(directory, name)
+        if not os.path.exists(path):
+            continue
+        table = _table(name)
+        with engine.connect() as conn:
+            if conn.execute(select(func.count()).select_from(table)).scalar():
+                raise ValueError(f"导入的目标表必须为空: {name}")
+        header = _read_header(path, table)
+        start = time.perf_counter()
+        if engine.dialect.name == "postgresql":
+            rows = _copy_in(engine, table, path, header)
+        else:
+            rows = _insert_csv(engine, table, path, header)
+        results.append(CopyResult(name, rows, time.perf_counter() - start))
+        logger.info(f"已导入: table={name}, rows={rows}")
+
+    if engine.dialect.name == "sqlite" and any(result.table == "messages" for result in results):
+        from app.services.search import search_index
+
+        search_index.rebuild(engine)
+    return results
@@ -0,0 +1,341 @@
+import logging
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Union
+
+from sqlalchemy import Text, bindparam, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.types import TypeDecorator
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 压缩数据头：算法编号（1字节）+ 字典ID（4字节，0表示不使用字典）
+HEADER = struct.Struct(">BI")
+ZLIB = 1
+ZSTD = 2
+ALGORITHMS = {"zlib": ZLIB, "zstd": ZSTD}
+
+# 字典大小：zlib预置字典最多使用32KiB，zstd训练字典默认64KiB
+ZLIB_DICT_SIZE = 32 * 1024
+ZSTD_DICT_SIZE = 64 * 1024
+# 训练字典使用的最近消息数
+TRAIN_SAMPLES = 5000
+
+_FRAGMENT = re.compile(r"[^\n。！？；.!?;]+[\n。！？；.!?;]?")
+
+
+class Dictionary(NamedTuple):
+    """压缩字典"""
+    id: int
+    algorithm: str
+    data: bytes
+
+
+def _zstd():
+    import zstandard
+
+    return zstandard
+
+
+def build_zlib_dictionary(samples: Sequence[str], size: int = ZLIB_DICT_SIZE) -> bytes:
+    """
+    从样本消息构造zlib预置字典
+
+    zlib没有字典训练工具：按句子和行切分样本，取重复出现的片段，
+    价值（出现次数 x 长度）高的片段放在字典末尾（距离越近，引用越短）。
+    """
+    counts = Counter(
+        fragment for sample in samples for fragment in _FRAGMENT.findall(sample) if len(fragment) >= 4
+    )
+    chosen: List[bytes] = []
+    total = 0
+    for fragment, count in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if count < 2:
+            break
+        data = fragment.encode("utf-8")
+        if total + len(data) > size:
+            continue
+        chosen.append(data)
+        total += len(data)
+    return b"".join(reversed(chosen))
+
+
+class MessageCodec:
+    """
+    消息内容的透明压缩
+
+    MESSAGE_COMPRESSION为zlib或zstd时，超过MESSAGE_COMPRESSION_MIN_BYTES的消息内容
+    以"算法+字典ID"开头的BLOB保存；字典用最近的消息训练，保存在compression_dictionaries表中，
+    压缩数据带有字典ID，重新训练后旧数据仍可解压。读取时按值的类型区分：
+    文本原样返回（未压缩或历史数据），BLOB解压。zstandard未安装时使用zlib。
+    """
+
+    def __init__(self):
+        self.algorithm = settings.MESSAGE_COMPRESSION.lower()
+        self.level = settings.MESSAGE_COMPRESSION_LEVEL
+        self.min_bytes = settings.MESSAGE_COMPRESSION_MIN_BYTES
+        if self.algorithm == "zstd":
+            try:
+                _zstd()
+            except ImportError:
+                logger.warning("zstandard未安装，消息压缩使用zlib")
+                self.algorithm = "zlib"
+        elif self.algorithm not in ("none", "zlib"):
+            logger.warning(f"未知的消息压缩算法，不压缩: algorithm={self.algorithm}")
+            self.algorithm = "none"
+        self._engine: Optional[Engine] = None
+        self._dictionaries: Optional[Dict[int, Dictionary]] = None
+        self._compressors: Dict[int, Any] = {}
+        self._decompressors: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.compressed = 0
+        self.skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.decoded = 0
+        self.decode_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.algorithm != "none"
+
+    def bind(self, engine: Engine) -> None:
+        """设置读取压缩字典使用的数据库引擎（清空已加载的字典）"""
+        with self._lock:
+            self._engine = engine
+            self._dictionaries = None
+            self._compressors.clear()
+            self._decompressors.clear()
+
+    def _load(self) -> Dict[int, Dictionary]:
+        dictionaries = self._dictionaries
+        if dictionaries is not None:
+            return dictionaries
+        with self._lock:
+            if self._dictionaries is None:
+                loaded: Dict[int, Dictionary] = {}
+                if self._engine is not None:
+                    try:
+                        with self._engine.connect() as conn:
+                            for row in conn.execute(text("SELECT id, algorithm, data FROM compression_dictionaries")):
+                                loaded[row.id] = Dictionary(row.id, row.algorithm, bytes(row.data))
+                    except DBAPIError:
+                        # 尚未执行迁移，没有字典表
+                        pass
+                self._dictionaries = loaded
+            return self._dictionaries
+
+    def _dictionary(self, dictionary_id: int) -> Dictionary:
+        dictionary = self._load().get(dictionary_id)
+        if dictionary is None:
+            # 其他进程训练了新字典
+            self.bind(self._engine)
+            dictionary = self._load().get(dictionary_id)
+            if dictionary is None:
+                raise ValueError(f"压缩字典不存在: id={dictionary_id}")
+        return dictionary
+
+    def active_dictionary(self, algorithm: Optional[str] = None) -> Optional[Dictionary]:
+        """压缩新数据使用的字典（该算法最新训练的字典）"""
+        algorithm = algorithm or self.algorithm
+        candidates = [d for d in self._load().values() if d.algorithm == algorithm]
+        return max(candidates, key=lambda d: d.id) if candidates else None
+
+    def compress(self, data: bytes, algorithm: Optional[str] = None) -> bytes:
+        """
+        压缩数据，返回带数据头的BLOB
+
+        Args:
+            data: 原始数据
+            algorithm: 压缩算法，默认为MESSAGE_COMPRESSION；未启用压缩时使用zlib
+        """
+        algorithm = algorithm or (self.algorithm if self.enabled else "zlib")
+        dictionary = self.active_dictionary(algorithm)
+        dictionary_id = dictionary.id if dictionary else 0
+        if algorithm == "zstd":
+            compressor = self._compressors.get(dictionary_id)
+            if compressor is None:
+                zstandard = _zstd()
+                dict_data = zstandard.ZstdCompressionDict(dictionary.data) if dictionary else None
+                compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data)
+                self._compressors[dictionary_id] = compressor
+            # ZstdCompressor不是线程安全的，压缩时加锁
+            with self._lock:
+                payload = compressor.compress(data)
+        else:
+            if dictionary:
+                compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15, zdict=dictionary.data)
+            else:
+                compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+        return HEADER.pack(ALGORITHMS[algorithm], dictionary_id) + payload
+
+    def decompress(self, blob: bytes) -> bytes:
+        """解压带数据头的BLOB"""
+        algorithm, dictionary_id = HEADER.unpack_from(blob)
+        payload = memoryview(blob)[HEADER.size:]
+        dictionary = self._dictionary(dictionary_id) if dictionary_id else None
+        if algorithm == ZSTD:
+            decompressor = self._decompressors.get(dictionary_id)
+            if decompressor is None:
+                zstandard = _zstd()
+                dict_data = zstandard.ZstdCompressionDict(dictionary.data) if dictionary else None
+                decompressor = zstandard.ZstdDecompressor(dict_data=dict_data)
+                self._decompressors[dictionary_id] = decompressor
+            with self._lock:
+                return decompressor.decompress(payload)
+        if algorithm == ZLIB:
+            if dictionary:
+                decompressor = zlib.decompressobj(-15, zdict=dictionary.data)
+            else:
+                decompressor = zlib.decompressobj(-15)
+            return decompressor.decompress(payload) + decompressor.flush()
+        raise ValueError(f"未知的压缩算法: {algorithm}")
+
+    def encode(self, content: str) -> Union[str, bytes]:
+        """消息内容写入数据库前的编码：较短或压缩后不变小的内容保持文本"""
+        data = content.encode("utf-8")
+        if not self.enabled or len(data) < self.min_bytes:
+            return content
+        blob = self.compress(data)
+        if len(blob) >= len(data):
+            self.skipped += 1
+            return content
+        self.compressed += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(blob)
+        return blob
+
+    def decode(self, value: Union[str, bytes, None]) -> Optional[str]:
+        """从数据库读取的消息内容解码：文本原样返回，BLOB解压"""
+        if not isinstance(value, (bytes, memoryview)):
+            return value
+        start = time.perf_counter()
+        content = self.decompress(bytes(value)).decode("utf-8")
+        self.decoded += 1
+        self.decode_seconds += time.perf_counter() - start
+        return content
+
+    def train(self, engine: Engine, algorithm: Optional[str] = None, samples: int = TRAIN_SAMPLES) -> Optional[Dictionary]:
+        """
+        用最近的消息训练压缩字典并保存，之后压缩的数据使用新字典
+
+        Args:
+            engine: 数据库引擎
+            algorithm: 字典对应的压缩算法，默认为MESSAGE_COMPRESSION
+            samples: 使用的最近消息数
+
+        Returns:
+            新字典，样本不足时返回None
+        """
+        from app.models.message import Message
+
+        algorithm = algorithm or (self.algorithm if self.enabled else "zlib")
+        self.bind(engine)
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT content FROM messages ORDER BY id DESC LIMIT :limit").columns(Message.content),
+                {"limit": samples}
+            ).scalars().all()
+        contents = [content for content in rows if len(content.encode("utf-8")) >= self.min_bytes]
+        if len(contents) < 10:
+            logger.warning(f"样本消息不足，不训练压缩字典: samples={len(contents)}")
+            return None
+
+        if algorithm == "zstd":
+            zstandard = _zstd()
+            data = zstandard.train_dictionary(ZSTD_DICT_SIZE, [c.encode("utf-8") for c in contents]).as_bytes()
+        else:
+            data = build_zlib_dictionary(contents)
+        with engine.begin() as conn:
+            dictionary_id = conn.execute(
+                text("INSERT INTO compression_dictionaries (algorithm, data) VALUES (:algorithm, :data) RETURNING id"),
+                {"algorithm": algorithm, "data": data}
+            ).scalar()
+        self.bind(engine)
+        logger.info(f"已训练压缩字典: id={dictionary_id}, algorithm={algorithm}, samples={len(contents)}, "
+                    f"size={len(data)}")
+        return Dictionary(dictionary_id, algorithm, data)
+
+    def stats(self) -> Dict[str, Any]:
+        """消息压缩统计信息"""
+        active = self.active_dictionary() if self.enabled else None
+        return {
+            "algorithm": self.algorithm,
+            "level": self.level,
+            "min_bytes": self.min_bytes,
+            "dictionary_id": active.id if active else None,
+            "compressed": self.compressed,
+            "skipped": self.skipped,
+            "ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+            "decoded": self.decoded,
+            "avg_decode_us": round(self.decode_seconds / self.decoded * 1e6, 1) if self.decoded else 0.0,
+        }
+
+
+class CompressedText(TypeDecorator):
+    """
+    透明压缩的文本列
+
+    SQLite上按MessageCodec编码（可能保存为BLOB）；PostgreSQL的TOAST已经会压缩大文本，
+    其他数据库原样保存。比较运算（如LIKE）的参数不压缩。
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Any:
+        if value is None or dialect.name != "sqlite":
+            return value
+        return message_codec.encode(value)
+
+    def process_result_value(self, value: Any, dialect) -> Optional[str]:
+        return message_codec.decode(value)
+
+    def coerce_compared_value(self, op, value):
+        return Text()
+
+
+def compress_existing(engine: Engine, batch_size: int = 500) -> int:
+    """按当前配置压缩数据库中仍以文本保存的消息，返回处理的消息数（未启用压缩时不处理）"""
+    from app.models.message import Message
+
+    if not message_codec.enabled:
+        return 0
+    message_codec.bind(engine)
+    total = 0
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text("SELECT id, content FROM messages WHERE id > :last_id AND typeof(content) = 'text' "
+                     "AND length(CAST(content AS BLOB)) >= :min_bytes ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "min_bytes": message_codec.min_bytes, "limit": batch_size}
+            ).all()
+            if not rows:
+                return total
+            table = Message.__table__
+            conn.execute(
+                table.update().where(table.c.id == bindparam("message_id")).values(
+                    content=bindparam("new_content", type_=table.c.content.type)
+                ),
+                [{"message_id": row.id, "new_content": row.content} for row in rows]
+            )
+        total += len(rows)
+        last_id = rows[-1].id
+
+
+# 创建消息压缩实例
+message_codec = MessageCodec()
+metrics.register("message_compression", message_codec.stats)
@@ -1,17 +1,4 @@
-import os
-from functools import lru_cache
+# 兼容旧的导入路径：数据库配置统一由app.core.config提供
+from app.core.config import settings, get_settings
 
-
-class Settings:
-    """数据库配置"""
-    # 使用SQLite数据库替代PostgreSQL
-    DATABASE_URL: str = "sqlite:///./assistant.db"
-
-
-@lru_cache()
-def get_settings():
-    """获取设置单例"""
-    return Settings()
-
-
-settings = get_settings()
\ No newline at end of file
+__all__ = ["settings", "get_settings"]
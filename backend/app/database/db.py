@@ -1,25 +1,4 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from .config import settings
+# 兼容旧的导入路径：引擎、会话和基类统一由app.database.session提供
+from .session import AsyncSessionLocal, Base, async_engine, engine, get_async_db, get_db, SessionLocal
 
-# 创建数据库引擎 - 适配SQLite
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False}  # SQLite需要这个参数来支持多线程
-)
-
-# 创建会话工厂
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# 创建基类
-Base = declarative_base()
-
-# 依赖项：获取数据库会话
-def get_db():
-    """获取数据库会话的依赖项"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+__all__ = ["AsyncSessionLocal", "Base", "async_engine", "engine", "get_async_db", "get_db", "SessionLocal"]
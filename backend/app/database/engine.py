@@ -0,0 +1,167 @@
+import logging
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.config import settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 同步驱动对应的异步驱动
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def sqlite_pragmas() -> Dict[str, Any]:
+    """每个SQLite连接上执行的PRAGMA配置"""
+    return {
+        # WAL模式下读不阻塞写、写不阻塞读，提交只追加WAL文件
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,
+        # WAL模式下NORMAL只在检查点时fsync，断电最多丢失最近的事务，不会损坏数据库
+        "synchronous": settings.SQLITE_SYNCHRONOUS,
+        # 写锁被占用时等待而不是立即报"database is locked"（毫秒）
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT,
+        # 页缓存大小，负数表示KiB
+        "cache_size": settings.SQLITE_CACHE_SIZE,
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "temp_store": "MEMORY",
+    }
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def is_memory_sqlite(url: URL) -> bool:
+    """是否为内存SQLite数据库（每个引擎各自独立，不能用另一个引擎访问）"""
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def postgres_connect_args(driver: str) -> Dict[str, Any]:
+    """
+    PostgreSQL的连接参数
+
+    设置应用名（便于在pg_stat_activity中区分）、连接超时，以及服务端的语句超时和
+    事务中空闲超时；psycopg2和asyncpg的参数形式不同。
+    """
+    server_settings = {
+        "application_name": settings.PG_APPLICATION_NAME,
+        "statement_timeout": str(settings.PG_STATEMENT_TIMEOUT_MS),
+        "idle_in_transaction_session_timeout": str(settings.PG_IDLE_IN_TRANSACTION_TIMEOUT_MS),
+    }
+    if driver == "asyncpg":
+        return {
+            "timeout": settings.PG_CONNECT_TIMEOUT,
+            "server_settings": server_settings,
+            "prepared_statement_cache_size": settings.PG_STATEMENT_CACHE_SIZE,
+        }
+    return {
+        "connect_timeout": settings.PG_CONNECT_TIMEOUT,
+        "application_name": server_settings.pop("application_name"),
+        "options": " ".join(f"-c {name}={value}" for name, value in server_settings.items()),
+        # TCP keepalive：及时发现被防火墙或负载均衡断开的空闲连接
+        "keepalives": 1,
+        "keepalives_idle": 60,
+    }
+
+
+def _engine_options(url: URL) -> Dict[str, Any]:
+    options: Dict[str, Any] = {}
+    # 内存SQLite数据库使用单连接池，不支持连接池大小参数
+    if not is_memory_sqlite(url):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    if url.get_backend_name() != "sqlite":
+        # 后进先出：负载低时只有少数连接被反复使用，其余连接空闲到pool_recycle后关闭，
+        # 服务端的连接数随负载收缩
+        options.update(pool_pre_ping=True, pool_use_lifo=True)
+    if url.get_backend_name() == "postgresql":
+        options["connect_args"] = postgres_connect_args(url.get_driver_name())
+        if url.get_driver_name() == "psycopg2":
+            # executemany的INSERT合并为多行VALUES，UPDATE（如批量提交消息时更新对话）按页批量发送
+            options["executemany_mode"] = "values_plus_batch"
+    return options
+
+
+def async_url(url: str) -> URL:
+    """把数据库URL转换为使用异步驱动的URL（已指定异步驱动时原样返回）"""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"不支持异步访问的数据库: {parsed.get_backend_name()}")
+    if parsed.drivername in ASYNC_DRIVERS.values():
+        return parsed
+    return parsed.set(drivername=driver)
+
+
+def create_db_engine(url: Optional[str] = None, **kwargs: Any) -> Engine:
+    """
+    按配置创建数据库引擎
+
+    SQLite连接允许跨线程使用（路由在线程池中访问数据库），并在每个连接上应用PRAGMA配置；
+    其他数据库使用显式大小的连接池，PostgreSQL连接设置超时和应用名（见postgres_connect_args）。
+
+    Args:
+        url: 数据库URL，默认为DATABASE_URL
+        **kwargs: 传给create_engine的额外参数，覆盖默认配置
+
+    Returns:
+        数据库引擎
+    """
+    url = url or settings.DATABASE_URL
+    parsed = make_url(url)
+    is_sqlite = parsed.get_backend_name() == "sqlite"
+
+    options = _engine_options(parsed)
+    if is_sqlite:
+        options["connect_args"] = {"check_same_thread": False}
+    options.update(kwargs)
+
+    engine = create_engine(url, **options)
+    if is_sqlite:
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+    logger.info(f"数据库引擎已创建: backend={engine.dialect.name}, pool={engine.pool.status()}")
+    return engine
+
+
+def create_async_db_engine(url: Optional[str] = None, **kwargs: Any) -> AsyncEngine:
+    """
+    按配置创建异步数据库引擎（SQLite使用aiosqlite，PostgreSQL使用asyncpg）
+
+    PRAGMA配置与同步引擎相同；SQLite文件数据库的连接池大小为SQLITE_ASYNC_POOL_SIZE。
+
+    Args:
+        url: 数据库URL，默认为DATABASE_URL，同步驱动会被替换为对应的异步驱动
+        **kwargs: 传给create_async_engine的额外参数，覆盖默认配置
+
+    Returns:
+        异步数据库引擎
+    """
+    parsed = async_url(url or settings.DATABASE_URL)
+    options = _engine_options(parsed)
+    if parsed.get_backend_name() == "sqlite" and not is_memory_sqlite(parsed):
+        # aiosqlite默认每次新建连接，显式使用连接池复用连接（和连接上的PRAGMA配置）；
+        # 每个连接有自己的线程，连接过多时线程争用GIL和写锁，尾延迟反而变差
+        options.update(poolclass=AsyncAdaptedQueuePool, pool_size=settings.SQLITE_ASYNC_POOL_SIZE, max_overflow=0)
+    options.update(kwargs)
+
+    engine = create_async_engine(parsed, **options)
+    if parsed.get_backend_name() == "sqlite":
+        event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    logger.info(f"异步数据库引擎已创建: backend={engine.dialect.name}, driver={engine.dialect.driver}")
+    return engine
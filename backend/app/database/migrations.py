@@ -0,0 +1,217 @@
+import logging
+from typing import Callable, List, NamedTuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    """一个版本化的数据库迁移"""
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def _add_column_if_missing(conn: Connection, table: str, column: str, definition: str) -> None:
+    """为已有表补充列（create_all不会修改已有表）"""
+    existing = {info["name"] for info in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+
+def _create_index(conn: Connection, name: str, table: str, columns: str) -> None:
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def _prompt_cache_columns(conn: Connection) -> None:
+    _add_column_if_missing(conn, "messages", "prompt_cache_hit_tokens", "INTEGER")
+    _add_column_if_missing(conn, "messages", "prompt_cache_miss_tokens", "INTEGER")
+    _add_column_if_missing(conn, "conversations", "prompt_cache_hit_tokens", "INTEGER DEFAULT 0 NOT NULL")
+    _add_column_if_missing(conn, "conversations", "prompt_cache_miss_tokens", "INTEGER DEFAULT 0 NOT NULL")
+
+
+def _hot_query_indexes(conn: Connection) -> None:
+    # 对话消息按时间顺序加载、对话历史按ID倒序分页
+    _create_index(conn, "ix_messages_conversation_id_created_at", "messages", "conversation_id, created_at, id")
+    _create_index(conn, "ix_messages_conversation_id_id", "messages", "conversation_id, id")
+    # 用户的对话列表按更新时间倒序
+    _create_index(conn, "ix_conversations_user_id_updated_at", "conversations", "user_id, updated_at, id")
+
+
+def _backfill_conversation_updated_at(conn: Connection) -> None:
+    # 对话列表按(updated_at, id)键集分页，排序键不能为空
+    conn.execute(text("UPDATE conversations SET updated_at = created_at WHERE updated_at IS NULL"))
+
+
+def _message_search_index(conn: Connection) -> None:
+    # 全文索引只在SQLite上使用FTS5，其他数据库搜索时退化为LIKE
+    if conn.dialect.name != "sqlite":
+        return
+    from app.services.search import search_index
+    try:
+        search_index.populate(conn)
+    except OperationalError as e:
+        logger.warning(f"SQLite不支持FTS5，跳过全文索引: {str(e)}")
+
+
+def _archive_and_compression_tables(conn: Connection) -> None:
+    from app.models.archive import ArchivedConversation, CompressionDictionary
+
+    _add_column_if_missing(conn, "conversations", "archived_at", "TIMESTAMP")
+    _add_column_if_missing(conn, "conversations", "restored_at", "TIMESTAMP")
+    ArchivedConversation.__table__.create(conn, checkfirst=True)
+    CompressionDictionary.__table__.create(conn, checkfirst=True)
+
+
+def _message_id_autoincrement(conn: Connection) -> None:
+    # 消息ID不复用：归档会删除消息行，没有AUTOINCREMENT时SQLite会把最大的ID分配给新消息，
+    # 恢复归档时ID冲突，全文索引中的旧行也会指向新消息。PostgreSQL的序列本身不复用ID
+    if conn.dialect.name != "sqlite":
+        return
+    import json
+
+    from app.database.compression import message_codec
+    from app.models.archive import ArchivedConversation
+    from app.models.message import Message
+    from app.services.search import FTS_TABLE
+
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages'")).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return
+
+    # SQLite不能修改已有表的主键定义，按模型重建表（索引名全局唯一，先删除旧表上的索引）
+    indexes = conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages' AND sql IS NOT NULL"
+    )).scalars().all()
+    for name in indexes:
+        conn.execute(text(f"DROP INDEX {name}"))
+    conn.execute(text("ALTER TABLE messages RENAME TO messages_old"))
+    Message.__table__.create(conn)
+    columns = ", ".join(column.name for column in Message.__table__.columns)
+    conn.execute(text(f"INSERT INTO messages ({columns}) SELECT {columns} FROM messages_old"))
+    conn.execute(text("DROP TABLE messages_old"))
+
+    # 新ID从所有用过的ID之后开始：现有消息、全文索引中的行、已归档的消息
+    last_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM messages")).scalar()
+    if inspect(conn).has_table(FTS_TABLE):
+        last_id = max(last_id, conn.execute(text(f"SELECT COALESCE(MAX(rowid), 0) FROM {FTS_TABLE}")).scalar())
+    if inspect(conn).has_table(ArchivedConversation.__tablename__):
+        for (data,) in conn.execute(text("SELECT data FROM archived_conversations")):
+            rows = json.loads(message_codec.decompress(bytes(data)))
+            if rows:
+                last_id = max(last_id, max(row[0] for row in rows))
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'messages'"))
+    conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('messages', :seq)"), {"seq": last_id})
+
+
+def _index_archived_messages(conn: Connection) -> None:
+    # 之前归档时消息从全文索引中删除，补回索引使已归档的消息可以被搜索到
+    if conn.dialect.name != "sqlite":
+        return
+    from app.services.search import search_index
+    if search_index.available(conn):
+        search_index.index_archived(conn)
+
+
+def _archived_message_id_range(conn: Connection) -> None:
+    # 搜索匹配到已归档的消息时按消息ID范围查找归档
+    import json
+
+    from app.database.compression import message_codec
+
+    _add_column_if_missing(conn, "archived_conversations", "first_message_id", "INTEGER")
+    _add_column_if_missing(conn, "archived_conversations", "last_message_id", "INTEGER")
+    archived = conn.execute(text(
+        "SELECT conversation_id, data FROM archived_conversations WHERE first_message_id IS NULL"
+    )).all()
+    for conversation_id, data in archived:
+        rows = json.loads(message_codec.decompress(bytes(data)))
+        if rows:
+            conn.execute(
+                text("UPDATE archived_conversations SET first_message_id = :first, last_message_id = :last "
+                     "WHERE conversation_id = :conversation_id"),
+                {"first": rows[0][0], "last": rows[-1][0], "conversation_id": conversation_id}
+            )
+
+
+def _contentless_search_index(conn: Connection) -> None:
+    # 全文索引改为无内容表，不再保存消息原文的副本（已归档的消息也不再以明文保存在索引中）
+    if conn.dialect.name != "sqlite":
+        return
+    from app.services.search import FTS_TABLE, search_index
+
+    sql = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    ).scalar()
+    if sql is None or "content=''" in sql:
+        return
+    conn.execute(text(f"DROP TABLE {FTS_TABLE}"))
+    search_index.populate(conn)
+
+
+# 按版本号递增排列；已发布的迁移不要修改，新的变更追加新版本
+MIGRATIONS: List[Migration] = [
+    Migration(1, "messages/conversations增加提示词前缀缓存统计列", _prompt_cache_columns),
+    Migration(2, "messages和conversations热点查询的组合索引", _hot_query_indexes),
+    Migration(3, "conversations.updated_at为空时补齐为created_at", _backfill_conversation_updated_at),
+    Migration(4, "消息全文索引messages_fts（SQLite FTS5）", _message_search_index),
+    Migration(5, "conversations.archived_at/restored_at、冷归档表和消息压缩字典表", _archive_and_compression_tables),
+    Migration(6, "messages.id使用AUTOINCREMENT，归档后删除的消息ID不再复用（SQLite）", _message_id_autoincrement),
+    Migration(7, "已归档的消息写入全文索引（SQLite FTS5）", _index_archived_messages),
+    Migration(8, "archived_conversations增加归档消息的ID范围", _archived_message_id_range),
+    Migration(9, "全文索引messages_fts改为无内容表（SQLite FTS5）", _contentless_search_index),
+]
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL, "
+        "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    ))
+
+
+def current_version(engine: Engine) -> int:
+    """当前数据库的迁移版本，0表示尚未执行任何迁移"""
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def migrate(engine: Engine, target: int = None) -> List[int]:
+    """
+    执行尚未应用的迁移
+
+    在create_all之后调用：新数据库上create_all已经按模型建好了表，
+    迁移步骤都是幂等的，只记录版本；已有数据库则补齐缺失的列和索引。
+    每个迁移在独立的事务中执行。
+
+    Args:
+        engine: 数据库引擎
+        target: 迁移到的版本，默认为最新版本
+
+    Returns:
+        本次应用的版本号列表
+    """
+    applied: List[int] = []
+    version = current_version(engine)
+    for migration in MIGRATIONS:
+        if migration.version <= version or (target is not None and migration.version > target):
+            continue
+        try:
+            with engine.begin() as conn:
+                migration.upgrade(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                    {"version": migration.version, "description": migration.description}
+                )
+        except IntegrityError:
+            # 其他进程已经应用了这个版本
+            continue
+        logger.info(f"已应用数据库迁移: version={migration.version}, {migration.description}")
+        applied.append(migration.version)
+    return applied
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import Depends, Request
+from fastapi.security.utils import get_authorization_scheme_param
+from jose import JWTError, jwt
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.database.engine import create_async_db_engine
+from app.database.session import AsyncSessionLocal
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 只读副本的复制延迟（秒）查询；其他数据库视为没有延迟
+REPLICA_LAG_SQL = {
+    "postgresql": (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    ),
+}
+# 查询复制延迟的超时时间（秒）
+LAG_CHECK_TIMEOUT = 2.0
+# 读写一致性窗口记录的用户数超过这个值时清理过期记录
+MAX_PINNED_USERS = 10_000
+
+# 会话info中的键：会话连接的只读副本名称（主库为None）、提交后需要固定到主库的用户ID
+REPLICA_KEY = "replica"
+PIN_USER_KEY = "pin_user_id"
+
+
+class Replica:
+    """只读副本：异步引擎、会话工厂、最近一次测得的复制延迟"""
+
+    def __init__(self, url: str):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_async_db_engine(url)
+        self.sessionmaker = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        self.lag: Optional[float] = 0.0
+        self.healthy = True
+        self.next_check = 0.0
+        self.reads = 0
+        self.check_errors = 0
+
+
+class DatabaseRouter:
+    """
+    读写会话路由
+
+    写会话和需要读到最新数据的读会话使用主库。配置了DATABASE_REPLICA_URLS时，
+    只读路由（对话列表、消息历史、搜索、用户信息和设置）的会话轮流使用复制延迟不超过
+    DB_REPLICA_MAX_LAG_SECONDS的只读副本；用户在写会话中提交后的
+    DB_READ_YOUR_WRITES_SECONDS秒内，其读会话固定使用主库（读到自己刚写入的数据）。
+    固定记录保存在进程内，多进程部署时每个进程各自记录。
+    """
+
+    def __init__(self, replica_urls: Optional[str] = None):
+        urls = settings.DATABASE_REPLICA_URLS if replica_urls is None else replica_urls
+        self.replicas: List[Replica] = [Replica(url.strip()) for url in urls.split(",") if url.strip()]
+        self.pin_seconds = settings.DB_READ_YOUR_WRITES_SECONDS
+        self.max_lag = settings.DB_REPLICA_MAX_LAG_SECONDS
+        self.check_interval = settings.DB_REPLICA_LAG_CHECK_INTERVAL
+        self._pins: Dict[int, float] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+        # 统计计数：读会话的路由结果
+        self.replica_reads = 0
+        self.primary_no_replica = 0
+        self.primary_pinned = 0
+        self.primary_lagging = 0
+        self.pins = 0
+
+    def pin(self, user_id: Optional[int]) -> None:
+        """用户写入后，在读写一致性窗口内把其读会话固定到主库"""
+        if user_id is None or not self.replicas:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._pins[user_id] = now + self.pin_seconds
+            self.pins += 1
+            if len(self._pins) > MAX_PINNED_USERS:
+                self._pins = {uid: expires for uid, expires in self._pins.items() if expires > now}
+
+    def is_pinned(self, user_id: Optional[int]) -> bool:
+        """用户是否在读写一致性窗口内"""
+        if user_id is None:
+            return False
+        expires = self._pins.get(user_id)
+        return expires is not None and expires > time.monotonic()
+
+    async def _check_lag(self, replica: Replica) -> None:
+        sql = REPLICA_LAG_SQL.get(replica.engine.dialect.name)
+        if sql is None:
+            replica.lag, replica.healthy = 0.0, True
+            return
+        try:
+            async with replica.engine.connect() as conn:
+                lag = (await asyncio.wait_for(conn.execute(text(sql)), LAG_CHECK_TIMEOUT)).scalar()
+            replica.lag, replica.healthy = float(lag or 0), True
+        except Exception as e:
+            replica.lag, replica.healthy = None, False
+            replica.check_errors += 1
+            logger.warning(f"只读副本不可用，读会话使用主库: replica={replica.name}, error={str(e)}")
+
+    async def choose_replica(self, user_id: Optional[int]) -> Optional[Replica]:
+        """
+        为读会话选择只读副本
+
+        Args:
+            user_id: 发起请求的用户ID（未登录时为None）
+
+        Returns:
+            只读副本；应使用主库时返回None
+        """
+        if not self.replicas:
+            self.primary_no_replica += 1
+            return None
+        if self.is_pinned(user_id):
+            self.primary_pinned += 1
+            return None
+
+        now = time.monotonic()
+        for replica in self.replicas:
+            if now >= replica.next_check:
+                # 先推迟下次检查时间，并发的请求不重复查询
+                replica.next_check = now + self.check_interval
+                await self._check_lag(replica)
+        candidates = [r for r in self.replicas if r.healthy and r.lag is not None and r.lag <= self.max_lag]
+        if not candidates:
+            self.primary_lagging += 1
+            return None
+        replica = candidates[self._next % len(candidates)]
+        self._next += 1
+        replica.reads += 1
+        self.replica_reads += 1
+        return replica
+
+    def session(self, replica: Optional[Replica] = None) -> AsyncSession:
+        """创建连接到只读副本（replica为None时连接主库）的异步会话"""
+        db = AsyncSessionLocal() if replica is None else replica.sessionmaker()
+        db.info[REPLICA_KEY] = replica.name if replica is not None else None
+        return db
+
+    async def dispose(self) -> None:
+        """释放只读副本的连接"""
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self) -> Dict[str, Any]:
+        """读写路由统计信息"""
+        now = time.monotonic()
+        return {
+            "replicas": [
+                {
+                    "name": replica.name,
+                    "healthy": replica.healthy,
+                    "lag_seconds": round(replica.lag, 3) if replica.lag is not None else None,
+                    "reads": replica.reads,
+                    "check_errors": replica.check_errors,
+                }
+                for replica in self.replicas
+            ],
+            "max_lag_seconds": self.max_lag,
+            "replica_reads": self.replica_reads,
+            "primary_reads": {
+                "no_replica": self.primary_no_replica,
+                "pinned": self.primary_pinned,
+                "lagging": self.primary_lagging,
+            },
+            "pins": self.pins,
+            "pinned_users": sum(1 for expires in list(self._pins.values()) if expires > now),
+        }
+
+
+@event.listens_for(Session, "after_commit")
+def _pin_after_commit(session: Session) -> None:
+    """写会话提交后，把写入的用户固定到主库"""
+    user_id = session.info.get(PIN_USER_KEY)
+    if user_id is not None:
+        db_router.pin(user_id)
+
+
+def request_user_id(request: Request) -> Optional[int]:
+    """
+    从Bearer令牌中读取用户ID，只用于选择会话（不校验签名）
+
+    身份认证仍由get_current_user完成，伪造的令牌只会影响这个请求读哪个数据库。
+    """
+    scheme, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return int(jwt.get_unverified_claims(token)["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+
+
+# 依赖项：获取只读路由的异步数据库会话
+async def get_async_read_db(request: Request):
+    """获取只读数据库会话的依赖项（可能连接只读副本，不要在这个会话中写入）"""
+    replica = await db_router.choose_replica(request_user_id(request))
+    async with db_router.session(replica) as db:
+        yield db
+
+
+# 依赖项：获取写路由的异步数据库会话
+async def get_async_write_db(request: Request, read_db: AsyncSession = Depends(get_async_read_db)):
+    """
+    获取写数据库会话的依赖项（连接主库）
+
+    同一请求的读会话（如认证时查询用户）已经连接主库时复用它，不额外占用连接；
+    会话提交后，当前用户在读写一致性窗口内的读会话固定到主库。
+    """
+    user_id = request_user_id(request)
+    if read_db.info.get(REPLICA_KEY) is None:
+        read_db.info[PIN_USER_KEY] = user_id
+        yield read_db
+        return
+    async with db_router.session() as db:
+        db.info[PIN_USER_KEY] = user_id
+        yield db
+
+
+# 创建读写路由实例
+db_router = DatabaseRouter()
+metrics.register("db_routing", db_router.stats)
@@ -1,23 +1,37 @@
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-from app.core.config import settings
+from app.database.compression import message_codec
+from app.database.engine import create_async_db_engine, create_db_engine
 
-# 创建数据库引擎
-engine = create_engine(settings.DATABASE_URL)
+# 创建数据库引擎（进程内唯一，按配置调优）
+engine = create_db_engine()
+# 消息压缩字典从这个引擎读取
+message_codec.bind(engine)
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 创建异步数据库引擎和会话工厂（路由使用，不阻塞事件循环）
+# 提交后不使对象过期，避免在异步上下文中访问属性时触发隐式查询
+async_engine = create_async_db_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # 创建基类
 Base = declarative_base()
 
-# 依赖注入函数
+# 依赖项：获取数据库会话
 def get_db():
-    """获取数据库会话"""
+    """获取数据库会话的依赖项"""
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# 依赖项：获取异步数据库会话
+async def get_async_db():
+    """获取异步数据库会话的依赖项"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,12 +1,21 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
-from app.api import auth, chat, user
+from app.api import auth, chat, search, user
 from app.core.config import settings
-from app.database.session import engine, Base
+from app.core.metrics import metrics
+from app.core.session import get_current_superuser
+from app.database.migrations import migrate
+from app.database.routing import db_router
+from app.database.session import async_engine, engine, Base
+from app.services.llm_service import llm_service
+from app.services.message_writer import message_writer
+from app.services.password_hasher import password_hasher
 
-# 创建数据库表
+# 创建数据库表，并对已有数据库执行版本化迁移（补充新增的列和索引）
 Base.metadata.create_all(bind=engine)
+migrate(engine)
 
 # 创建FastAPI应用实例
 app = FastAPI(
@@ -14,7 +23,9 @@ app = FastAPI(
     description="一个类似Deepseek的AI助手API",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    # 响应统一用orjson序列化（声明了response_model的路由先由Pydantic校验和转换）
+    default_response_class=ORJSONResponse
 )
 
 # 配置CORS
@@ -30,6 +41,24 @@ app.add_middleware(
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(chat.router, prefix="/api", tags=["chat"])
 app.include_router(user.router, prefix="/api/user", tags=["user"])
+app.include_router(search.router, prefix="/api", tags=["search"])
+
+@app.on_event("startup")
+async def startup():
+    """应用启动 - 启动密码哈希进程，预热LLM上游连接池"""
+    password_hasher.start()
+    if settings.LLM_HTTP_WARMUP:
+        await llm_service.awarmup()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """应用关闭 - 释放上游连接，写完待提交的消息后释放数据库连接"""
+    await llm_service.http_client.aclose()
+    llm_service.http_client.close()
+    message_writer.close()
+    password_hasher.close()
+    await async_engine.dispose()
+    await db_router.dispose()
 
 @app.get("/")
 def root():
@@ -41,6 +70,12 @@ def health_check():
     """健康检查"""
     return {"status": "healthy"}
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", dependencies=[Depends(get_current_superuser)])
+    def get_metrics():
+        """运行时指标（只有管理员可以访问）"""
+        return metrics.snapshot()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
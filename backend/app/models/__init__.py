@@ -2,5 +2,6 @@ from .user import User
 from .user_settings import UserSettings
 from .conversation import Conversation
 from .message import Message
+from .archive import ArchivedConversation, CompressionDictionary
 
-__all__ = ["User", "UserSettings", "Conversation", "Message"]
\ No newline at end of file
+__all__ = ["User", "UserSettings", "Conversation", "Message", "ArchivedConversation", "CompressionDictionary"]
\ No newline at end of file
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, LargeBinary
+from sqlalchemy.sql import func
+
+from app.database.session import Base
+
+
+class ArchivedConversation(Base):
+    """冷归档的对话消息（整个对话的消息压缩为一个BLOB，访问时恢复）"""
+    __tablename__ = "archived_conversations"
+
+    conversation_id = Column(Integer, ForeignKey("conversations.id"), primary_key=True)
+    message_count = Column(Integer, nullable=False)
+    # 归档前消息内容的总字节数（未压缩）
+    original_bytes = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    # 归档消息的ID范围，搜索时按全文索引匹配到的消息ID查找所在的归档
+    first_message_id = Column(Integer, nullable=True)
+    last_message_id = Column(Integer, nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class CompressionDictionary(Base):
+    """消息压缩字典（压缩数据中记录字典ID，字典一经使用不能删除）"""
+    __tablename__ = "compression_dictionaries"
+
+    id = Column(Integer, primary_key=True)
+    algorithm = Column(String, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
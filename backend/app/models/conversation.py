@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -7,12 +7,24 @@ from app.database.session import Base
 class Conversation(Base):
     """会话模型"""
     __tablename__ = "conversations"
+    __table_args__ = (
+        # 用户的对话列表按更新时间倒序（已有数据库由迁移创建）
+        Index("ix_conversations_user_id_updated_at", "user_id", "updated_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     title = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # 对话列表按最近活动时间排序和分页，创建时即赋值，添加消息时更新
+    updated_at = Column(DateTime(timezone=True), default=func.now(), onupdate=func.now())
+    # 对话累计的上游提示词前缀缓存命中/未命中token数
+    prompt_cache_hit_tokens = Column(Integer, default=0, server_default="0", nullable=False)
+    prompt_cache_miss_tokens = Column(Integer, default=0, server_default="0", nullable=False)
+    # 消息已冷归档的时间，访问时恢复后清空
+    archived_at = Column(DateTime(timezone=True), nullable=True)
+    # 最近一次从归档恢复的时间，恢复后ARCHIVE_IDLE_DAYS天内不再归档
+    restored_at = Column(DateTime(timezone=True), nullable=True)
     
     # 关系
     user = relationship("User", backref="conversations")
@@ -1,19 +1,31 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
+from app.database.compression import CompressedText
 from app.database.session import Base
 
 class Message(Base):
     """消息模型"""
     __tablename__ = "messages"
+    __table_args__ = (
+        # 对话消息按时间顺序加载、对话历史按ID倒序分页（已有数据库由迁移创建）
+        Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at", "id"),
+        Index("ix_messages_conversation_id_id", "conversation_id", "id"),
+        # 归档会删除消息行，ID不能复用（恢复时按原ID写回，全文索引按ID关联消息；已有数据库由迁移重建）
+        {"sqlite_autoincrement": True},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
     role = Column(String, nullable=False)  # 'user' or 'assistant'
-    content = Column(Text, nullable=False)
+    # 按MESSAGE_COMPRESSION透明压缩（SQLite上较长的内容保存为压缩BLOB）
+    content = Column(CompressedText, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     token_count = Column(Integer, default=0)
+    # 上游提示词前缀缓存命中情况（仅assistant消息，来自usage）
+    prompt_cache_hit_tokens = Column(Integer, nullable=True)
+    prompt_cache_miss_tokens = Column(Integer, nullable=True)
     
     # 关系
     conversation = relationship("Conversation", back_populates="messages")
\ No newline at end of file
@@ -1,7 +1,9 @@
-from .user import User, UserCreate, UserUpdate, Token, TokenData
-from .message import Message, MessageCreate, MessageRole, ChatRequest
+from .user import User, UserCreate, UserUpdate, Token, TokenData, LLMProfileSettings
+from .message import Message, MessageCreate, MessageRole, ChatRequest, MessageResponse, MessagePage, SendMessageResponse
+from .conversation import ConversationResponse, ConversationPage, ConversationDetail, BulkDeleteResponse
 
 __all__ = [
-    "User", "UserCreate", "UserUpdate", "Token", "TokenData",
-    "Message", "MessageCreate", "MessageRole", "ChatRequest"
+    "User", "UserCreate", "UserUpdate", "Token", "TokenData", "LLMProfileSettings",
+    "Message", "MessageCreate", "MessageRole", "ChatRequest", "MessageResponse", "MessagePage", "SendMessageResponse",
+    "ConversationResponse", "ConversationPage", "ConversationDetail", "BulkDeleteResponse"
 ]
\ No newline at end of file
@@ -0,0 +1,39 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+
+from app.schemas.message import MessageResponse
+
+
+class ConversationResponse(BaseModel):
+    """对话响应模型"""
+    id: int
+    user_id: int
+    title: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ConversationPage(BaseModel):
+    """一页对话（按最近活动时间倒序），before/after为翻页游标"""
+    items: List[ConversationResponse]
+    before: Optional[str] = None
+    after: Optional[str] = None
+    has_more: bool
+
+
+class ConversationDetail(ConversationResponse):
+    """对话详情和最新的一页消息，更早的消息通过messages_before游标加载"""
+    messages: List[MessageResponse]
+    messages_before: Optional[str] = None
+    has_more_messages: bool
+
+
+class BulkDeleteResponse(BaseModel):
+    """同步批量删除的结果"""
+    message: str
+    deleted_conversations: int
+    deleted_messages: int
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
 from enum import Enum
-from typing import Optional
+from typing import List, Optional
 
 
 class MessageRole(str, Enum):
@@ -37,6 +37,33 @@ class Message(MessageInDB):
     pass
 
 
+class MessageResponse(BaseModel):
+    """消息响应模型（从ORM对象读取；不校验内容长度，空回答也能返回）"""
+    id: int
+    conversation_id: int
+    role: str
+    content: str
+    created_at: Optional[datetime] = None
+    token_count: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class MessagePage(BaseModel):
+    """一页消息（按时间顺序），before/after为翻页游标"""
+    items: List[MessageResponse]
+    before: Optional[str] = None
+    after: Optional[str] = None
+    has_more: bool
+
+
+class SendMessageResponse(BaseModel):
+    """发送消息（非流式）的响应"""
+    user_message: MessageResponse
+    ai_message: MessageResponse
+
+
 class ChatRequest(BaseModel):
     """聊天请求模型"""
     conversation_id: Optional[int] = None
@@ -1,7 +1,9 @@
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from datetime import datetime
 from typing import Optional
 
+from app.core.config import settings
+
 
 class UserBase(BaseModel):
     """用户基础模型"""
@@ -48,4 +50,35 @@ class Token(BaseModel):
 class TokenData(BaseModel):
     """令牌数据模型"""
     user_id: Optional[int] = None
-    username: Optional[str] = None
\ No newline at end of file
+    username: Optional[str] = None
+
+
+class LLMProfileSettings(BaseModel):
+    """用户设置中的生成参数（settings["llm"]），未设置的字段使用默认值"""
+    model: Optional[str] = None
+    max_tokens: Optional[int] = Field(None, ge=1)
+    temperature: Optional[float] = Field(None, ge=0, le=2)
+    system_prompt: Optional[str] = None
+
+    @field_validator("model")
+    @classmethod
+    def check_model(cls, value: Optional[str]) -> Optional[str]:
+        allowed = [name.strip() for name in settings.LLM_ALLOWED_MODELS.split(",") if name.strip()]
+        allowed = allowed or [settings.DEEPSEEK_MODEL]
+        if value is not None and value not in allowed:
+            raise ValueError(f"不支持的模型，可选: {', '.join(allowed)}")
+        return value
+
+    @field_validator("max_tokens")
+    @classmethod
+    def check_max_tokens(cls, value: Optional[int]) -> Optional[int]:
+        if value is not None and value > settings.LLM_MAX_TOKENS_LIMIT:
+            raise ValueError(f"max_tokens不能超过{settings.LLM_MAX_TOKENS_LIMIT}")
+        return value
+
+    @field_validator("system_prompt")
+    @classmethod
+    def check_system_prompt(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None and len(value) > settings.LLM_SYSTEM_PROMPT_MAX_CHARS:
+            raise ValueError(f"系统提示词不能超过{settings.LLM_SYSTEM_PROMPT_MAX_CHARS}个字符")
+        return value
@@ -0,0 +1,260 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import String, bindparam, delete, func, insert, or_, select, type_coerce, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.database.compression import message_codec
+from app.database.routing import REPLICA_KEY, db_router
+from app.database.session import SessionLocal
+from app.models.archive import ArchivedConversation
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services.history_cache import history_cache
+from app.services.search import search_index
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 归档数据中每条消息保存的列（created_at保存数据库中的原始值，SQLite上为原始文本，
+# 恢复后排序和分页游标不变；PostgreSQL驱动返回的时间转为文本保存）
+_ARCHIVED_COLUMNS = (
+    Message.id, Message.role, Message.content, type_coerce(Message.created_at, String),
+    Message.token_count, Message.prompt_cache_hit_tokens, Message.prompt_cache_miss_tokens,
+)
+
+_messages = Message.__table__
+_RESTORE_VALUES = dict(
+    conversation_id=bindparam("m_conversation_id"),
+    role=bindparam("m_role"),
+    content=bindparam("m_content", type_=_messages.c.content.type),
+    created_at=type_coerce(bindparam("m_created_at"), String),
+    token_count=bindparam("m_token_count"),
+    prompt_cache_hit_tokens=bindparam("m_hit"),
+    prompt_cache_miss_tokens=bindparam("m_miss"),
+)
+_RESTORE_MESSAGES = insert(_messages).values(id=bindparam("m_id"), **_RESTORE_VALUES)
+# 原ID已被其他消息占用时（迁移到AUTOINCREMENT之前复用了ID）分配新ID
+_RESTORE_MESSAGES_NEW_ID = insert(_messages).values(**_RESTORE_VALUES).returning(_messages.c.id)
+
+
+class ArchiveResult(NamedTuple):
+    """一次归档的结果"""
+    conversations: int
+    messages: int
+    original_bytes: int
+    archived_bytes: int
+
+
+class ConversationArchiver:
+    """
+    对话的冷归档
+
+    超过ARCHIVE_IDLE_DAYS天没有新消息的对话，其全部消息序列化后整体压缩（可使用压缩字典），
+    保存为archived_conversations表中的一行，并从messages表中删除；
+    消息保留在全文索引中，仍可以被搜索到。对话本身保留在对话列表中。读取消息或继续对话时在同一请求中恢复，
+    恢复后的对话在ARCHIVE_IDLE_DAYS天内不会再次归档。归档期间新写入的消息不受影响。
+    """
+
+    def __init__(self):
+        self.idle_days = settings.ARCHIVE_IDLE_DAYS
+        self.batch_size = settings.ARCHIVE_BATCH_SIZE
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.archived_conversations = 0
+        self.archived_messages = 0
+        self.original_bytes = 0
+        self.archived_bytes = 0
+        self.restored = 0
+        self.restore_seconds = 0.0
+
+    def idle_conversation_ids(self, db: Session, idle_days: Optional[int] = None,
+                              limit: Optional[int] = None) -> List[int]:
+        """超过idle_days天没有新消息、也没有被恢复过的对话ID（最久未活动的在前）"""
+        cutoff = datetime.utcnow() - timedelta(days=self.idle_days if idle_days is None else idle_days)
+        query = select(Conversation.id).where(
+            Conversation.archived_at.is_(None),
+            Conversation.updated_at < cutoff,
+            or_(Conversation.restored_at.is_(None), Conversation.restored_at < cutoff),
+        ).order_by(Conversation.updated_at, Conversation.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return list(db.execute(query).scalars())
+
+    def archive_conversation(self, db: Session, conversation_id: int) -> ArchiveResult:
+        """归档一个对话的消息（一个事务），对话没有消息时不归档"""
+        rows = db.execute(
+            select(*_ARCHIVED_COLUMNS).where(Message.conversation_id == conversation_id).order_by(Message.id)
+        ).all()
+        if not rows:
+            return ArchiveResult(0, 0, 0, 0)
+        payload = json.dumps([list(row) for row in rows], ensure_ascii=False, separators=(",", ":"),
+                             default=str).encode("utf-8")
+        data = message_codec.compress(payload)
+        original_bytes = sum(len(row[2].encode("utf-8")) for row in rows)
+        try:
+            db.add(ArchivedConversation(conversation_id=conversation_id, message_count=len(rows),
+                                        original_bytes=original_bytes, data=data,
+                                        first_message_id=rows[0][0], last_message_id=rows[-1][0]))
+            # 只删除已归档的消息，读取之后新写入的消息（ID更大）保留
+            db.execute(
+                delete(Message).where(Message.conversation_id == conversation_id, Message.id <= rows[-1][0]),
+                execution_options={"synchronize_session": False}
+            )
+            db.execute(
+                update(Conversation).where(Conversation.id == conversation_id).values(
+                    archived_at=func.now(), updated_at=Conversation.updated_at
+                ),
+                execution_options={"synchronize_session": False}
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        history_cache.invalidate([conversation_id])
+        return ArchiveResult(1, len(rows), original_bytes, len(data))
+
+    def archive_idle(self, db: Session, idle_days: Optional[int] = None, limit: Optional[int] = None) -> ArchiveResult:
+        """
+        归档长期未活动的对话
+
+        Args:
+            db: 数据库会话
+            idle_days: 未活动天数，默认为ARCHIVE_IDLE_DAYS
+            limit: 最多归档的对话数
+
+        Returns:
+            归档的对话数、消息数、归档前后的字节数
+        """
+        conversations = messages = original_bytes = archived_bytes = 0
+        ids = self.idle_conversation_ids(db, idle_days, limit)
+        for i in range(0, len(ids), self.batch_size):
+            for conversation_id in ids[i:i + self.batch_size]:
+                result = self.archive_conversation(db, conversation_id)
+                conversations += result.conversations
+                messages += result.messages
+                original_bytes += result.original_bytes
+                archived_bytes += result.archived_bytes
+            logger.info(f"归档进度: {min(i + self.batch_size, len(ids))}/{len(ids)}")
+        with self._lock:
+            self.archived_conversations += conversations
+            self.archived_messages += messages
+            self.original_bytes += original_bytes
+            self.archived_bytes += archived_bytes
+        return ArchiveResult(conversations, messages, original_bytes, archived_bytes)
+
+    def restore(self, db: Session, conversation_id: int) -> bool:
+        """
+        恢复归档的对话消息（一个事务）
+
+        先删除归档行再写回消息，并发恢复同一个对话时只有一个请求写回。
+        消息按原ID写回；原ID已被其他消息占用时（迁移到AUTOINCREMENT之前ID会被复用）分配新ID。
+
+        Returns:
+            是否恢复了消息
+        """
+        start = time.perf_counter()
+        archive = ArchivedConversation.__table__
+        try:
+            data = db.execute(
+                delete(archive).where(archive.c.conversation_id == conversation_id).returning(archive.c.data)
+            ).scalar()
+            if data is not None:
+                rows = json.loads(message_codec.decompress(data))
+                taken = set(db.execute(
+                    select(Message.id).where(Message.id.between(rows[0][0], rows[-1][0]))
+                ).scalars()) if rows else set()
+                params = [
+                    {"m_id": row[0], "m_conversation_id": conversation_id, "m_role": row[1], "m_content": row[2],
+                     "m_created_at": row[3], "m_token_count": row[4], "m_hit": row[5], "m_miss": row[6]}
+                    for row in rows
+                ]
+                restored = [p for p in params if p["m_id"] not in taken]
+                if restored:
+                    db.execute(_RESTORE_MESSAGES, restored)
+                for p in params:
+                    if p["m_id"] in taken:
+                        p["m_id"] = db.execute(_RESTORE_MESSAGES_NEW_ID, p).scalar()
+                if taken:
+                    logger.warning(f"恢复归档对话时消息ID已被占用，分配了新ID: conversation_id={conversation_id}")
+                user_id = db.query(Conversation.user_id).filter(Conversation.id == conversation_id).scalar()
+                # 归档的消息仍在索引中，只有分配了新ID的消息需要写入
+                search_index.index_messages(db, [(p["m_id"], conversation_id, user_id, p["m_content"]) for p in params],
+                                            skip_indexed=True)
+            db.execute(
+                update(Conversation).where(Conversation.id == conversation_id).values(
+                    archived_at=None, restored_at=func.now(), updated_at=Conversation.updated_at
+                ),
+                execution_options={"synchronize_session": False}
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        history_cache.invalidate([conversation_id])
+        if data is None:
+            return False
+        with self._lock:
+            self.restored += 1
+            self.restore_seconds += time.perf_counter() - start
+        logger.info(f"已恢复归档对话: conversation_id={conversation_id}, messages={len(rows)}")
+        return True
+
+    def ensure_restored(self, db: Session, conversation_id: int) -> bool:
+        """
+        读取对话消息之前调用：对话已归档时恢复
+
+        db可能连接只读副本，恢复使用单独的主库会话。
+
+        Returns:
+            是否恢复了消息（刚恢复的消息应从主库读取）
+        """
+        archived_at = db.query(Conversation.archived_at).filter(Conversation.id == conversation_id).scalar()
+        if archived_at is None:
+            return False
+        with SessionLocal() as primary:
+            return self.restore(primary, conversation_id)
+
+    async def aensure_restored(self, db: AsyncSession, conversation_id: int) -> bool:
+        """
+        异步读取对话消息之前调用：对话已归档时恢复
+
+        db连接主库时直接在db上恢复（恢复时提交事务，之后在db上的读取和写入都能看到恢复的消息）；
+        db连接只读副本时使用单独的主库会话恢复。
+
+        Returns:
+            是否恢复了消息（db连接只读副本时，刚恢复的消息应从主库读取）
+        """
+        archived_at = (await db.execute(
+            select(Conversation.archived_at).where(Conversation.id == conversation_id)
+        )).scalar()
+        if archived_at is None:
+            return False
+        if db.info.get(REPLICA_KEY) is None:
+            return await db.run_sync(self.restore, conversation_id)
+        async with db_router.session() as primary:
+            return await primary.run_sync(self.restore, conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """冷归档统计信息"""
+        return {
+            "idle_days": self.idle_days,
+            "archived_conversations": self.archived_conversations,
+            "archived_messages": self.archived_messages,
+            "archive_ratio": round(self.archived_bytes / self.original_bytes, 3) if self.original_bytes else None,
+            "restored": self.restored,
+            "avg_restore_ms": round(self.restore_seconds / self.restored * 1000, 3) if self.restored else 0.0,
+        }
+
+
+# 创建冷归档实例
+conversation_archiver = ConversationArchiver()
+metrics.register("archive", conversation_archiver.stats)
@@ -0,0 +1,233 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.database.session import SessionLocal
+from app.models.archive import ArchivedConversation
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services.history_cache import history_cache
+from app.services.search import search_index
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 保留的已结束后台任务数量
+MAX_FINISHED_JOBS = 100
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class DeleteResult(NamedTuple):
+    """删除结果（实际删除的行数）"""
+    conversations: int
+    messages: int
+
+
+class DeleteJob:
+    """后台删除任务"""
+
+    def __init__(self, user_id: int, conversation_ids: List[int]):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.conversation_ids = conversation_ids
+        self.status = JOB_PENDING
+        self.deleted_conversations = 0
+        self.deleted_messages = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total_conversations": len(self.conversation_ids),
+            "deleted_conversations": self.deleted_conversations,
+            "deleted_messages": self.deleted_messages,
+            "error": self.error,
+        }
+
+
+def _chunks(ids: Sequence[int], size: int):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+class BulkDeleter:
+    """
+    基于集合的对话批量删除
+
+    不加载ORM对象（避免级联逐条加载并删除消息），按块执行
+    DELETE ... WHERE conversation_id IN (...)：每块对话的消息、全文索引和对话本身在同一个事务中删除，
+    单个对话要么完整保留要么完整删除，事务和写锁的持有时间受块大小限制。
+    消息很多时可以提交到后台线程执行，通过任务ID查询进度和删除数量。
+    """
+
+    def __init__(self):
+        self.chunk_size = settings.BULK_DELETE_CHUNK_SIZE
+        self.background_threshold = settings.BULK_DELETE_BACKGROUND_THRESHOLD
+        # 后台任务串行执行，避免多个大删除同时争用写锁
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-delete")
+        self._jobs: "OrderedDict[str, DeleteJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.deleted_conversations = 0
+        self.deleted_messages = 0
+        self.statements = 0
+        self.background_jobs = 0
+        self.failed_jobs = 0
+        self.total_seconds = 0.0
+
+    def owned_ids(self, db: Session, user_id: int, conversation_ids: Optional[Sequence[int]] = None) -> List[int]:
+        """
+        筛选出属于用户的对话ID
+
+        Args:
+            db: 数据库会话
+            user_id: 用户ID
+            conversation_ids: 要删除的对话ID，None表示用户的全部对话
+        """
+        query = select(Conversation.id).where(Conversation.user_id == user_id)
+        if conversation_ids is None:
+            return list(db.execute(query).scalars())
+        owned: List[int] = []
+        for chunk in _chunks(sorted(set(conversation_ids)), self.chunk_size):
+            owned.extend(db.execute(query.where(Conversation.id.in_(chunk))).scalars())
+        return owned
+
+    def count_messages(self, db: Session, conversation_ids: Sequence[int]) -> int:
+        """统计这些对话的消息总数（走conversation_id索引）"""
+        total = 0
+        for chunk in _chunks(conversation_ids, self.chunk_size):
+            total += db.execute(
+                select(func.count()).select_from(Message).where(Message.conversation_id.in_(chunk))
+            ).scalar()
+        return total
+
+    def should_run_in_background(self, db: Session, conversation_ids: Sequence[int]) -> bool:
+        """消息数超过BULK_DELETE_BACKGROUND_THRESHOLD时在后台删除"""
+        return bool(conversation_ids) and self.count_messages(db, conversation_ids) > self.background_threshold
+
+    def delete(self, db: Session, user_id: int, conversation_ids: Sequence[int],
+               job: Optional[DeleteJob] = None) -> DeleteResult:
+        """
+        按块删除对话及其消息
+
+        Args:
+            db: 数据库会话
+            user_id: 用户ID（删除对话时再次校验归属）
+            conversation_ids: 要删除的对话ID（通常来自owned_ids）
+            job: 后台任务，每块提交后更新其进度
+
+        Returns:
+            实际删除的对话数和消息数
+        """
+        start = time.perf_counter()
+        conversations = messages = 0
+        for chunk in _chunks(conversation_ids, self.chunk_size):
+            try:
+                search_index.remove_conversations(db, chunk)
+                deleted_messages = db.execute(
+                    delete(Message).where(Message.conversation_id.in_(chunk)),
+                    execution_options={"synchronize_session": False}
+                ).rowcount
+                db.execute(
+                    delete(ArchivedConversation).where(ArchivedConversation.conversation_id.in_(chunk)),
+                    execution_options={"synchronize_session": False}
+                )
+                deleted_conversations = db.execute(
+                    delete(Conversation).where(Conversation.id.in_(chunk), Conversation.user_id == user_id),
+                    execution_options={"synchronize_session": False}
+                ).rowcount
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            history_cache.invalidate(chunk)
+            conversations += deleted_conversations
+            messages += deleted_messages
+            if job is not None:
+                job.deleted_conversations = conversations
+                job.deleted_messages = messages
+
+        with self._lock:
+            self.deleted_conversations += conversations
+            self.deleted_messages += messages
+            self.statements += 3 * ((len(conversation_ids) + self.chunk_size - 1) // self.chunk_size)
+            self.total_seconds += time.perf_counter() - start
+        return DeleteResult(conversations, messages)
+
+    def submit(self, user_id: int, conversation_ids: List[int]) -> DeleteJob:
+        """提交后台删除任务"""
+        job = DeleteJob(user_id, conversation_ids)
+        with self._lock:
+            self._jobs[job.id] = job
+            self.background_jobs += 1
+            self._prune()
+        self._executor.submit(self._run, job)
+        logger.info(f"已提交后台删除任务: job_id={job.id}, user_id={user_id}, conversations={len(conversation_ids)}")
+        return job
+
+    def _run(self, job: DeleteJob) -> None:
+        job.status = JOB_RUNNING
+        db = SessionLocal()
+        try:
+            self.delete(db, job.user_id, job.conversation_ids, job)
+            job.status = JOB_DONE
+            logger.info(f"后台删除任务完成: job_id={job.id}, conversations={job.deleted_conversations}, "
+                        f"messages={job.deleted_messages}")
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+            with self._lock:
+                self.failed_jobs += 1
+            logger.error(f"后台删除任务失败: job_id={job.id}, error={str(e)}")
+        finally:
+            job.finished_at = time.time()
+            db.close()
+
+    def _prune(self) -> None:
+        """在锁内调用：只保留最近的MAX_FINISHED_JOBS个已结束任务"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+
+    def get_job(self, job_id: str, user_id: int) -> Optional[DeleteJob]:
+        """获取用户的后台删除任务"""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        """批量删除统计信息"""
+        return {
+            "chunk_size": self.chunk_size,
+            "background_threshold": self.background_threshold,
+            "deleted_conversations": self.deleted_conversations,
+            "deleted_messages": self.deleted_messages,
+            "statements": self.statements,
+            "background_jobs": self.background_jobs,
+            "running_jobs": sum(1 for job in list(self._jobs.values()) if job.status in (JOB_PENDING, JOB_RUNNING)),
+            "failed_jobs": self.failed_jobs,
+            "total_seconds": round(self.total_seconds, 3),
+        }
+
+
+# 创建批量删除实例
+bulk_deleter = BulkDeleter()
+metrics.register("bulk_delete", bulk_deleter.stats)
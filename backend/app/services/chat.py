@@ -1,10 +1,23 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Union
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
+from app.database.routing import REPLICA_KEY, db_router
+from app.database.session import SessionLocal
 from app.models.conversation import Conversation
 from app.models.message import Message
-from app.services.llm_service import LLMService
-# # import tiktoken  # 暂时注释掉，避免安装问题  # 暂时注释掉，避免安装问题
+from app.services.archive import conversation_archiver
+from app.services.bulk_delete import DeleteJob, DeleteResult, bulk_deleter
+from app.services.context_builder import context_builder
+from app.services.history_cache import history_cache
+from app.services.llm_profile import LLMProfile
+from app.services.llm_service import LLMUnavailable, llm_service
+from app.services.message_writer import message_writer
+from app.services.pagination import Page, keyset_paginate, page_size
+from app.services.search import search_index
+from app.services.token_counter import token_counter
 
 class ChatService:
     """对话服务类"""
@@ -19,9 +32,35 @@ class ChatService:
         return db_conversation
     
     @staticmethod
-    def get_conversations(db: Session, user_id: int) -> List[Conversation]:
-        """获取用户的所有对话"""
-        return db.query(Conversation).filter(Conversation.user_id == user_id).order_by(Conversation.updated_at.desc()).all()
+    async def acreate_conversation(db: AsyncSession, user_id: int, title: str) -> Conversation:
+        """异步创建新对话"""
+        return await db.run_sync(ChatService.create_conversation, user_id, title)
+    
+    @staticmethod
+    def get_conversations(db: Session, user_id: int, limit: Optional[int] = None,
+                          before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        """
+        分页获取用户的对话，按最近活动时间倒序
+        
+        Args:
+            db: 数据库会话
+            user_id: 用户ID
+            limit: 每页条数，默认为CONVERSATION_PAGE_SIZE，不超过PAGE_SIZE_MAX
+            before: 游标，返回排在它之后（更早活动）的对话
+            after: 游标，返回排在它之前（更近活动）的对话
+            
+        Returns:
+            一页对话，按最近活动时间倒序
+        """
+        query = db.query(Conversation).filter(Conversation.user_id == user_id)
+        return keyset_paginate(query, (Conversation.updated_at, Conversation.id),
+                               page_size(limit, settings.CONVERSATION_PAGE_SIZE), before, after)
+    
+    @staticmethod
+    async def aget_conversations(db: AsyncSession, user_id: int, limit: Optional[int] = None,
+                                 before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        """异步分页获取用户的对话"""
+        return await db.run_sync(ChatService.get_conversations, user_id, limit, before, after)
     
     @staticmethod
     def get_conversation(db: Session, conversation_id: int, user_id: int) -> Optional[Conversation]:
@@ -32,116 +71,226 @@ class ChatService:
         ).first()
     
     @staticmethod
-    def delete_conversation(db: Session, conversation_id: int, user_id: int) -> bool:
-        """删除对话"""
-        conversation = db.query(Conversation).filter(
+    async def aget_conversation(db: AsyncSession, conversation_id: int, user_id: int) -> Optional[Conversation]:
+        """异步获取对话详情"""
+        result = await db.execute(select(Conversation).where(
             Conversation.id == conversation_id,
             Conversation.user_id == user_id
-        ).first()
-        if conversation:
-            db.delete(conversation)
-            db.commit()
-            return True
-        return False
+        ))
+        return result.scalars().first()
+    
+    @staticmethod
+    def is_conversation_owner(db: Session, conversation_id: int, user_id: int) -> bool:
+        """
+        检查对话是否属于指定用户
+
+        每次按主键查询，不使用进程内缓存：其他进程删除的对话不会被当作仍然存在。
+        写入消息前应传入主库会话（写会话），不受只读副本复制延迟影响。
+        """
+        return db.execute(
+            select(Conversation.user_id).where(Conversation.id == conversation_id)
+        ).scalar() == user_id
+    
+    @staticmethod
+    async def ais_conversation_owner(db: AsyncSession, conversation_id: int, user_id: int) -> bool:
+        """异步检查对话是否属于指定用户"""
+        return (await db.execute(
+            select(Conversation.user_id).where(Conversation.id == conversation_id)
+        )).scalar() == user_id
+    
+    @staticmethod
+    def delete_conversation(db: Session, conversation_id: int, user_id: int) -> bool:
+        """删除对话"""
+        return bulk_deleter.delete(db, user_id, [conversation_id]).conversations > 0
+    
+    @staticmethod
+    async def adelete_conversation(db: AsyncSession, conversation_id: int, user_id: int) -> bool:
+        """异步删除对话"""
+        return await db.run_sync(ChatService.delete_conversation, conversation_id, user_id)
+    
+    @staticmethod
+    def delete_conversations(db: Session, user_id: int, conversation_ids: Optional[List[int]] = None,
+                             background: Optional[bool] = None) -> Union[DeleteResult, DeleteJob]:
+        """
+        批量删除对话及其消息（基于集合的分块删除，不加载ORM对象）
+        
+        Args:
+            db: 数据库会话
+            user_id: 用户ID
+            conversation_ids: 要删除的对话ID，None表示用户的全部对话
+            background: 是否在后台删除，None表示消息数超过BULK_DELETE_BACKGROUND_THRESHOLD时在后台删除
+            
+        Returns:
+            同步删除时返回删除结果，后台删除时返回后台任务
+        """
+        owned_ids = bulk_deleter.owned_ids(db, user_id, conversation_ids)
+        if background is None:
+            background = bulk_deleter.should_run_in_background(db, owned_ids)
+        if background and owned_ids:
+            return bulk_deleter.submit(user_id, owned_ids)
+        return bulk_deleter.delete(db, user_id, owned_ids)
+    
+    @staticmethod
+    async def adelete_conversations(db: AsyncSession, user_id: int, conversation_ids: Optional[List[int]] = None,
+                                    background: Optional[bool] = None) -> Union[DeleteResult, DeleteJob]:
+        """异步批量删除对话及其消息"""
+        return await db.run_sync(ChatService.delete_conversations, user_id, conversation_ids, background)
     
     @staticmethod
     def delete_all_conversations(db: Session, user_id: int) -> int:
         """删除用户的所有对话"""
-        conversations = db.query(Conversation).filter(
-            Conversation.user_id == user_id
-        ).all()
-        
-        deleted_count = len(conversations)
-        
-        for conversation in conversations:
-            db.delete(conversation)
-        
-        db.commit()
-        return deleted_count
+        return ChatService.delete_conversations(db, user_id, background=False).conversations
     
     @staticmethod
     def delete_conversations_by_ids(db: Session, conversation_ids: List[int], user_id: int) -> int:
         """批量删除指定ID的对话"""
-        conversations = db.query(Conversation).filter(
-            Conversation.id.in_(conversation_ids),
-            Conversation.user_id == user_id
-        ).all()
-        
-        deleted_count = len(conversations)
-        
-        for conversation in conversations:
-            db.delete(conversation)
-        
-        db.commit()
-        return deleted_count
+        return ChatService.delete_conversations(db, user_id, conversation_ids, background=False).conversations
     
     @staticmethod
-    def add_message(db: Session, conversation_id: int, role: str, content: str) -> Message:
-        """添加消息"""
-        # 暂时不计算token数量，避免tiktoken安装问题
-        # encoding = tiktoken.get_encoding("cl100k_base")
-        # token_count = len(encoding.encode(content))
+    def add_message(db: Session, conversation_id: int, role: str, content: str, usage: Optional[Dict[str, int]] = None,
+                    token_count: Optional[int] = None) -> Message:
+        """
+        添加消息
+        
+        usage为生成该回答的上游usage，其中的提示词前缀缓存命中情况
+        记录到消息上，并累加到对话上。token_count为已计算好的token数，为None时现场计算。
+        启用MESSAGE_WRITER_ENABLED时消息交给写入线程与其他请求的消息合并提交。
+        """
+        token_count = token_counter.count(content) if token_count is None else token_count
+        if message_writer.enabled:
+            # 先结束会话中的事务，避免和写入线程争用写锁
+            db.commit()
+            return message_writer.write(conversation_id, role, content, token_count, usage).result()
         
         db_message = Message(
             conversation_id=conversation_id,
             role=role,
             content=content,
-            token_count=0  # 暂时设为0
+            token_count=token_count
         )
+        # 更新对话的最近活动时间（对话列表按它排序）
+        values: Dict[Any, Any] = {Conversation.updated_at: func.now()}
+        if usage:
+            db_message.prompt_cache_hit_tokens = usage["prompt_cache_hit_tokens"]
+            db_message.prompt_cache_miss_tokens = usage["prompt_cache_miss_tokens"]
+            values[Conversation.prompt_cache_hit_tokens] = Conversation.prompt_cache_hit_tokens + usage["prompt_cache_hit_tokens"]
+            values[Conversation.prompt_cache_miss_tokens] = Conversation.prompt_cache_miss_tokens + usage["prompt_cache_miss_tokens"]
+        db.query(Conversation).filter(Conversation.id == conversation_id).update(values, synchronize_session=False)
         db.add(db_message)
+        if search_index.available(db):
+            db.flush()
+            user_id = db.query(Conversation.user_id).filter(Conversation.id == conversation_id).scalar()
+            search_index.index_messages(db, [(db_message.id, conversation_id, user_id, content)])
         db.commit()
         db.refresh(db_message)
+        # 写穿到对话历史缓存
+        history_cache.append(conversation_id, db_message)
         return db_message
     
     @staticmethod
-    def generate_answer(db: Session, conversation_id: int, user_message: str) -> str:
-        """使用LLM服务生成回答"""
-        # 获取对话历史
-        conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-        if not conversation:
+    async def aadd_message(db: AsyncSession, conversation_id: int, role: str, content: str,
+                           usage: Optional[Dict[str, int]] = None) -> Message:
+        """异步添加消息（token计数在线程池中执行，不阻塞事件循环）"""
+        token_count = await token_counter.acount(content)
+        if message_writer.enabled:
+            await db.commit()
+            return await message_writer.awrite(conversation_id, role, content, token_count, usage)
+        return await db.run_sync(ChatService.add_message, conversation_id, role, content, usage, token_count)
+    
+    @staticmethod
+    def build_llm_messages(db: Session, conversation_id: int, user_message: str,
+                           profile: Optional[LLMProfile] = None) -> List[Dict[str, Any]]:
+        """构建发送给LLM的上下文消息列表（按token预算选取历史消息，优先读取对话历史缓存）"""
+        if not history_cache.contains(conversation_id):
+            conversation_archiver.ensure_restored(db, conversation_id)
+        return ChatService._build_llm_messages(db, conversation_id, user_message, profile)
+    
+    @staticmethod
+    def _build_llm_messages(db: Session, conversation_id: int, user_message: str,
+                            profile: Optional[LLMProfile]) -> List[Dict[str, Any]]:
+        window = history_cache.get_window(db, conversation_id)
+        if window is None:
             raise ValueError("Conversation not found")
         
-        # 获取历史消息（最近的一些消息作为上下文）
-        # 为了避免上下文过长，只获取最近的20条消息
-        history_messages = db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.created_at.desc()).limit(20).all()
-        
-        # 反转列表，使消息按时间顺序排列
-        history_messages.reverse()
-        
-        # 构建消息列表
-        messages = []
-        for msg in history_messages:
-            messages.append({"role": msg.role, "content": msg.content})
-        
-        # 添加最新用户消息（如果尚未在历史消息中）
-        # 避免重复添加用户消息
-        if not history_messages or history_messages[-1].role != 'user' or history_messages[-1].content != user_message:
-            messages.append({"role": "user", "content": user_message})
+        history = history_cache.iter_newest_first(db, conversation_id, window)
+        system_prompt = profile.system_prompt if profile is not None else None
+        messages, window.anchor_id = context_builder.build(history, user_message, window.anchor_id, system_prompt)
+        return messages
+    
+    @staticmethod
+    async def abuild_llm_messages(db: AsyncSession, conversation_id: int, user_message: str,
+                                  profile: Optional[LLMProfile] = None) -> List[Dict[str, Any]]:
+        """异步构建发送给LLM的上下文消息列表（归档的对话先在事件循环中恢复，不阻塞）"""
+        if not history_cache.contains(conversation_id):
+            await conversation_archiver.aensure_restored(db, conversation_id)
+        return await db.run_sync(ChatService._build_llm_messages, conversation_id, user_message, profile)
+    
+    @staticmethod
+    def generate_answer(db: Session, conversation_id: int, user_message: str, usage: Optional[Dict[str, int]] = None,
+                        profile: Optional[LLMProfile] = None) -> str:
+        """使用LLM服务生成回答（profile为用户的生成参数，默认使用配置中的默认值）"""
+        messages = ChatService.build_llm_messages(db, conversation_id, user_message, profile)
         
-        # 使用LLM服务生成回答
-        llm_service = LLMService()
+        # 使用共享的LLM服务生成回答（复用上游连接池）
         try:
             # 使用LLM服务的generate_response方法
-            response_text = llm_service.generate_response(messages)
+            response_text = llm_service.generate_response(messages, usage, profile)
             return response_text
+        except LLMUnavailable:
+            raise
+        except Exception as e:
+            raise Exception(f"LLM服务调用失败: {str(e)}")
+    
+    @staticmethod
+    async def agenerate_answer(db: AsyncSession, conversation_id: int, user_message: str, usage: Optional[Dict[str, int]] = None,
+                               profile: Optional[LLMProfile] = None) -> str:
+        """使用LLM服务异步生成回答"""
+        messages = await ChatService.abuild_llm_messages(db, conversation_id, user_message, profile)
+        
+        try:
+            return await llm_service.agenerate_response(messages, usage, profile)
+        except LLMUnavailable:
+            raise
         except Exception as e:
             raise Exception(f"LLM服务调用失败: {str(e)}")
     
     @staticmethod
-    def get_conversation_messages(db: Session, conversation_id: int, limit: int = 50) -> List[Message]:
+    def get_conversation_messages(db: Session, conversation_id: int, limit: Optional[int] = None,
+                                  before: Optional[str] = None, after: Optional[str] = None) -> Page:
         """
-        获取对话的消息历史
+        分页获取对话的消息历史
         
         Args:
             db: 数据库会话
             conversation_id: 对话ID
-            limit: 限制返回消息数量
+            limit: 每页条数，默认为MESSAGE_PAGE_SIZE，不超过PAGE_SIZE_MAX
+            before: 游标，返回更早的消息；不传before和after时返回最新的一页
+            after: 游标，返回更新的消息
             
         Returns:
-            消息列表
+            一页消息，按时间顺序排列
         """
-        return db.query(Message).filter(
-            Message.conversation_id == conversation_id
-        ).order_by(Message.created_at.desc()).limit(limit).all()
\ No newline at end of file
+        if conversation_archiver.ensure_restored(db, conversation_id):
+            # 刚恢复的消息可能还没有复制到只读副本，这一次从主库读取
+            with SessionLocal() as primary:
+                return ChatService._message_page(primary, conversation_id, limit, before, after)
+        return ChatService._message_page(db, conversation_id, limit, before, after)
+    
+    @staticmethod
+    def _message_page(db: Session, conversation_id: int, limit: Optional[int],
+                      before: Optional[str], after: Optional[str]) -> Page:
+        query = db.query(Message).filter(Message.conversation_id == conversation_id)
+        page = keyset_paginate(query, (Message.created_at, Message.id),
+                               page_size(limit, settings.MESSAGE_PAGE_SIZE), before, after)
+        page.items.reverse()
+        return page
+    
+    @staticmethod
+    async def aget_conversation_messages(db: AsyncSession, conversation_id: int, limit: Optional[int] = None,
+                                         before: Optional[str] = None, after: Optional[str] = None) -> Page:
+        """异步分页获取对话的消息历史（归档的对话先恢复，恢复不阻塞事件循环）"""
+        if await conversation_archiver.aensure_restored(db, conversation_id) and db.info.get(REPLICA_KEY) is not None:
+            # 刚恢复的消息可能还没有复制到只读副本，这一次从主库读取
+            async with db_router.session() as primary:
+                return await primary.run_sync(ChatService._message_page, conversation_id, limit, before, after)
+        return await db.run_sync(ChatService._message_page, conversation_id, limit, before, after)
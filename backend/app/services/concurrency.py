@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from app.core.config import settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 请求结果，用于调整并发上限
+OUTCOME_SUCCESS = "success"
+OUTCOME_OVERLOAD = "overload"
+OUTCOME_ERROR = "error"
+
+# 服务时间的指数滑动平均系数
+_EWMA_ALPHA = 0.2
+
+
+class UpstreamOverloaded(Exception):
+    """上游并发额度已满且无法在期限内获得额度，请求被拒绝"""
+
+
+class _Waiter:
+    """排队等待并发额度的请求（同步请求使用event，异步请求使用future）"""
+
+    __slots__ = ("granted", "event", "loop", "future")
+
+    def __init__(self, event: Optional[threading.Event] = None, loop: Optional[asyncio.AbstractEventLoop] = None,
+                 future: Optional["asyncio.Future"] = None):
+        self.granted = False
+        self.event = event
+        self.loop = loop
+        self.future = future
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: "asyncio.Future") -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """
+    上游调用的自适应并发限制（AIMD）
+
+    每次成功调用使上限加性增长（每个上限窗口约+1），上游返回429/503或超时时
+    上限乘性下降；同一批过载信号在一个平均服务时间内只下降一次。
+    超出上限的请求进入有界队列，按先来先服务获得额度；队列已满，
+    或按队列长度和平均服务时间估算的等待时间超过请求的期限时，直接拒绝。
+    同步和异步调用方共享同一个额度。
+    """
+
+    def __init__(self):
+        self.min_limit = settings.LLM_LIMIT_MIN
+        self.max_limit = settings.LLM_LIMIT_MAX
+        self.max_queue = settings.LLM_LIMIT_QUEUE_SIZE
+        self.queue_timeout = settings.LLM_LIMIT_QUEUE_TIMEOUT
+        self.decrease_ratio = settings.LLM_LIMIT_DECREASE_RATIO
+        self._limit = float(min(max(settings.LLM_LIMIT_INITIAL, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        self._service_time = 1.0
+        self._last_decrease = 0.0
+
+        # 统计计数
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.decreases = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _admit(self, deadline: float) -> Optional[_Waiter]:
+        """在锁内调用：有额度时直接占用并返回None，否则检查能否排队"""
+        if self._in_flight < self.limit and not self._waiters:
+            self._in_flight += 1
+            self.admitted += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise UpstreamOverloaded(f"上游请求队列已满: queue={len(self._waiters)}")
+        # 估算排到本请求需要的时间，超过期限就不必排队
+        expected_wait = (len(self._waiters) + 1) / max(self.limit, 1) * self._service_time
+        if expected_wait > deadline - time.monotonic():
+            self.rejected += 1
+            raise UpstreamOverloaded(f"预计等待时间超过期限: expected_wait={expected_wait:.1f}s")
+        self.queued += 1
+        return _Waiter()
+
+    def _give_up(self, waiter: _Waiter) -> bool:
+        """等待超时或被取消时调用，返回True表示在此之前已获得额度"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self.timeouts += 1
+            self.rejected += 1
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """
+        同步获取一个并发额度
+
+        Args:
+            timeout: 最长等待时间，默认为LLM_LIMIT_QUEUE_TIMEOUT
+
+        Returns:
+            获得额度的时间（time.monotonic），释放时传回
+        """
+        deadline = time.monotonic() + (self.queue_timeout if timeout is None else timeout)
+        with self._lock:
+            waiter = self._admit(deadline)
+            if waiter is None:
+                return time.monotonic()
+            waiter.event = threading.Event()
+            self._waiters.append(waiter)
+
+        waiter.event.wait(max(deadline - time.monotonic(), 0))
+        if not self._give_up(waiter):
+            raise UpstreamOverloaded("等待上游并发额度超时")
+        return time.monotonic()
+
+    async def aacquire(self, timeout: Optional[float] = None) -> float:
+        """异步获取一个并发额度，等待期间不阻塞事件循环"""
+        deadline = time.monotonic() + (self.queue_timeout if timeout is None else timeout)
+        with self._lock:
+            waiter = self._admit(deadline)
+            if waiter is None:
+                return time.monotonic()
+            waiter.loop = asyncio.get_running_loop()
+            waiter.future = waiter.loop.create_future()
+            self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            if not self._give_up(waiter):
+                raise UpstreamOverloaded("等待上游并发额度超时")
+        except asyncio.CancelledError:
+            # 调用方被取消：已获得的额度要归还
+            if self._give_up(waiter):
+                self.release(None)
+            raise
+        return time.monotonic()
+
+    def release(self, outcome: Optional[str], started_at: Optional[float] = None) -> None:
+        """
+        释放额度并根据请求结果调整上限
+
+        Args:
+            outcome: OUTCOME_SUCCESS/OUTCOME_OVERLOAD/OUTCOME_ERROR，None表示不参与调整
+            started_at: acquire返回的时间，用于估算平均服务时间
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            if outcome == OUTCOME_SUCCESS:
+                if started_at is not None:
+                    self._service_time += _EWMA_ALPHA * ((now - started_at) - self._service_time)
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            elif outcome == OUTCOME_OVERLOAD and now - self._last_decrease > self._service_time:
+                self._limit = max(self.min_limit, self._limit * self.decrease_ratio)
+                self._last_decrease = now
+                self.decreases += 1
+                logger.warning(f"上游过载，并发上限降为: {self.limit}")
+
+            # 按先来先服务把空出的额度交给排队的请求
+            while self._waiters and self._in_flight < self.limit:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                self._in_flight += 1
+                self.admitted += 1
+                waiter.wake()
+
+    def stats(self) -> Dict[str, Any]:
+        """并发限制统计信息"""
+        return {
+            "limit": self.limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self._in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "avg_service_seconds": round(self._service_time, 3),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "decreases": self.decreases,
+        }
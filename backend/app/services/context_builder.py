@@ -0,0 +1,136 @@
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.token_counter import token_counter
+from app.utils import generate_system_prompt
+
+
+class ContextBuilder:
+    """
+    按token预算组装发送给LLM的上下文
+
+    从最新的消息往前取历史，直到累计token数（含系统提示词）达到预算或条数达到上限。
+    token数优先使用消息表中保存的token_count，缺失时现场计算。
+    最新的一条消息总会被保留，即使它本身已超出预算。
+
+    为了让相邻轮次的提示词前缀保持一致（命中上游的前缀缓存），上下文的起点（锚点）
+    不随每轮对话滑动：只要锚点之后的消息仍在预算内就从锚点开始；超出预算时
+    一次性把起点向后移动，只保留retain_ratio比例的预算，为之后的多轮对话留出余量。
+    """
+
+    def __init__(self):
+        self.token_budget = settings.LLM_CONTEXT_TOKEN_BUDGET
+        self.max_messages = settings.LLM_CONTEXT_MAX_MESSAGES
+        self.retain_ratio = settings.LLM_CONTEXT_RETAIN_RATIO
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.builds = 0
+        self.truncated = 0
+        self.anchor_moves = 0
+        self.total_tokens = 0
+        self.total_messages = 0
+        self.total_build_seconds = 0.0
+        self.max_tokens_seen = 0
+        self.last_tokens = 0
+        self.last_messages = 0
+        self.last_build_ms = 0.0
+
+    def build(self, history: Iterable[Any], user_message: str, anchor_id: Optional[int] = None,
+              system_prompt: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        构建上下文消息列表（不含系统提示词，由LLMService添加）
+
+        Args:
+            history: 按时间倒序的历史消息，元素需有id、role、content和token_count属性
+            user_message: 本轮用户消息
+            anchor_id: 上一轮上下文起点的消息ID，None表示从对话开头开始
+            system_prompt: 本轮使用的系统提示词（计入预算），默认为generate_system_prompt()
+
+        Returns:
+            (按时间顺序排列的消息列表, 本轮上下文起点的消息ID)
+        """
+        start = time.perf_counter()
+        system_tokens = token_counter.count(system_prompt if system_prompt is not None else generate_system_prompt())
+        budget = self.token_budget - system_tokens
+
+        # 按时间倒序收集(消息, token数)
+        collected: List[Tuple[Any, int]] = []
+        used = 0
+        truncated = False
+        overflow = False
+        for row in history:
+            if anchor_id is not None and row.id < anchor_id:
+                # 锚点之后的消息都在预算内，保持起点不变
+                truncated = True
+                break
+            tokens = row.token_count or token_counter.count(row.content)
+            if collected and (used + tokens > budget or len(collected) >= self.max_messages):
+                truncated = overflow = True
+                break
+            collected.append((row, tokens))
+            used += tokens
+
+        if overflow:
+            # 超出预算，起点一次性后移，只保留部分预算
+            keep = 0
+            kept_tokens = 0
+            for _, tokens in collected:
+                if keep and (kept_tokens + tokens > budget * self.retain_ratio or keep >= self.max_messages * self.retain_ratio):
+                    break
+                keep += 1
+                kept_tokens += tokens
+            collected = collected[:keep]
+            used = kept_tokens
+            anchor_id = collected[-1][0].id
+            self.anchor_moves += 1
+
+        # 反转列表，使消息按时间顺序排列
+        selected = [{"role": row.role, "content": row.content} for row, _ in reversed(collected)]
+
+        # 添加最新用户消息（如果尚未在历史消息中）
+        if not selected or selected[-1]["role"] != "user" or selected[-1]["content"] != user_message:
+            selected.append({"role": "user", "content": user_message})
+            used += token_counter.count(user_message)
+
+        self._record(system_tokens + used, len(selected), truncated, time.perf_counter() - start)
+        return selected, anchor_id
+
+    def _record(self, tokens: int, messages: int, truncated: bool, seconds: float) -> None:
+        with self._lock:
+            self.builds += 1
+            self.truncated += int(truncated)
+            self.total_tokens += tokens
+            self.total_messages += messages
+            self.total_build_seconds += seconds
+            self.max_tokens_seen = max(self.max_tokens_seen, tokens)
+            self.last_tokens = tokens
+            self.last_messages = messages
+            self.last_build_ms = seconds * 1000
+
+    def stats(self) -> Dict[str, Any]:
+        """上下文组装统计信息"""
+        builds = self.builds
+        return {
+            "token_budget": self.token_budget,
+            "max_messages": self.max_messages,
+            "builds": builds,
+            "truncated": self.truncated,
+            "retain_ratio": self.retain_ratio,
+            "anchor_moves": self.anchor_moves,
+            "avg_prompt_tokens": round(self.total_tokens / builds, 1) if builds else 0.0,
+            "max_prompt_tokens": self.max_tokens_seen,
+            "avg_messages": round(self.total_messages / builds, 1) if builds else 0.0,
+            "avg_build_ms": round(self.total_build_seconds / builds * 1000, 3) if builds else 0.0,
+            "last_prompt_tokens": self.last_tokens,
+            "last_messages": self.last_messages,
+            "last_build_ms": round(self.last_build_ms, 3),
+        }
+
+
+# 创建上下文组装实例
+context_builder = ContextBuilder()
+metrics.register("llm_context", context_builder.stats)
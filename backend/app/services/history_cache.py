@@ -0,0 +1,258 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.conversation import Conversation
+from app.models.message import Message
+
+# 每次从数据库读取的历史消息条数
+HISTORY_PAGE_SIZE = 50
+
+
+class CachedMessage(NamedTuple):
+    """缓存中的一条历史消息，只保留组装上下文需要的字段"""
+    id: int
+    role: str
+    content: str
+    token_count: int
+
+
+class ConversationWindow:
+    """一个对话最近的消息窗口（按时间顺序）"""
+
+    def __init__(self, user_id: int, messages: List[CachedMessage], complete: bool, expires_at: float):
+        self.user_id = user_id
+        self.messages = messages
+        # 窗口是否包含了对话的全部消息，为False时更早的消息需要从数据库读取
+        self.complete = complete
+        self.expires_at = expires_at
+        self.tokens = sum(message.token_count for message in messages)
+        # 上一轮上下文起点的消息ID，保持提示词前缀稳定
+        self.anchor_id: Optional[int] = None
+
+
+def iter_history_from_db(db: Session, conversation_id: int, before_id: Optional[int] = None) -> Iterator[Any]:
+    """
+    按时间倒序读取历史消息，只读取组装上下文需要的列
+
+    先读取一页（通常已经够用）；还需要更早的消息时，其余消息用一次流式查询按
+    HISTORY_PAGE_SIZE分批取回（PostgreSQL上为服务端游标），不再逐页查询。
+    调用方停止遍历时关闭游标。
+    """
+    query = db.query(Message.id, Message.role, Message.content, Message.token_count).filter(
+        Message.conversation_id == conversation_id
+    )
+    if before_id is not None:
+        query = query.filter(Message.id < before_id)
+    query = query.order_by(Message.id.desc())
+    rows = query.limit(HISTORY_PAGE_SIZE).all()
+    yield from rows
+    if len(rows) < HISTORY_PAGE_SIZE:
+        return
+    result = db.execute(query.filter(Message.id < rows[-1].id).statement,
+                        execution_options={"yield_per": HISTORY_PAGE_SIZE})
+    try:
+        yield from result
+    finally:
+        result.close()
+
+
+class HistoryCache:
+    """
+    进程内的对话历史缓存
+
+    按对话缓存最近的消息窗口和对话所属用户，稳定状态下每轮对话不需要再查询历史消息。
+    add_message时写穿追加，删除对话时失效；窗口至少保留一个上下文token预算的消息，
+    更早的消息被裁剪，需要时再从数据库读取。多进程部署时各进程独立缓存，其他进程可能已经
+    写入了新消息，因此命中时先用索引查询对话最新的消息ID，与窗口最后一条不一致时重新加载。
+    """
+
+    def __init__(self):
+        self.enabled = settings.HISTORY_CACHE_ENABLED
+        self.max_conversations = settings.HISTORY_CACHE_SIZE
+        self.ttl = settings.HISTORY_CACHE_TTL
+        self.window_tokens = settings.LLM_CONTEXT_TOKEN_BUDGET
+        self.window_messages = settings.LLM_CONTEXT_MAX_MESSAGES
+        self._windows: "OrderedDict[int, ConversationWindow]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 正在从数据库加载的对话，以及加载期间发生了写入或失效的对话
+        self._loading: Dict[int, int] = {}
+        self._stale: Set[int] = set()
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+        self.db_fallbacks = 0
+        self.invalidations = 0
+        self.stale_reloads = 0
+
+    def _trim(self, window: ConversationWindow) -> None:
+        """裁剪最早的消息，保证剩余消息仍不少于一个token预算"""
+        messages = window.messages
+        drop = 0
+        tokens = window.tokens
+        while len(messages) - drop > self.window_messages or (
+            len(messages) - drop > 1 and tokens - messages[drop].token_count >= self.window_tokens
+        ):
+            tokens -= messages[drop].token_count
+            drop += 1
+        if drop:
+            del messages[:drop]
+            window.tokens = tokens
+            window.complete = False
+
+    def _get(self, conversation_id: int) -> Optional[ConversationWindow]:
+        with self._lock:
+            window = self._windows.get(conversation_id)
+            if window is None:
+                return None
+            if window.expires_at < time.time():
+                del self._windows[conversation_id]
+                return None
+            self._windows.move_to_end(conversation_id)
+            return window
+
+    def _load(self, db: Session, conversation_id: int) -> Optional[ConversationWindow]:
+        """从数据库加载对话窗口，加载期间有写入时不放入缓存"""
+        with self._lock:
+            self._loading[conversation_id] = self._loading.get(conversation_id, 0) + 1
+        try:
+            user_id = db.query(Conversation.user_id).filter(Conversation.id == conversation_id).scalar()
+            if user_id is None:
+                return None
+
+            newest_first: List[CachedMessage] = []
+            tokens = 0
+            complete = True
+            for row in iter_history_from_db(db, conversation_id):
+                if len(newest_first) >= self.window_messages or tokens >= self.window_tokens:
+                    complete = False
+                    break
+                message = CachedMessage(row.id, row.role, row.content, row.token_count or 0)
+                newest_first.append(message)
+                tokens += message.token_count
+            newest_first.reverse()
+            window = ConversationWindow(user_id, newest_first, complete, time.time() + self.ttl)
+        finally:
+            with self._lock:
+                remaining = self._loading[conversation_id] - 1
+                if remaining:
+                    self._loading[conversation_id] = remaining
+                else:
+                    del self._loading[conversation_id]
+                stale = conversation_id in self._stale
+                if not remaining:
+                    self._stale.discard(conversation_id)
+
+        if not stale:
+            with self._lock:
+                self._windows[conversation_id] = window
+                self._windows.move_to_end(conversation_id)
+                while len(self._windows) > self.max_conversations:
+                    self._windows.popitem(last=False)
+        return window
+
+    def get_window(self, db: Session, conversation_id: int) -> Optional[ConversationWindow]:
+        """获取对话窗口，未缓存时从数据库加载；对话不存在时返回None"""
+        if not self.enabled:
+            return self._load_uncached(db, conversation_id)
+
+        window = self._get(conversation_id)
+        if window is not None:
+            if self._is_current(db, conversation_id, window):
+                self.hits += 1
+                return window
+            # 其他进程写入了消息或删除了对话，丢弃窗口重新加载
+            with self._lock:
+                if self._windows.get(conversation_id) is window:
+                    del self._windows[conversation_id]
+            self.stale_reloads += 1
+        self.misses += 1
+        return self._load(db, conversation_id)
+
+    def _is_current(self, db: Session, conversation_id: int, window: ConversationWindow) -> bool:
+        """窗口最后一条消息是否仍是对话最新的消息（只查询索引）"""
+        newest_id = db.query(func.max(Message.id)).filter(Message.conversation_id == conversation_id).scalar()
+        with self._lock:
+            cached_id = window.messages[-1].id if window.messages else None
+        return newest_id == cached_id
+
+    def contains(self, conversation_id: int) -> bool:
+        """对话窗口是否已缓存（不计入命中统计）"""
+        with self._lock:
+            return self.enabled and conversation_id in self._windows
+
+    def _load_uncached(self, db: Session, conversation_id: int) -> Optional[ConversationWindow]:
+        user_id = db.query(Conversation.user_id).filter(Conversation.id == conversation_id).scalar()
+        if user_id is None:
+            return None
+        return ConversationWindow(user_id, [], False, 0)
+
+    def iter_newest_first(self, db: Session, conversation_id: int, window: ConversationWindow) -> Iterator[Any]:
+        """按时间倒序遍历历史消息：先遍历缓存窗口，窗口不完整时继续从数据库读取更早的消息"""
+        with self._lock:
+            messages = list(window.messages)
+        yield from reversed(messages)
+        if not window.complete:
+            self.db_fallbacks += 1
+            yield from iter_history_from_db(db, conversation_id, before_id=messages[0].id if messages else None)
+
+    def append(self, conversation_id: int, message: Message) -> None:
+        """写穿：新消息写入数据库后追加到缓存窗口"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if conversation_id in self._loading:
+                self._stale.add(conversation_id)
+            window = self._windows.get(conversation_id)
+            if window is None:
+                return
+            if window.messages and window.messages[-1].id >= message.id:
+                return
+            cached = CachedMessage(message.id, message.role, message.content, message.token_count or 0)
+            window.messages.append(cached)
+            window.tokens += cached.token_count
+            self._trim(window)
+
+    def invalidate(self, conversation_ids: Iterable[int]) -> None:
+        """删除对话后使其缓存失效"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for conversation_id in conversation_ids:
+                if conversation_id in self._loading:
+                    self._stale.add(conversation_id)
+                if self._windows.pop(conversation_id, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._windows.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "conversations": len(self._windows),
+            "max_conversations": self.max_conversations,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "db_fallbacks": self.db_fallbacks,
+            "invalidations": self.invalidations,
+            "stale_reloads": self.stale_reloads,
+        }
+
+
+# 创建对话历史缓存实例
+history_cache = HistoryCache()
+metrics.register("history_cache", history_cache.stats)
@@ -0,0 +1,373 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.services.concurrency import OUTCOME_ERROR, OUTCOME_OVERLOAD, OUTCOME_SUCCESS, AdaptiveLimiter
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+# 可重试的上游状态码，其中429/503表示上游过载
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+OVERLOAD_STATUS_CODES = {429, 503}
+# 请求尚未被上游处理的传输错误，可以安全重试
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头（秒数或HTTP日期），返回需要等待的秒数"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _outcome(status_code: int) -> str:
+    if status_code in OVERLOAD_STATUS_CODES:
+        return OUTCOME_OVERLOAD
+    if status_code >= 500:
+        return OUTCOME_ERROR
+    return OUTCOME_SUCCESS
+
+
+def _http2_available() -> bool:
+    """检查是否安装了HTTP/2支持（h2包）"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class LLMHttpClient:
+    """LLM上游HTTP客户端 - 进程内共享的keep-alive连接池
+
+    所有对Deepseek API的请求复用同一个连接池，避免每轮对话都重新进行TCP+TLS握手。
+    安装了h2时启用HTTP/2多路复用。同步接口供脚本和同步代码使用，
+    异步接口（apost/astream）供路由使用，不会阻塞事件循环。
+
+    每次请求先从自适应并发限制获取额度（额度不足且无法排队时抛出UpstreamOverloaded），
+    上游返回429/5xx或连接失败时按带抖动的指数退避重试，并遵循Retry-After。
+    流式请求只在收到响应头、尚未读取数据前重试。
+    """
+
+    def __init__(self):
+        self.http2 = settings.LLM_HTTP2 and _http2_available()
+        self.limits = httpx.Limits(
+            max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+        )
+        self._client: Optional[httpx.Client] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._lock = threading.Lock()
+        self.limiter = AdaptiveLimiter()
+        self.max_attempts = max(settings.LLM_RETRY_MAX_ATTEMPTS, 1)
+        self.retry_base_delay = settings.LLM_RETRY_BASE_DELAY
+        self.retry_max_delay = settings.LLM_RETRY_MAX_DELAY
+
+        # 统计计数
+        self._retries_total = 0
+        self._requests_total = 0
+        self._errors_total = 0
+        self._in_flight = 0
+        self._warmed_up = False
+
+    def _timeout(self, timeout: float) -> httpx.Timeout:
+        """构建超时配置，连接超时单独设置"""
+        return httpx.Timeout(timeout, connect=settings.LLM_HTTP_CONNECT_TIMEOUT)
+
+    @property
+    def client(self) -> httpx.Client:
+        """获取共享客户端，首次访问时创建"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        http2=self.http2,
+                        limits=self.limits,
+                        timeout=self._timeout(60),
+                    )
+                    logger.info(f"LLM HTTP客户端已创建: http2={self.http2}, limits={self.limits}")
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """获取共享异步客户端，首次访问时创建"""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = httpx.AsyncClient(
+                        http2=self.http2,
+                        limits=self.limits,
+                        timeout=self._timeout(60),
+                    )
+                    logger.info(f"LLM HTTP异步客户端已创建: http2={self.http2}, limits={self.limits}")
+        return self._async_client
+
+    def _begin(self) -> None:
+        with self._lock:
+            self._requests_total += 1
+            self._in_flight += 1
+
+    def _end(self, failed: bool) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if failed:
+                self._errors_total += 1
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> Optional[float]:
+        """
+        计算下一次重试前的等待时间
+
+        Returns:
+            等待秒数；不应重试（次数用尽、状态码不可重试或Retry-After过长）时返回None
+        """
+        if attempt + 1 >= self.max_attempts:
+            return None
+        if response is not None and response.status_code not in RETRY_STATUS_CODES:
+            return None
+        # 全抖动指数退避，避免大量请求同时重试
+        delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+        retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+        if retry_after is not None:
+            if retry_after > self.retry_max_delay:
+                return None
+            delay = max(delay, retry_after)
+        with self._lock:
+            self._retries_total += 1
+        return delay
+
+    def post(self, url: str, timeout: float = 60, **kwargs: Any) -> httpx.Response:
+        """发送POST请求（非流式）"""
+        attempt = 0
+        while True:
+            started_at = self.limiter.acquire()
+            self._begin()
+            failed = True
+            outcome = OUTCOME_ERROR
+            try:
+                response = self.client.post(url, timeout=self._timeout(timeout), **kwargs)
+                failed = False
+                outcome = _outcome(response.status_code)
+            except RETRY_ERRORS:
+                delay = self._retry_delay(attempt)
+                if delay is None:
+                    raise
+                response = None
+            except httpx.TimeoutException:
+                outcome = OUTCOME_OVERLOAD
+                raise
+            finally:
+                self._end(failed)
+                self.limiter.release(outcome, started_at)
+
+            if response is not None:
+                delay = self._retry_delay(attempt, response)
+                if delay is None:
+                    return response
+                response.close()
+            logger.warning(f"上游请求失败，{delay:.2f}秒后重试: attempt={attempt + 1}")
+            time.sleep(delay)
+            attempt += 1
+
+    @contextmanager
+    def stream(self, method: str, url: str, timeout: float = 90, **kwargs: Any) -> Iterator[httpx.Response]:
+        """发送流式请求，退出上下文时连接归还连接池"""
+        attempt = 0
+        while True:
+            started_at = self.limiter.acquire()
+            self._begin()
+            failed = True
+            outcome = OUTCOME_ERROR
+            yielded = False
+            delay = None
+            try:
+                with self.client.stream(method, url, timeout=self._timeout(timeout), **kwargs) as response:
+                    outcome = _outcome(response.status_code)
+                    delay = self._retry_delay(attempt, response)
+                    if delay is None:
+                        yielded = True
+                        yield response
+                    else:
+                        response.read()
+                failed = False
+            except RETRY_ERRORS:
+                if yielded:
+                    raise
+                delay = self._retry_delay(attempt)
+                if delay is None:
+                    raise
+            except httpx.TimeoutException:
+                outcome = OUTCOME_OVERLOAD
+                raise
+            finally:
+                self._end(failed)
+                self.limiter.release(outcome, started_at)
+
+            if yielded:
+                return
+            logger.warning(f"上游流式请求失败，{delay:.2f}秒后重试: attempt={attempt + 1}")
+            time.sleep(delay)
+            attempt += 1
+
+    async def apost(self, url: str, timeout: float = 60, **kwargs: Any) -> httpx.Response:
+        """异步发送POST请求（非流式）"""
+        attempt = 0
+        while True:
+            started_at = await self.limiter.aacquire()
+            self._begin()
+            failed = True
+            outcome = OUTCOME_ERROR
+            try:
+                response = await self.async_client.post(url, timeout=self._timeout(timeout), **kwargs)
+                failed = False
+                outcome = _outcome(response.status_code)
+            except RETRY_ERRORS:
+                delay = self._retry_delay(attempt)
+                if delay is None:
+                    raise
+                response = None
+            except httpx.TimeoutException:
+                outcome = OUTCOME_OVERLOAD
+                raise
+            finally:
+                self._end(failed)
+                self.limiter.release(outcome, started_at)
+
+            if response is not None:
+                delay = self._retry_delay(attempt, response)
+                if delay is None:
+                    return response
+                await response.aclose()
+            logger.warning(f"上游请求失败，{delay:.2f}秒后重试: attempt={attempt + 1}")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    @asynccontextmanager
+    async def astream(self, method: str, url: str, timeout: float = 90, **kwargs: Any) -> AsyncIterator[httpx.Response]:
+        """异步发送流式请求，退出上下文时连接归还连接池"""
+        attempt = 0
+        while True:
+            started_at = await self.limiter.aacquire()
+            self._begin()
+            failed = True
+            outcome = OUTCOME_ERROR
+            yielded = False
+            delay = None
+            try:
+                async with self.async_client.stream(method, url, timeout=self._timeout(timeout), **kwargs) as response:
+                    outcome = _outcome(response.status_code)
+                    delay = self._retry_delay(attempt, response)
+                    if delay is None:
+                        yielded = True
+                        yield response
+                    else:
+                        await response.aread()
+                failed = False
+            except RETRY_ERRORS:
+                if yielded:
+                    raise
+                delay = self._retry_delay(attempt)
+                if delay is None:
+                    raise
+            except httpx.TimeoutException:
+                outcome = OUTCOME_OVERLOAD
+                raise
+            finally:
+                self._end(failed)
+                self.limiter.release(outcome, started_at)
+
+            if yielded:
+                return
+            logger.warning(f"上游流式请求失败，{delay:.2f}秒后重试: attempt={attempt + 1}")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def warmup(self, url: str, headers: Optional[Dict[str, str]] = None) -> bool:
+        """预热连接池：提前建立到上游的连接，失败不影响启动"""
+        try:
+            self.client.get(url, headers=headers, timeout=self._timeout(10))
+            self._warmed_up = True
+            logger.info(f"LLM HTTP连接池预热完成: {url}")
+            return True
+        except Exception as e:
+            logger.warning(f"LLM HTTP连接池预热失败: url={url}, error={str(e)}")
+            return False
+
+    async def awarmup(self, url: str, headers: Optional[Dict[str, str]] = None) -> bool:
+        """异步预热连接池，失败不影响启动"""
+        try:
+            await self.async_client.get(url, headers=headers, timeout=self._timeout(10))
+            self._warmed_up = True
+            logger.info(f"LLM HTTP异步连接池预热完成: {url}")
+            return True
+        except Exception as e:
+            logger.warning(f"LLM HTTP异步连接池预热失败: url={url}, error={str(e)}")
+            return False
+
+    def close(self) -> None:
+        """关闭同步客户端并释放连接"""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+                self._warmed_up = False
+
+    async def aclose(self) -> None:
+        """关闭异步客户端并释放连接"""
+        client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.aclose()
+            self._warmed_up = False
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池统计信息，用于调整连接池大小"""
+        connections_total = 0
+        connections_idle = 0
+        for client in (self._client, self._async_client):
+            if client is None:
+                continue
+            # httpx未公开连接池状态，这里读取底层httpcore连接池
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            for connection in getattr(pool, "connections", []):
+                connections_total += 1
+                if connection.is_idle():
+                    connections_idle += 1
+
+        return {
+            "http2": self.http2,
+            "warmed_up": self._warmed_up,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "connections_total": connections_total,
+            "connections_idle": connections_idle,
+            "connections_active": connections_total - connections_idle,
+            "requests_total": self._requests_total,
+            "requests_in_flight": self._in_flight,
+            "errors_total": self._errors_total,
+            "retries_total": self._retries_total,
+        }
+
+
+# 创建共享HTTP客户端实例
+llm_http_client = LLMHttpClient()
+metrics.register("llm_http_pool", llm_http_client.stats)
+metrics.register("llm_limiter", llm_http_client.limiter.stats)
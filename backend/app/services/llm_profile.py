@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.user_settings import UserSettings
+from app.schemas.user import LLMProfileSettings
+from app.utils import generate_system_prompt
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 用户设置中保存生成参数的键
+LLM_SETTINGS_KEY = "llm"
+
+
+class LLMProfile(NamedTuple):
+    """解析后的生成参数（只读），每轮对话直接使用"""
+    model: str
+    max_tokens: int
+    temperature: float
+    system_prompt: str
+
+
+def default_profile() -> LLMProfile:
+    """按配置生成的默认生成参数"""
+    return LLMProfile(settings.DEEPSEEK_MODEL, settings.LLM_MAX_TOKENS, settings.LLM_TEMPERATURE, generate_system_prompt())
+
+
+def validate_llm_settings(user_settings: Dict[str, Any]) -> None:
+    """
+    校验用户设置中的生成参数
+
+    Raises:
+        ValueError: 生成参数无效
+    """
+    raw = user_settings.get(LLM_SETTINGS_KEY)
+    if raw is None:
+        return
+    if not isinstance(raw, dict):
+        raise ValueError(f"{LLM_SETTINGS_KEY}必须是对象")
+    try:
+        LLMProfileSettings.model_validate(raw)
+    except ValidationError as e:
+        details = "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg'].removeprefix('Value error, ')}"
+            for error in e.errors()
+        )
+        raise ValueError(f"生成参数无效: {details}") from e
+
+
+def resolve_profile(user_settings: Optional[Dict[str, Any]]) -> LLMProfile:
+    """把用户设置解析为生成参数，未设置的字段使用默认值；无效的设置（如修改限制前保存的）整体忽略"""
+    default = default_profile()
+    raw = user_settings.get(LLM_SETTINGS_KEY) if isinstance(user_settings, dict) else None
+    if not isinstance(raw, dict):
+        return default
+    try:
+        parsed = LLMProfileSettings.model_validate(raw)
+    except ValidationError as e:
+        logger.warning(f"忽略无效的生成参数设置: error={str(e)}")
+        return default
+    return LLMProfile(
+        model=parsed.model or default.model,
+        max_tokens=parsed.max_tokens or default.max_tokens,
+        temperature=parsed.temperature if parsed.temperature is not None else default.temperature,
+        system_prompt=parsed.system_prompt or default.system_prompt,
+    )
+
+
+class LLMProfileCache:
+    """
+    按用户缓存解析后的生成参数
+
+    未缓存时读取一次用户设置并解析，之后每轮对话不再查询设置；UserService修改设置后失效，
+    多进程部署时其他进程的旧参数最多保留LLM_PROFILE_CACHE_TTL秒。
+    """
+
+    def __init__(self):
+        self.max_entries = settings.LLM_PROFILE_CACHE_SIZE
+        self.ttl = settings.LLM_PROFILE_CACHE_TTL
+        self._profiles: "OrderedDict[int, Tuple[LLMProfile, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次失效加一：读取设置期间发生了失效时，结果不放入缓存
+        self._generation = 0
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _lookup(self, user_id: int) -> Tuple[Optional[LLMProfile], int]:
+        with self._lock:
+            entry = self._profiles.get(user_id)
+            if entry is not None and entry[1] < time.time():
+                del self._profiles[user_id]
+                entry = None
+            if entry is not None:
+                self._profiles.move_to_end(user_id)
+            return (entry[0] if entry is not None else None), self._generation
+
+    def _store(self, user_id: int, profile: LLMProfile, generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._profiles[user_id] = (profile, time.time() + self.ttl)
+            self._profiles.move_to_end(user_id)
+            while len(self._profiles) > self.max_entries:
+                self._profiles.popitem(last=False)
+
+    def get(self, db: Session, user_id: int) -> LLMProfile:
+        """获取用户的生成参数，未缓存时读取用户设置"""
+        profile, generation = self._lookup(user_id)
+        if profile is not None:
+            self.hits += 1
+            return profile
+        self.misses += 1
+        user_settings = db.execute(
+            select(UserSettings.settings).where(UserSettings.user_id == user_id)
+        ).scalar()
+        profile = resolve_profile(user_settings)
+        self._store(user_id, profile, generation)
+        return profile
+
+    async def aget(self, db: AsyncSession, user_id: int) -> LLMProfile:
+        """异步获取用户的生成参数，未缓存时读取用户设置"""
+        profile, generation = self._lookup(user_id)
+        if profile is not None:
+            self.hits += 1
+            return profile
+        self.misses += 1
+        user_settings = (await db.execute(
+            select(UserSettings.settings).where(UserSettings.user_id == user_id)
+        )).scalar()
+        profile = resolve_profile(user_settings)
+        self._store(user_id, profile, generation)
+        return profile
+
+    def invalidate(self, user_id: int) -> None:
+        """用户修改设置后使其生成参数失效"""
+        with self._lock:
+            self._generation += 1
+            if self._profiles.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._generation += 1
+            self._profiles.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._profiles),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+# 创建生成参数缓存实例
+llm_profiles = LLMProfileCache()
+metrics.register("llm_profiles", llm_profiles.stats)
@@ -1,241 +1,521 @@
-from typing import List, Dict, Any, Generator
-import requests
-import json
+import math
+import threading
+from typing import List, Dict, Any, Generator, AsyncGenerator, Optional, Tuple
+import httpx
 from app.core.config import settings
-from app.utils import format_messages_for_llm, generate_system_prompt
+from app.core.metrics import metrics
+from app.services.concurrency import UpstreamOverloaded
+from app.services.http_client import llm_http_client, parse_retry_after
+from app.services.llm_profile import LLMProfile, default_profile
+from app.services.response_cache import make_cache_key, response_cache
+from app.services.single_flight import FlightAbandoned, single_flight
+from app.utils import format_messages_for_llm
+from app.utils.sse import ChatStreamParser
+
+
+class UsageStats:
+    """上游usage统计，用于衡量提示词前缀缓存命中率"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.prompt_cache_hit_tokens = 0
+        self.prompt_cache_miss_tokens = 0
+
+    def record(self, usage: Dict[str, int]) -> None:
+        with self._lock:
+            self.responses += 1
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage["completion_tokens"]
+            self.prompt_cache_hit_tokens += usage["prompt_cache_hit_tokens"]
+            self.prompt_cache_miss_tokens += usage["prompt_cache_miss_tokens"]
+
+    def stats(self) -> Dict[str, Any]:
+        cached = self.prompt_cache_hit_tokens + self.prompt_cache_miss_tokens
+        return {
+            "responses": self.responses,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "prompt_cache_hit_tokens": self.prompt_cache_hit_tokens,
+            "prompt_cache_miss_tokens": self.prompt_cache_miss_tokens,
+            "prompt_cache_hit_rate": round(self.prompt_cache_hit_tokens / cached, 4) if cached else 0.0,
+        }
+
+
+def extract_usage(usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """从上游usage中提取token数和提示词前缀缓存命中情况"""
+    if not usage:
+        return None
+    return {
+        "prompt_tokens": int(usage.get("prompt_tokens") or 0),
+        "completion_tokens": int(usage.get("completion_tokens") or 0),
+        "prompt_cache_hit_tokens": int(usage.get("prompt_cache_hit_tokens") or 0),
+        "prompt_cache_miss_tokens": int(usage.get("prompt_cache_miss_tokens") or 0),
+    }
+
+
+# 并发额度已满时建议客户端等待的秒数（上游没有给出Retry-After时使用）
+OVERLOAD_RETRY_AFTER = 1
+
+
+class LLMUnavailable(Exception):
+    """
+    上游调用失败（并发额度已满、超时、网络错误、错误状态码或无效响应）
+
+    路由据此返回错误状态码（流式响应发送error事件），错误信息不作为助手消息保存。
+    status_code为建议返回的HTTP状态码，retry_after为建议客户端等待的秒数。
+    """
+
+    def __init__(self, message: str, status_code: int = 502, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
 
 
 class LLMService:
-    """LLM服务类 - 按照Deepseek官网标准调用API"""
-    
+    """LLM服务类 - 按照Deepseek官网标准调用API
+
+    同时提供同步接口（generate_response/generate_stream_response）
+    和异步接口（agenerate_response/agenerate_stream_response），
+    路由使用异步接口，避免阻塞事件循环。
+
+    各接口的usage参数为可选的输出字典：本次请求实际调用了上游时，
+    写入上游返回的token数和提示词前缀缓存命中情况（命中回答缓存或合并到其他请求时不写入）。
+    """
+
     def __init__(self):
         """初始化服务"""
         print(f"正在使用API密钥: {settings.DEEPSEEK_API_KEY[:8]}...")
         print(f"正在使用API基础URL: {settings.DEEPSEEK_API_BASE}")
         print(f"正在使用模型: {settings.DEEPSEEK_MODEL}")
-        
+
         # Deepseek API配置
         self.api_key = settings.DEEPSEEK_API_KEY
         self.api_base = settings.DEEPSEEK_API_BASE
         self.model = settings.DEEPSEEK_MODEL
+        self.default_profile = default_profile()
         self.chat_endpoint = f"{self.api_base}/chat/completions"
+        self.http_client = llm_http_client
+        self.cache = response_cache
+        self.single_flight = single_flight
+        self.usage_stats = UsageStats()
+        metrics.register("llm_usage", self.usage_stats.stats)
         print("按照Deepseek官网标准调用API")
-    
-    def generate_response(self, messages: List[Dict[str, Any]]) -> str:
+
+    def warmup(self) -> bool:
+        """预热上游连接池，在应用启动时调用"""
+        return self.http_client.warmup(
+            f"{self.api_base}/models",
+            headers={"Authorization": f"Bearer {self.api_key}"}
+        )
+
+    async def awarmup(self) -> bool:
+        """预热上游异步连接池，在应用启动时调用"""
+        return await self.http_client.awarmup(
+            f"{self.api_base}/models",
+            headers={"Authorization": f"Bearer {self.api_key}"}
+        )
+
+    def _build_request(self, messages: List[Dict[str, Any]], stream: bool,
+                       profile: Optional[LLMProfile] = None) -> Tuple[Dict[str, str], Dict[str, Any]]:
         """
-        生成非流式响应 - 按照Deepseek官网标准调用API
-        
+        构建请求头和请求参数 - 按照Deepseek官网标准
+
         Args:
             messages: 消息列表，包含历史对话
-        
+            stream: 是否流式请求
+            profile: 用户的生成参数，默认使用配置中的默认值
+
         Returns:
-            AI生成的回复
+            (请求头, 请求参数)
         """
-
+        profile = profile or self.default_profile
         # 格式化消息，添加系统提示词
+        # 同一用户的系统提示词固定、历史消息只包含role和content且按原文发送，
+        # 保证相邻轮次的请求前缀完全一致，以命中上游的提示词前缀缓存
         formatted_messages = [
-            {"role": "system", "content": generate_system_prompt()}
+            {"role": "system", "content": profile.system_prompt}
         ]
         formatted_messages.extend(format_messages_for_llm(messages))
-        
-        print(f"准备调用Deepseek API，模型: {self.model}")
-        print(f"消息数量: {len(formatted_messages)}")
-        
+
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+        # Deepseek标准请求参数
+        payload = {
+            "model": profile.model,
+            "messages": formatted_messages,
+            "max_tokens": profile.max_tokens,
+            "temperature": profile.temperature,
+            "top_p": 0.95,
+            "frequency_penalty": 0,
+            "presence_penalty": 0,
+            "stream": stream
+        }
+        return headers, payload
+
+    def _parse_response(self, data: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        按照Deepseek标准格式解析非流式响应
+
+        Returns:
+            (回复内容或提示信息, 是否为有效回复)
+        """
+        print(f"接收到API响应，状态: {data.get('object', 'unknown')}")
+
+        if data.get('choices') and len(data['choices']) > 0:
+            choice = data['choices'][0]
+            if choice.get('message') and choice['message'].get('content'):
+                content = choice['message']['content'].strip()
+                print(f"获取到Deepseek API回复，长度: {len(content)}字符")
+
+                # 打印token使用情况
+                if data.get('usage'):
+                    usage = data['usage']
+                    print(f"Token使用情况 - 输入: {usage.get('prompt_tokens', 0)}, 输出: {usage.get('completion_tokens', 0)}, 总计: {usage.get('total_tokens', 0)}, "
+                          f"前缀缓存命中: {usage.get('prompt_cache_hit_tokens', 0)}, 未命中: {usage.get('prompt_cache_miss_tokens', 0)}")
+
+                return content, True
+            else:
+                return "抱歉，API返回了空的结果。", False
+        else:
+            return "抱歉，API没有返回有效的结果。", False
+
+    def _format_error(self, response: httpx.Response) -> str:
+        """格式化上游错误响应（响应体需已读取）"""
+        error_msg = f"API返回错误状态码: {response.status_code}"
+        try:
+            error_data = response.json()
+            if error_data.get('error'):
+                error_msg += f", 错误信息: {error_data['error'].get('message', '未知错误')}"
+        except:
+            error_msg += f", 响应内容: {response.text[:200]}"
+
+        print(error_msg)
+        return error_msg
+
+    def _status_error(self, response: httpx.Response) -> LLMUnavailable:
+        """上游错误状态码对应的异常（响应体需已读取），429和503按过载处理"""
+        message = f"API请求失败: {self._format_error(response)}"
+        if response.status_code in (429, 503):
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            return LLMUnavailable(message, 503, math.ceil(retry_after) if retry_after is not None else OVERLOAD_RETRY_AFTER)
+        return LLMUnavailable(message)
+
+    def _upstream_error(self, e: Exception) -> LLMUnavailable:
+        """把上游调用中的异常转换为LLMUnavailable"""
+        if isinstance(e, LLMUnavailable):
+            return e
+        if isinstance(e, UpstreamOverloaded):
+            print(f"当前请求较多，拒绝上游调用: {str(e)}")
+            return LLMUnavailable("当前请求较多，请稍后重试", 503, OVERLOAD_RETRY_AFTER)
+        if isinstance(e, httpx.TimeoutException):
+            error = LLMUnavailable("API请求超时，请稍后重试")
+        elif isinstance(e, httpx.NetworkError):
+            error = LLMUnavailable("网络连接错误，请稍后重试")
+        else:
+            error = LLMUnavailable(f"调用Deepseek API时出错: {type(e).__name__}: {str(e)}")
+        print(str(error))
+        return error
+
+    def _log_stream_end(self, parser: ChatStreamParser) -> None:
+        """打印流式响应结束信息"""
+        if parser.finish_reason:
+            print(f"流式响应完成，原因: {parser.finish_reason}")
+        else:
+            print("流式响应结束")
+        if parser.errors:
+            print(f"流式响应中有{parser.errors}个数据块解析失败")
+
+    def _record_usage(self, raw_usage: Optional[Dict[str, Any]], usage: Optional[Dict[str, int]]) -> None:
+        """记录上游usage，并写入调用方提供的输出字典"""
+        extracted = extract_usage(raw_usage)
+        if extracted is None:
+            return
+        self.usage_stats.record(extracted)
+        if usage is not None:
+            usage.update(extracted)
+
+    def generate_response(self, messages: List[Dict[str, Any]], usage: Optional[Dict[str, int]] = None,
+                          profile: Optional[LLMProfile] = None) -> str:
+        """
+        生成非流式响应 - 按照Deepseek官网标准调用API
+
+        Args:
+            messages: 消息列表，包含历史对话
+            usage: 可选，接收本次上游调用的usage
+            profile: 可选，用户的生成参数
+
+        Returns:
+            AI生成的回复
+
+        Raises:
+            LLMUnavailable: 上游调用失败（不会返回错误提示文本）
+        """
+        headers, payload = self._build_request(messages, stream=False, profile=profile)
+
+        # 相同请求直接返回缓存的回答
+        cache_key = make_cache_key(payload)
+        cached = self.cache.get(cache_key) if self.cache.cacheable(payload) else None
+        if cached is not None:
+            print("命中回答缓存")
+            return cached
+
+        # 相同的并发请求只调用一次上游
+        return self.single_flight.do(
+            f"once:{cache_key}",
+            lambda: self._request_upstream(headers, payload, cache_key, usage)
+        )
+
+    def _request_upstream(self, headers: Dict[str, str], payload: Dict[str, Any], cache_key: str, usage: Optional[Dict[str, int]]) -> str:
+        """发送非流式请求到上游并缓存有效回答"""
+        print(f"准备调用Deepseek API，模型: {payload['model']}")
+        print(f"消息数量: {len(payload['messages'])}")
+
         try:
-            # 按照Deepseek官网标准构建请求
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Deepseek标准请求参数
-            payload = {
-                "model": self.model,
-                "messages": formatted_messages,
-                "max_tokens": 2048,  # 增加token限制
-                "temperature": 0.7,
-                "top_p": 0.95,
-                "frequency_penalty": 0,
-                "presence_penalty": 0,
-                "stream": False
-            }
-            
             # 发送请求
             print(f"发送请求到: {self.chat_endpoint}")
-            response = requests.post(
+            response = self.http_client.post(
                 self.chat_endpoint,
                 headers=headers,
                 json=payload,
                 timeout=60  # 增加超时时间
             )
-            
+
             # 检查响应状态
-            if response.status_code == 200:
-                # 解析响应
-                data = response.json()
-                print(f"接收到API响应，状态: {data.get('object', 'unknown')}")
-                
-                # 按照Deepseek标准格式解析响应
-                if data.get('choices') and len(data['choices']) > 0:
-                    choice = data['choices'][0]
-                    if choice.get('message') and choice['message'].get('content'):
-                        content = choice['message']['content'].strip()
-                        print(f"获取到Deepseek API回复，长度: {len(content)}字符")
-                        
-                        # 打印token使用情况
-                        if data.get('usage'):
-                            usage = data['usage']
-                            print(f"Token使用情况 - 输入: {usage.get('prompt_tokens', 0)}, 输出: {usage.get('completion_tokens', 0)}, 总计: {usage.get('total_tokens', 0)}")
-                        
-                        return content
-                    else:
-                        return "抱歉，API返回了空的结果。"
-                else:
-                    return "抱歉，API没有返回有效的结果。"
-            else:
-                error_msg = f"API返回错误状态码: {response.status_code}"
-                try:
-                    error_data = response.json()
-                    if error_data.get('error'):
-                        error_msg += f", 错误信息: {error_data['error'].get('message', '未知错误')}"
-                except:
-                    error_msg += f", 响应内容: {response.text[:200]}"
-                
-                print(error_msg)
-                return f"⚠️ API请求失败: {error_msg}"
-                
-        except requests.exceptions.Timeout:
-            error_info = "⚠️ API请求超时，请检查网络连接或稍后重试"
-            print(error_info)
-            return error_info
-        except requests.exceptions.ConnectionError:
-            error_info = "⚠️ 网络连接错误，请检查网络连接"
-            print(error_info)
-            return error_info
+            if response.status_code != 200:
+                raise self._status_error(response)
+            data = response.json()
+            content, ok = self._parse_response(data)
+            self._record_usage(data.get('usage'), usage)
+            if not ok:
+                raise LLMUnavailable(content)
+            if self.cache.cacheable(payload):
+                self.cache.set(cache_key, content)
+            return content
+
+        except Exception as e:
+            raise self._upstream_error(e) from e
+
+    async def agenerate_response(self, messages: List[Dict[str, Any]], usage: Optional[Dict[str, int]] = None,
+                                 profile: Optional[LLMProfile] = None) -> str:
+        """
+        异步生成非流式响应，等待上游期间不占用线程
+
+        Args:
+            messages: 消息列表，包含历史对话
+            usage: 可选，接收本次上游调用的usage
+            profile: 可选，用户的生成参数
+
+        Returns:
+            AI生成的回复
+
+        Raises:
+            LLMUnavailable: 上游调用失败（不会返回错误提示文本）
+        """
+        headers, payload = self._build_request(messages, stream=False, profile=profile)
+
+        cache_key = make_cache_key(payload)
+        cached = await self.cache.aget(cache_key) if self.cache.cacheable(payload) else None
+        if cached is not None:
+            print("命中回答缓存")
+            return cached
+
+        return await self.single_flight.ado(
+            f"once:{cache_key}",
+            lambda: self._arequest_upstream(headers, payload, cache_key, usage)
+        )
+
+    async def _arequest_upstream(self, headers: Dict[str, str], payload: Dict[str, Any], cache_key: str, usage: Optional[Dict[str, int]]) -> str:
+        """异步发送非流式请求到上游并缓存有效回答"""
+        print(f"准备调用Deepseek API(异步)，模型: {payload['model']}")
+        print(f"消息数量: {len(payload['messages'])}")
+
+        try:
+            print(f"发送请求到: {self.chat_endpoint}")
+            response = await self.http_client.apost(
+                self.chat_endpoint,
+                headers=headers,
+                json=payload,
+                timeout=60
+            )
+
+            if response.status_code != 200:
+                raise self._status_error(response)
+            data = response.json()
+            content, ok = self._parse_response(data)
+            self._record_usage(data.get('usage'), usage)
+            if not ok:
+                raise LLMUnavailable(content)
+            if self.cache.cacheable(payload):
+                await self.cache.aset(cache_key, content)
+            return content
+
         except Exception as e:
-            error_info = f"⚠️ 调用Deepseek API时出错: {type(e).__name__}: {str(e)}"
-            print(error_info)
-            return error_info
-    
-    def generate_stream_response(self, messages: List[Dict[str, Any]]) -> Generator[str, None, None]:
+            raise self._upstream_error(e) from e
+
+    def generate_stream_response(self, messages: List[Dict[str, Any]], usage: Optional[Dict[str, int]] = None,
+                                 profile: Optional[LLMProfile] = None) -> Generator[str, None, None]:
         """
         生成流式响应 - 按照Deepseek官网标准实现流式调用
-        
+
         Args:
             messages: 消息列表，包含历史对话
-        
+            usage: 可选，接收本次上游调用的usage
+            profile: 可选，用户的生成参数
+
         Yields:
             AI生成的回复片段
+
+        Raises:
+            LLMUnavailable: 上游调用失败（不会返回错误提示文本）
         """
-        # 格式化消息，添加系统提示词
-        formatted_messages = [
-            {"role": "system", "content": generate_system_prompt()}
-        ]
-        formatted_messages.extend(format_messages_for_llm(messages))
-        
-        print(f"准备调用Deepseek API(流式)，模型: {self.model}")
-        
+        headers, payload = self._build_request(messages, stream=True, profile=profile)
+
+        # 相同请求将缓存的回答作为合成流重放
+        cache_key = make_cache_key(payload)
+        cached = self.cache.get(cache_key) if self.cache.cacheable(payload) else None
+        if cached is not None:
+            print("命中回答缓存，重放为流式响应")
+            yield from self.cache.replay(cached)
+            return
+
+        # 相同的并发请求共享一个上游流
+        try:
+            yield from self.single_flight.stream(
+                f"stream:{cache_key}",
+                lambda: self._stream_upstream(headers, payload, cache_key, usage)
+            )
+        except FlightAbandoned as e:
+            print("流式响应被中断")
+            raise LLMUnavailable("流式响应被中断，请稍后重试", 503, OVERLOAD_RETRY_AFTER) from e
+
+    def _stream_upstream(self, headers: Dict[str, str], payload: Dict[str, Any], cache_key: str, usage: Optional[Dict[str, int]]) -> Generator[str, None, None]:
+        """读取上游流式响应，正常结束时缓存完整回答"""
+        print(f"准备调用Deepseek API(流式)，模型: {payload['model']}")
+
         try:
-            # 按照Deepseek官网标准构建流式请求
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            # Deepseek标准流式请求参数
-            payload = {
-                "model": self.model,
-                "messages": formatted_messages,
-                "max_tokens": 2048,
-                "temperature": 0.7,
-                "top_p": 0.95,
-                "frequency_penalty": 0,
-                "presence_penalty": 0,
-                "stream": True
-            }
-            
             # 发送流式请求
             print(f"发送流式请求到: {self.chat_endpoint}")
-            response = requests.post(
+            with self.http_client.stream(
+                "POST",
                 self.chat_endpoint,
                 headers=headers,
                 json=payload,
-                stream=True,
                 timeout=90  # 流式请求需要更长的超时时间
-            )
-            
-            # 检查响应状态
-            if response.status_code == 200:
-                print("开始接收流式响应...")
-                
-                # 逐行处理Server-Sent Events (SSE)格式的响应
-                for line in response.iter_lines():
-                    if line:
-                        # 解码并处理SSE格式
-                        line = line.decode('utf-8').strip()
-                        
-                        # 跳过空行和事件类型行
-                        if not line or line.startswith('event:'):
-                            continue
-                        
-                        # 处理数据行
-                        if line.startswith('data: '):
-                            data_str = line[6:]
-                            
-                            # 检查流式结束标记
-                            if data_str == '[DONE]':
-                                print("流式响应结束")
-                                break
-                            
-                            try:
-                                # 解析JSON数据
-                                data = json.loads(data_str)
-                                
-                                # 按照Deepseek标准格式解析流式数据
-                                if data.get('choices') and len(data['choices']) > 0:
-                                    choice = data['choices'][0]
-                                    delta = choice.get('delta', {})
-                                    
-                                    # 提取内容片段
-                                    if delta.get('content'):
-                                        content = delta['content']
-                                        yield content
-                                        
-                                    # 检查是否结束
-                                    if choice.get('finish_reason'):
-                                        print(f"流式响应完成，原因: {choice['finish_reason']}")
-                                        break
-                                        
-                            except json.JSONDecodeError as e:
-                                print(f"解析JSON失败: {data_str[:100]}..., 错误: {str(e)}")
-                            except Exception as e:
-                                print(f"处理数据块失败: {str(e)}")
-                                
-            else:
-                error_msg = f"API返回错误状态码: {response.status_code}"
-                try:
-                    error_data = response.json()
-                    if error_data.get('error'):
-                        error_msg += f", 错误信息: {error_data['error'].get('message', '未知错误')}"
-                except:
-                    error_msg += f", 响应内容: {response.text[:200]}"
-                
-                print(error_msg)
-                yield f"⚠️ 流式API请求失败: {error_msg}"
-                
-        except requests.exceptions.Timeout:
-            error_info = "⚠️ 流式API请求超时，请检查网络连接或稍后重试"
-            print(error_info)
-            yield error_info
-        except requests.exceptions.ConnectionError:
-            error_info = "⚠️ 网络连接错误，请检查网络连接"
-            print(error_info)
-            yield error_info
+            ) as response:
+                # 检查响应状态
+                if response.status_code == 200:
+                    print("开始接收流式响应...")
+
+                    # 直接在原始字节上增量解析Server-Sent Events (SSE)
+                    parser = ChatStreamParser()
+                    pieces = []
+                    for chunk in response.iter_bytes():
+                        for delta in parser.feed(chunk):
+                            if delta.content:
+                                pieces.append(delta.content)
+                                yield delta.content
+                        if parser.done:
+                            break
+                    else:
+                        for delta in parser.flush():
+                            if delta.content:
+                                pieces.append(delta.content)
+                                yield delta.content
+                    self._log_stream_end(parser)
+                    self._record_usage(parser.usage, usage)
+
+                    # 只缓存正常结束的完整回答
+                    if parser.done and self.cache.cacheable(payload):
+                        self.cache.set(cache_key, "".join(pieces))
+                else:
+                    # 流式响应需要先读取响应体
+                    response.read()
+                    raise self._status_error(response)
+
+        except Exception as e:
+            raise self._upstream_error(e) from e
+
+    async def agenerate_stream_response(self, messages: List[Dict[str, Any]], usage: Optional[Dict[str, int]] = None,
+                                        profile: Optional[LLMProfile] = None) -> AsyncGenerator[str, None]:
+        """
+        异步生成流式响应，读取上游数据时让出事件循环
+
+        Args:
+            messages: 消息列表，包含历史对话
+            usage: 可选，接收本次上游调用的usage
+            profile: 可选，用户的生成参数
+
+        Yields:
+            AI生成的回复片段
+
+        Raises:
+            LLMUnavailable: 上游调用失败（不会返回错误提示文本）
+        """
+        headers, payload = self._build_request(messages, stream=True, profile=profile)
+
+        cache_key = make_cache_key(payload)
+        cached = await self.cache.aget(cache_key) if self.cache.cacheable(payload) else None
+        if cached is not None:
+            print("命中回答缓存，重放为流式响应")
+            for piece in self.cache.replay(cached):
+                yield piece
+            return
+
+        # 相同的并发请求共享一个上游流，后加入的请求先收到已产生的片段
+        async for piece in self.single_flight.astream(
+            f"stream:{cache_key}",
+            lambda: self._astream_upstream(headers, payload, cache_key, usage)
+        ):
+            yield piece
+
+    async def _astream_upstream(self, headers: Dict[str, str], payload: Dict[str, Any], cache_key: str, usage: Optional[Dict[str, int]]) -> AsyncGenerator[str, None]:
+        """异步读取上游流式响应，正常结束时缓存完整回答"""
+        print(f"准备调用Deepseek API(异步流式)，模型: {payload['model']}")
+
+        try:
+            print(f"发送流式请求到: {self.chat_endpoint}")
+            async with self.http_client.astream(
+                "POST",
+                self.chat_endpoint,
+                headers=headers,
+                json=payload,
+                timeout=90
+            ) as response:
+                if response.status_code == 200:
+                    print("开始接收流式响应...")
+
+                    parser = ChatStreamParser()
+                    pieces = []
+                    async for chunk in response.aiter_bytes():
+                        for delta in parser.feed(chunk):
+                            if delta.content:
+                                pieces.append(delta.content)
+                                yield delta.content
+                        if parser.done:
+                            break
+                    else:
+                        for delta in parser.flush():
+                            if delta.content:
+                                pieces.append(delta.content)
+                                yield delta.content
+                    self._log_stream_end(parser)
+                    self._record_usage(parser.usage, usage)
+
+                    if parser.done and self.cache.cacheable(payload):
+                        await self.cache.aset(cache_key, "".join(pieces))
+                else:
+                    await response.aread()
+                    raise self._status_error(response)
+
         except Exception as e:
-            error_info = f"⚠️ 流式调用Deepseek API时出错: {type(e).__name__}: {str(e)}"
-            print(error_info)
-            yield error_info
+            raise self._upstream_error(e) from e
 
 
 # 创建LLM服务实例
-llm_service = LLMService()
\ No newline at end of file
+llm_service = LLMService()
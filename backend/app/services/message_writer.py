@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import bindparam, event, func, insert, select, update
+from sqlalchemy.engine import Engine, make_url
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.database.engine import create_db_engine, is_memory_sqlite
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services.history_cache import history_cache
+from app.services.search import search_index
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 停止写入线程的标记
+_STOP = object()
+
+
+class PendingMessage(NamedTuple):
+    """等待写入的消息"""
+    conversation_id: int
+    role: str
+    content: str
+    token_count: int
+    usage: Optional[Dict[str, int]]
+    future: "Future[Message]"
+
+
+class MessageWriter:
+    """
+    消息的合并提交写入
+
+    所有请求的消息交给一个写入线程：有并发写入时，收到第一条消息后在MESSAGE_WRITER_WINDOW_MS内
+    继续收集（提交期间到达的消息也归入下一批），整批消息用一条INSERT ... RETURNING写入并加入全文索引、对话的更新时间和缓存统计按对话合并更新，
+    一次提交（一次fsync）后再通知各个请求。新消息的ID和创建时间由RETURNING返回，
+    不需要再refresh。调用方在提交完成后才拿到消息，确认即已持久化（持久性由
+    MESSAGE_WRITER_SYNCHRONOUS控制）；整批提交失败时逐条重试，只有出错的消息失败。
+    """
+
+    def __init__(self, url: Optional[str] = None, window_ms: Optional[float] = None,
+                 max_batch: Optional[int] = None, synchronous: Optional[str] = None):
+        self.enabled = settings.MESSAGE_WRITER_ENABLED
+        self.url = url or settings.DATABASE_URL
+        self.window = (settings.MESSAGE_WRITER_WINDOW_MS if window_ms is None else window_ms) / 1000
+        self.max_batch = max_batch or settings.MESSAGE_WRITER_MAX_BATCH
+        self.synchronous = (settings.MESSAGE_WRITER_SYNCHRONOUS if synchronous is None else synchronous).upper()
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._engine: Optional[Engine] = None
+        self._lock = threading.Lock()
+        self._last_batch = 0
+
+        # 统计计数
+        self.messages = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self.retries = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.commit_seconds = 0.0
+
+    def _create_engine(self) -> Engine:
+        if is_memory_sqlite(make_url(self.url)):
+            # 内存数据库只能通过同一个引擎访问
+            from app.database.session import engine
+            return engine
+        # 写入线程独占一个连接，PRAGMA synchronous只作用于这个连接
+        engine = create_db_engine(self.url, pool_size=1, max_overflow=0)
+        if self.synchronous:
+            event.listen(engine, "connect", self._apply_synchronous)
+        return engine
+
+    def _apply_synchronous(self, dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            if make_url(self.url).get_backend_name() == "postgresql":
+                cursor.execute(f"SET synchronous_commit TO {'off' if self.synchronous == 'OFF' else 'on'}")
+            else:
+                cursor.execute(f"PRAGMA synchronous={self.synchronous}")
+        finally:
+            cursor.close()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                if self._engine is None:
+                    self._engine = self._create_engine()
+                self._thread = threading.Thread(target=self._loop, name="message-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, conversation_id: int, role: str, content: str, token_count: int,
+              usage: Optional[Dict[str, int]] = None) -> "Future[Message]":
+        """
+        提交一条消息，返回在合并提交完成后得到结果的Future
+
+        Args:
+            conversation_id: 对话ID
+            role: 消息角色
+            content: 消息内容
+            token_count: 消息的token数
+            usage: 生成该回答的上游usage，其中的提示词前缀缓存命中情况记录到消息和对话上
+
+        Returns:
+            Future，结果为带有ID和创建时间的消息（不绑定会话）
+        """
+        self._ensure_started()
+        future: "Future[Message]" = Future()
+        self._queue.put(PendingMessage(conversation_id, role, content, token_count, usage, future))
+        return future
+
+    async def awrite(self, conversation_id: int, role: str, content: str, token_count: int,
+                     usage: Optional[Dict[str, int]] = None) -> Message:
+        """
+        异步提交一条消息，等待合并提交完成（不阻塞事件循环）
+
+        调用方在消息被写入线程取出前被取消时，消息不再写入；取出后取消不影响写入。
+        """
+        return await asyncio.wrap_future(self.write(conversation_id, role, content, token_count, usage))
+
+    def _take(self, pending: PendingMessage) -> bool:
+        """取出一条消息，调用方已取消时跳过；取出后Future不能再被取消"""
+        if pending.future.set_running_or_notify_cancel():
+            return True
+        self.cancelled += 1
+        return False
+
+    def _loop(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            if not self._take(item):
+                continue
+            batch = [item]
+            # 上一批只有一条消息时没有并发写入，不等待时间窗口，避免增加单个请求的延迟
+            deadline = time.perf_counter() + (self.window if self._last_batch > 1 else 0)
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                if self._take(item):
+                    batch.append(item)
+            self._last_batch = len(batch)
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # 写入线程只有一个，任何意外错误都不能让它退出
+                logger.exception(f"消息写入线程处理失败: batch={len(batch)}, error={str(e)}")
+                for pending in batch:
+                    if not pending.future.done():
+                        self._fail(pending, e)
+
+    def _flush(self, batch: List[PendingMessage]) -> None:
+        start = time.perf_counter()
+        # 只有提交本身失败才重试；已提交的批次不再重试，避免重复写入
+        try:
+            messages = self._commit(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail(batch[0], e)
+            else:
+                # 整批失败时逐条重试，只让出错的消息失败
+                logger.warning(f"消息合并提交失败，逐条重试: batch={len(batch)}, error={str(e)}")
+                self.retries += 1
+                for pending in batch:
+                    try:
+                        message = self._commit([pending])
+                    except Exception as item_error:
+                        self._fail(pending, item_error)
+                    else:
+                        self._resolve([pending], message)
+        else:
+            self._resolve(batch, messages)
+        self.batches += 1
+        self.messages += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.commit_seconds += time.perf_counter() - start
+
+    def _fail(self, pending: PendingMessage, error: Exception) -> None:
+        self.failed += 1
+        logger.error(f"消息写入失败: conversation_id={pending.conversation_id}, error={str(error)}")
+        try:
+            pending.future.set_exception(error)
+        except Exception as e:
+            logger.warning(f"通知消息写入失败时出错: conversation_id={pending.conversation_id}, error={str(e)}")
+
+    def _commit(self, batch: List[PendingMessage]) -> List[Message]:
+        """在一个事务中写入一批消息并更新对话，返回带有ID和创建时间的消息"""
+        rows = []
+        totals: Dict[int, List[int]] = {}
+        for pending in batch:
+            usage = pending.usage or {}
+            rows.append({
+                "conversation_id": pending.conversation_id,
+                "role": pending.role,
+                "content": pending.content,
+                "token_count": pending.token_count,
+                "prompt_cache_hit_tokens": usage.get("prompt_cache_hit_tokens"),
+                "prompt_cache_miss_tokens": usage.get("prompt_cache_miss_tokens"),
+            })
+            total = totals.setdefault(pending.conversation_id, [0, 0])
+            total[0] += usage.get("prompt_cache_hit_tokens") or 0
+            total[1] += usage.get("prompt_cache_miss_tokens") or 0
+
+        with self._engine.begin() as conn:
+            keys = conn.execute(
+                insert(Message).returning(Message.id, Message.created_at, sort_by_parameter_order=True), rows
+            ).all()
+            # 更新对话的最近活动时间（对话列表按它排序）并累加缓存统计，每个对话一行
+            conn.execute(
+                update(Conversation).where(Conversation.id == bindparam("cid")).values(
+                    updated_at=func.now(),
+                    prompt_cache_hit_tokens=Conversation.prompt_cache_hit_tokens + bindparam("hit"),
+                    prompt_cache_miss_tokens=Conversation.prompt_cache_miss_tokens + bindparam("miss"),
+                ),
+                [{"cid": cid, "hit": hit, "miss": miss} for cid, (hit, miss) in totals.items()]
+            )
+            if search_index.available(conn):
+                owners = dict(conn.execute(
+                    select(Conversation.id, Conversation.user_id).where(Conversation.id.in_(list(totals)))
+                ).all())
+                search_index.index_messages(conn, [
+                    (key.id, row["conversation_id"], owners.get(row["conversation_id"]), row["content"])
+                    for key, row in zip(keys, rows)
+                ])
+        return [Message(id=key.id, created_at=key.created_at, **row) for key, row in zip(keys, rows)]
+
+    def _resolve(self, batch: List[PendingMessage], messages: List[Message]) -> None:
+        for pending, message in zip(batch, messages):
+            # 消息已提交，后续步骤出错只记录日志，不影响其他消息
+            try:
+                # 写穿到对话历史缓存（按提交顺序）
+                history_cache.append(pending.conversation_id, message)
+            except Exception as e:
+                logger.warning(f"写入对话历史缓存失败: conversation_id={pending.conversation_id}, error={str(e)}")
+                history_cache.invalidate([pending.conversation_id])
+            try:
+                pending.future.set_result(message)
+            except Exception as e:
+                logger.warning(f"通知消息写入结果失败: conversation_id={pending.conversation_id}, error={str(e)}")
+
+    def close(self) -> None:
+        """写完已提交的消息后停止写入线程"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+        if self._engine is not None and not is_memory_sqlite(make_url(self.url)):
+            self._engine.dispose()
+
+    def stats(self) -> Dict[str, Any]:
+        """消息写入统计信息"""
+        return {
+            "enabled": self.enabled,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "synchronous": self.synchronous or settings.SQLITE_SYNCHRONOUS,
+            "queue_depth": self._queue.qsize(),
+            "messages": self.messages,
+            "batches": self.batches,
+            "avg_batch": round(self.messages / self.batches, 2) if self.batches else 0.0,
+            "max_batch_seen": self.max_batch_seen,
+            "retries": self.retries,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "avg_commit_ms": round(self.commit_seconds / self.batches * 1000, 3) if self.batches else 0.0,
+        }
+
+
+# 创建消息写入实例
+message_writer = MessageWriter()
+metrics.register("message_writer", message_writer.stats)
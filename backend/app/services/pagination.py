@@ -0,0 +1,110 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import String, literal, tuple_, type_coerce
+from sqlalchemy.orm import Query
+
+from app.core.config import settings
+
+
+class InvalidCursor(ValueError):
+    """分页游标无法解析"""
+
+
+class Page(NamedTuple):
+    """
+    一页查询结果（按排序键从新到旧排列）
+
+    before: 传给before参数获取更早的一页，没有更早的数据时为None
+    after: 传给after参数获取更新的一页，没有更新的数据时为None
+    has_more: 沿本次翻页方向是否还有数据
+    """
+    items: List[Any]
+    before: Optional[str]
+    after: Optional[str]
+    has_more: bool
+
+
+def page_size(limit: Optional[int], default: int) -> int:
+    """每页条数，限制在1到PAGE_SIZE_MAX之间"""
+    return min(max(limit or default, 1), settings.PAGE_SIZE_MAX)
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """把排序键编码为不透明的游标"""
+    payload = [{"dt": value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """解析游标，返回排序键"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = [datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value for value in payload]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("无效的分页游标")
+    if len(values) != size:
+        raise InvalidCursor("无效的分页游标")
+    return values
+
+
+def _bind(column: Any, value: Any) -> Any:
+    # SQLite中的时间以文本存储，游标保存原始文本并按文本比较，避免格式差异导致漏读或重复
+    if isinstance(value, str):
+        return literal(value, String)
+    return literal(value, column.type)
+
+
+def keyset_paginate(query: Query, columns: Sequence[Any], limit: int,
+                    before: Optional[str] = None, after: Optional[str] = None) -> Page:
+    """
+    按排序键做键集分页（排序键组合需唯一，最后一列通常为主键）
+
+    不使用OFFSET，任意位置翻页都只需一次索引范围扫描；
+    翻页期间插入或删除数据不会导致漏读或重复。
+
+    Args:
+        query: 已包含过滤条件、只查询一个实体的查询
+        columns: 排序键列，如(Conversation.updated_at, Conversation.id)
+        limit: 每页条数
+        before: 游标，返回排在它之前（更早）的数据
+        after: 游标，返回排在它之后（更新）的数据
+
+    Returns:
+        一页数据，按排序键从新到旧排列
+    """
+    if before is not None and after is not None:
+        raise InvalidCursor("before和after不能同时使用")
+
+    # 排序键以原始值读取（不经过类型转换），编码到游标中
+    keys = [type_coerce(column, String).label(f"_cursor_{i}") for i, column in enumerate(columns)]
+    query = query.add_columns(*keys)
+    if after is not None:
+        values = decode_cursor(after, len(columns))
+        query = query.filter(tuple_(*columns) > tuple_(*[_bind(c, v) for c, v in zip(columns, values)]))
+        query = query.order_by(*[column.asc() for column in columns])
+    else:
+        if before is not None:
+            values = decode_cursor(before, len(columns))
+            query = query.filter(tuple_(*columns) < tuple_(*[_bind(c, v) for c, v in zip(columns, values)]))
+        query = query.order_by(*[column.desc() for column in columns])
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()
+
+    # 向新的方向翻页时，来处必有更早的数据；反之亦然
+    older = has_more if after is None else True
+    newer = has_more if after is not None else before is not None
+    before_cursor = after_cursor = None
+    if older:
+        before_cursor = encode_cursor(rows[-1][1:]) if rows else after
+    if newer:
+        after_cursor = encode_cursor(rows[0][1:]) if rows else before
+    return Page([row[0] for row in rows], before_cursor, after_cursor, has_more)
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.utils.auth import get_password_hash, verify_password
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 统计延迟分位数时保留的最近样本数
+LATENCY_SAMPLES = 1000
+
+
+class PasswordHasherBusy(Exception):
+    """密码哈希进程池排队已满或等待超时，请求被拒绝"""
+
+
+def _percentile(samples: Deque[float], ratio: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return round(ordered[min(int(len(ordered) * ratio), len(ordered) - 1)] * 1000, 2)
+
+
+class PasswordHasher:
+    """
+    bcrypt密码哈希和校验的专用进程池
+
+    bcrypt是刻意设计的慢计算，放在默认线程池中时，集中登录会占满线程池，
+    使其他路由的同步调用排队。这里使用独立的、大小固定的进程池
+    （PASSWORD_HASH_WORKERS个进程），协程异步等待结果；正在计算和排队的任务
+    总数超过进程数加PASSWORD_HASH_QUEUE_SIZE时直接拒绝，等待超过
+    PASSWORD_HASH_TIMEOUT秒时取消排队中的任务并拒绝。
+    """
+
+    def __init__(self):
+        self.workers = settings.PASSWORD_HASH_WORKERS
+        self.max_queue = settings.PASSWORD_HASH_QUEUE_SIZE
+        self.timeout = settings.PASSWORD_HASH_TIMEOUT
+        self.rounds = settings.BCRYPT_ROUNDS
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        # 已提交到进程池、尚未完成的任务数
+        self._pending = 0
+        self._latencies: Dict[str, Deque[float]] = {
+            "hash": deque(maxlen=LATENCY_SAMPLES),
+            "verify": deque(maxlen=LATENCY_SAMPLES),
+        }
+
+        # 统计计数
+        self.completed = {"hash": 0, "verify": 0}
+        self.rejected = 0
+        self.timeouts = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # 使用spawn启动工作进程，不复制主进程中的线程和连接
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _reset(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def start(self) -> None:
+        """启动工作进程，避免第一次登录等待进程启动"""
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(int)
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise PasswordHasherBusy(f"密码哈希队列已满: pending={self._pending}")
+            self._pending += 1
+        try:
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except BrokenProcessPool:
+                # 工作进程异常退出后进程池不可再用，重建后重新提交
+                logger.error("密码哈希进程池已损坏，重新创建")
+                self._reset()
+                future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    async def _run(self, kind: str, fn: Callable[..., Any], *args: Any) -> Any:
+        start = time.perf_counter()
+        future = self._submit(fn, *args)
+        try:
+            # 超时或调用方被取消时，仍在排队的任务随之取消
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self.rejected += 1
+            raise PasswordHasherBusy(f"等待密码哈希超时: timeout={self.timeout}s")
+        except BrokenProcessPool:
+            logger.error("密码哈希工作进程异常退出，重新创建进程池")
+            self._reset()
+            raise
+        self._latencies[kind].append(time.perf_counter() - start)
+        self.completed[kind] += 1
+        return result
+
+    def _call(self, kind: str, fn: Callable[..., Any], *args: Any) -> Any:
+        """同步调用方阻塞等待结果，排队和超时规则与异步调用相同"""
+        start = time.perf_counter()
+        future = self._submit(fn, *args)
+        try:
+            result = future.result(self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            self.timeouts += 1
+            self.rejected += 1
+            raise PasswordHasherBusy(f"等待密码哈希超时: timeout={self.timeout}s")
+        except BrokenProcessPool:
+            logger.error("密码哈希工作进程异常退出，重新创建进程池")
+            self._reset()
+            raise
+        self._latencies[kind].append(time.perf_counter() - start)
+        self.completed[kind] += 1
+        return result
+
+    def hash(self, password: str) -> str:
+        """在进程池中计算密码哈希并等待结果（同步调用方使用）"""
+        return self._call("hash", get_password_hash, password, self.rounds)
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        """在进程池中校验密码并等待结果（同步调用方使用）"""
+        return self._call("verify", verify_password, password, hashed_password)
+
+    async def ahash(self, password: str) -> str:
+        """在进程池中计算密码哈希（成本因子为BCRYPT_ROUNDS）"""
+        return await self._run("hash", get_password_hash, password, self.rounds)
+
+    async def averify(self, password: str, hashed_password: str) -> bool:
+        """在进程池中校验密码"""
+        return await self._run("verify", verify_password, password, hashed_password)
+
+    def close(self) -> None:
+        """关闭进程池，取消排队中的任务"""
+        self._reset()
+
+    def stats(self) -> Dict[str, Any]:
+        """进程池统计信息（延迟包含排队时间，单位毫秒）"""
+        pending = self._pending
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "pending": pending,
+            "queue_depth": max(pending - self.workers, 0),
+            "max_queue": self.max_queue,
+            "hash": {
+                "completed": self.completed["hash"],
+                "p50_ms": _percentile(self._latencies["hash"], 0.5),
+                "p99_ms": _percentile(self._latencies["hash"], 0.99),
+            },
+            "verify": {
+                "completed": self.completed["verify"],
+                "p50_ms": _percentile(self._latencies["verify"], 0.5),
+                "p99_ms": _percentile(self._latencies["verify"], 0.99),
+            },
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+# 创建密码哈希进程池实例（工作进程在第一次使用或应用启动时创建）
+password_hasher = PasswordHasher()
+metrics.register("password_hasher", password_hasher.stats)
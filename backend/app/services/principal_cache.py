@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from jose import JWTError, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.models.user import User
+
+
+class UserSnapshot(NamedTuple):
+    """认证得到的用户快照（只读，不绑定数据库会话），字段与用户响应模型一致"""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+    is_superuser: bool
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, user: User) -> "UserSnapshot":
+        return cls(user.id, user.username, user.email, bool(user.is_active), bool(user.is_superuser),
+                   user.created_at, user.updated_at)
+
+
+class PrincipalCache:
+    """
+    进程内的认证主体缓存
+
+    按令牌缓存解码后的JWT声明（不再重复校验签名），按用户ID缓存用户快照，
+    缓存命中时认证不访问数据库。条目在AUTH_CACHE_TTL秒后或令牌过期时失效；
+    UserService更新用户后显式失效。多进程部署时各进程独立缓存，
+    其他进程中的旧快照最多保留TTL秒。
+    """
+
+    def __init__(self):
+        self.enabled = settings.AUTH_CACHE_ENABLED
+        self.max_entries = settings.AUTH_CACHE_SIZE
+        self.ttl = settings.AUTH_CACHE_TTL
+        self._tokens: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._users: "OrderedDict[int, Tuple[UserSnapshot, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次失效加一：从数据库加载期间发生了失效时，加载结果不放入缓存
+        self._generation = 0
+
+        # 统计计数
+        self.token_hits = 0
+        self.token_misses = 0
+        self.user_hits = 0
+        self.user_misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _lookup(entries: OrderedDict, key: Any) -> Any:
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return value
+
+    def _store(self, entries: OrderedDict, key: Any, value: Any, expires_at: float) -> None:
+        entries[key] = (value, expires_at)
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def decode(self, token: str) -> Optional[Dict[str, Any]]:
+        """解码并校验令牌，返回JWT声明；令牌无效或已过期时返回None"""
+        if self.enabled:
+            with self._lock:
+                claims = self._lookup(self._tokens, token)
+            if claims is not None:
+                self.token_hits += 1
+                return claims
+            self.token_misses += 1
+
+        try:
+            claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        except JWTError:
+            return None
+        if self.enabled:
+            expires_at = time.time() + self.ttl
+            if isinstance(claims.get("exp"), (int, float)):
+                expires_at = min(expires_at, claims["exp"])
+            with self._lock:
+                self._store(self._tokens, token, claims, expires_at)
+        return claims
+
+    async def aget_user(self, db: AsyncSession, user_id: int) -> Optional[UserSnapshot]:
+        """获取用户快照，未缓存时从数据库读取；用户不存在时返回None"""
+        if self.enabled:
+            with self._lock:
+                snapshot = self._lookup(self._users, user_id)
+                generation = self._generation
+            if snapshot is not None:
+                self.user_hits += 1
+                return snapshot
+            self.user_misses += 1
+
+        user = await db.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot.from_model(user)
+        if self.enabled:
+            with self._lock:
+                if generation == self._generation:
+                    self._store(self._users, user_id, snapshot, time.time() + self.ttl)
+        return snapshot
+
+    async def aauthenticate(self, db: AsyncSession, token: str) -> Optional[UserSnapshot]:
+        """
+        根据访问令牌获取当前用户
+
+        Args:
+            db: 数据库会话（缓存命中时不使用）
+            token: JWT令牌
+
+        Returns:
+            用户快照；令牌无效或用户不存在时返回None
+        """
+        claims = self.decode(token)
+        if claims is None:
+            return None
+        try:
+            user_id = int(claims["sub"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return await self.aget_user(db, user_id)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """用户信息变更后使其快照失效"""
+        with self._lock:
+            self._generation += 1
+            if self._users.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._generation += 1
+            self._tokens.clear()
+            self._users.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        user_lookups = self.user_hits + self.user_misses
+        return {
+            "enabled": self.enabled,
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            "tokens": len(self._tokens),
+            "users": len(self._users),
+            "token_hits": self.token_hits,
+            "token_misses": self.token_misses,
+            "user_hits": self.user_hits,
+            "user_misses": self.user_misses,
+            "user_hit_rate": round(self.user_hits / user_lookups, 4) if user_lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+# 创建认证主体缓存实例
+principal_cache = PrincipalCache()
+metrics.register("principal_cache", principal_cache.stats)
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 参与缓存键计算的请求参数（不包括stream，流式和非流式共享缓存）
+CACHE_KEY_FIELDS = ("model", "messages", "max_tokens", "temperature", "top_p", "frequency_penalty", "presence_penalty")
+
+
+def make_cache_key(payload: Dict[str, Any]) -> str:
+    """
+    根据请求参数计算规范化的缓存键
+
+    Args:
+        payload: 发送给上游的请求参数（已包含系统提示词和格式化后的消息）
+
+    Returns:
+        sha256十六进制摘要
+    """
+    canonical = {field: payload.get(field) for field in CACHE_KEY_FIELDS}
+    encoded = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def iter_cached_chunks(content: str, chunk_size: int) -> Iterator[str]:
+    """将缓存的完整回答切分为片段，模拟流式输出"""
+    for i in range(0, len(content), chunk_size):
+        yield content[i:i + chunk_size]
+
+
+class DiskCacheTier:
+    """基于SQLite的磁盘缓存层，按TTL和总大小淘汰"""
+
+    def __init__(self, path: str, max_bytes: int, ttl: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_llm_response_cache_accessed_at ON llm_response_cache (accessed_at)"
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM llm_response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            content, created_at = row
+            if now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM llm_response_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE llm_response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return content
+
+    def set(self, key: str, content: str) -> int:
+        """写入缓存，返回因此淘汰的条目数"""
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache (key, content, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, now, now)
+            )
+            return self._evict(now)
+
+    def _evict(self, now: float) -> int:
+        evicted = self._conn.execute(
+            "DELETE FROM llm_response_cache WHERE created_at < ?", (now - self.ttl,)
+        ).rowcount
+
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_response_cache").fetchone()[0]
+        if total > self.max_bytes:
+            # 按最近访问时间从旧到新删除，直到总大小低于上限
+            removed = 0
+            keys = []
+            for key, size in self._conn.execute(
+                "SELECT key, size FROM llm_response_cache ORDER BY accessed_at ASC"
+            ):
+                if total - removed <= self.max_bytes:
+                    break
+                keys.append(key)
+                removed += size
+            self._conn.executemany("DELETE FROM llm_response_cache WHERE key = ?", [(key,) for key in keys])
+            evicted += len(keys)
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_response_cache"
+            ).fetchone()
+        return {"path": self.path, "entries": entries, "bytes": total, "max_bytes": self.max_bytes}
+
+
+class ResponseCache:
+    """
+    LLM回答的精确匹配缓存
+
+    内存LRU层在前，可选的SQLite磁盘层在后；两层都按TTL过期。
+    键为规范化请求参数（系统提示词、消息、模型和采样参数）的哈希。
+    只缓存temperature为0的请求：采样生成的回答每次都不同，复用会让用户重复得到同一个回答。
+    """
+
+    def __init__(self):
+        self.enabled = settings.LLM_CACHE_ENABLED
+        self.max_entries = settings.LLM_CACHE_MAX_ENTRIES
+        self.ttl = settings.LLM_CACHE_TTL
+        self.replay_chunk_size = settings.LLM_CACHE_REPLAY_CHUNK_SIZE
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk: Optional[DiskCacheTier] = None
+        if self.enabled and settings.LLM_CACHE_DISK_PATH:
+            try:
+                self.disk = DiskCacheTier(
+                    settings.LLM_CACHE_DISK_PATH,
+                    max_bytes=settings.LLM_CACHE_DISK_MAX_BYTES,
+                    ttl=self.ttl
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"LLM磁盘缓存初始化失败，仅使用内存缓存: path={settings.LLM_CACHE_DISK_PATH}, error={str(e)}")
+
+        # 统计计数
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stores = 0
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            content, expires_at = entry
+            if expires_at < time.time():
+                del self._memory[key]
+                self.evictions += 1
+                return None
+            self._memory.move_to_end(key)
+            return content
+
+    def _set_memory(self, key: str, content: str) -> None:
+        with self._lock:
+            self._memory[key] = (content, time.time() + self.ttl)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    def cacheable(self, payload: Dict[str, Any]) -> bool:
+        """请求的回答是否可以缓存和复用（缓存已启用且temperature为0）"""
+        return self.enabled and payload.get("temperature") == 0
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存，磁盘层命中时回填内存层"""
+        if not self.enabled:
+            return None
+
+        content = self._get_memory(key)
+        if content is None and self.disk is not None:
+            try:
+                content = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"读取LLM磁盘缓存失败: error={str(e)}")
+            if content is not None:
+                self.disk_hits += 1
+                self._set_memory(key, content)
+
+        if content is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return content
+
+    def set(self, key: str, content: str) -> None:
+        """写入缓存"""
+        if not self.enabled or not content:
+            return
+
+        self._set_memory(key, content)
+        self.stores += 1
+        if self.disk is not None:
+            try:
+                self.evictions += self.disk.set(key, content)
+            except sqlite3.Error as e:
+                logger.warning(f"写入LLM磁盘缓存失败: error={str(e)}")
+
+    async def aget(self, key: str) -> Optional[str]:
+        """异步查询缓存，磁盘层在线程池中访问"""
+        if self.disk is None:
+            return self.get(key)
+        return await run_in_threadpool(self.get, key)
+
+    async def aset(self, key: str, content: str) -> None:
+        """异步写入缓存，磁盘层在线程池中访问"""
+        if self.disk is None:
+            self.set(key, content)
+        else:
+            await run_in_threadpool(self.set, key, content)
+
+    def replay(self, content: str) -> Iterator[str]:
+        """将缓存的回答作为合成流重放"""
+        return iter_cached_chunks(content, self.replay_chunk_size)
+
+    def clear(self) -> None:
+        """清空内存层"""
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        lookups = self.hits + self.misses
+        result = {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "memory_max_entries": self.max_entries,
+            "ttl": self.ttl,
+        }
+        if self.disk is not None:
+            try:
+                result["disk"] = self.disk.stats()
+            except sqlite3.Error as e:
+                result["disk"] = {"error": str(e)}
+        return result
+
+
+# 创建回答缓存实例
+response_cache = ResponseCache()
+metrics.register("llm_response_cache", response_cache.stats)
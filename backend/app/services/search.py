@@ -0,0 +1,487 @@
+import html
+import json
+import logging
+import math
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Pattern, Sequence, Union
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.database.compression import message_codec
+from app.models.archive import ArchivedConversation
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services.pagination import InvalidCursor, decode_cursor, encode_cursor, page_size
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "messages_fts"
+
+# scope列为"u<用户ID> c<对话ID>"，查询时与内容条件取交集，只在当前用户（或对话）的消息中匹配。
+# 无内容表（content=''）只保存倒排索引，不保存列值的副本：匹配结果按rowid读取messages表或归档，
+# 片段在原文上生成；删除时需要提供写入时的原值（delete命令）
+CREATE_FTS_TABLE = text(
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    "USING fts5(scope, content, content='', tokenize='unicode61 remove_diacritics 2')"
+)
+
+# 中日韩文字没有空格分词，逐字切分为单字token，查询时按短语（相邻token）匹配
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_CJK_CHAR = re.compile(f"([{_CJK}])")
+_TOKEN = re.compile(r"\w+")
+
+# 一次查询最多使用的词数
+MAX_QUERY_TERMS = 10
+# 重建索引时每次读取的消息数
+REBUILD_BATCH_SIZE = 1000
+# BM25参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class SearchHit(NamedTuple):
+    """一条搜索结果"""
+    message_id: int
+    conversation_id: int
+    conversation_title: str
+    role: str
+    created_at: Any
+    snippet: str
+
+
+class ArchivedCandidate(NamedTuple):
+    """已归档消息的候选结果（字段与messages查询结果相同）"""
+    id: int
+    conversation_id: int
+    title: str
+    role: str
+    content: str
+    created_at: Any
+
+
+class SearchPage(NamedTuple):
+    """
+    一页搜索结果（按相关度排列）
+
+    next: 传给cursor参数获取下一页，没有更多结果时为None
+    """
+    items: List[SearchHit]
+    next: Optional[str]
+    has_more: bool
+
+
+def segment(content: str) -> str:
+    """在每个中日韩文字两侧加空格，使unicode61分词器逐字切分"""
+    return _CJK_CHAR.sub(r" \1 ", content)
+
+
+def parse_query(query: str) -> List[List[str]]:
+    """把搜索词按空白拆分，每个词切分为token，返回短语列表"""
+    phrases = []
+    for term in query.split():
+        tokens = _TOKEN.findall(segment(term))
+        if tokens:
+            phrases.append(tokens)
+    return phrases[:MAX_QUERY_TERMS]
+
+
+def _archived_created_at(value: Any) -> Any:
+    # 归档数据中created_at为数据库中的原始文本
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def match_expression(user_id: int, phrases: Sequence[Sequence[str]], conversation_id: Optional[int] = None) -> str:
+    """构造FTS5查询：当前用户的消息中同时包含所有短语（token只含字母数字，可以直接放在引号中）"""
+    scope = f'scope : "u{user_id}"'
+    if conversation_id is not None:
+        scope += f' AND scope : "c{conversation_id}"'
+    content = " AND ".join('"' + " ".join(tokens) + '"' for tokens in phrases)
+    return f"{scope} AND content : ({content})"
+
+
+def _phrase_regex(tokens: Sequence[str]) -> str:
+    # token之间允许有标点和空白
+    return r"\W*".join(map(re.escape, tokens))
+
+
+def highlight_pattern(phrases: Sequence[Sequence[str]]) -> Pattern:
+    """在原文中定位任一搜索词的正则"""
+    return re.compile("|".join(_phrase_regex(tokens) for tokens in phrases), re.IGNORECASE)
+
+
+def rank_by_relevance(rows: Sequence[Any], phrases: Sequence[Sequence[str]]) -> List[Any]:
+    """
+    在候选消息中按BM25排序（相同得分时新消息在前）
+
+    词频在原文上统计，文档频率和平均长度取自候选集合，
+    避免FTS5的bm25为计算全表文档频率遍历常见词的全部倒排列表。
+    """
+    if not rows:
+        return []
+    patterns = [re.compile(_phrase_regex(tokens), re.IGNORECASE) for tokens in phrases]
+    frequencies = [[len(pattern.findall(row.content)) for pattern in patterns] for row in rows]
+    total = len(rows)
+    avg_length = sum(len(row.content) for row in rows) / total or 1
+    idf = []
+    for i in range(len(patterns)):
+        df = sum(1 for tf in frequencies if tf[i])
+        idf.append(math.log((total - df + 0.5) / (df + 0.5) + 1))
+
+    def score(index: int) -> float:
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(rows[index].content) / avg_length)
+        return sum(weight * tf * (BM25_K1 + 1) / (tf + norm)
+                   for weight, tf in zip(idf, frequencies[index]) if tf)
+
+    order = sorted(range(total), key=lambda index: (-score(index), -rows[index].id))
+    return [rows[index] for index in order]
+
+
+def make_snippet(content: str, pattern: Pattern, size: int) -> str:
+    """
+    截取第一个匹配附近的片段并高亮
+
+    原文经过HTML转义，匹配部分用<mark>包裹，截断处加省略号。
+    """
+    first = pattern.search(content)
+    start = max(first.start() - size // 4, 0) if first else 0
+    end = min(start + size, len(content))
+    window = content[start:end]
+    parts = []
+    last = 0
+    for match in pattern.finditer(window):
+        parts.append(html.escape(window[last:match.start()]))
+        parts.append(f"<mark>{html.escape(match.group())}</mark>")
+        last = match.end()
+    parts.append(html.escape(window[last:]))
+    return ("…" if start > 0 else "") + "".join(parts) + ("…" if end < len(content) else "")
+
+
+class SearchIndex:
+    """
+    对话历史全文搜索
+
+    SQLite上使用FTS5虚拟表messages_fts（rowid为消息ID），中文逐字切分后建立索引，
+    按短语匹配，任意长度的中文词都走索引；取最新的SEARCH_MAX_CANDIDATES条匹配
+    按BM25相关度排序，片段在原文上高亮。
+    索引由消息写入和删除路径增量维护，可以用rebuild从messages表和归档表重建。
+    冷归档的消息保留在索引中，匹配时从归档数据中读取原文（不恢复对话）。
+    不支持FTS5的数据库退化为按LIKE扫描当前用户的消息，按时间倒序返回，搜索不到已归档的消息。
+    """
+
+    def __init__(self):
+        self.enabled = settings.SEARCH_ENABLED
+        self.snippet_chars = settings.SEARCH_SNIPPET_CHARS
+        self.max_candidates = settings.SEARCH_MAX_CANDIDATES
+        # 各数据库是否有FTS索引表（按引擎URL缓存）
+        self._available: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.queries = 0
+        self.fallback_queries = 0
+        self.indexed = 0
+        self.removed = 0
+        self.rebuilds = 0
+        self.total_seconds = 0.0
+
+    def available(self, bind: Union[Connection, Session]) -> bool:
+        """当前数据库是否可以使用FTS索引"""
+        if not self.enabled:
+            return False
+        engine = bind.get_bind() if isinstance(bind, Session) else bind.engine
+        key = engine.url.render_as_string()
+        available = self._available.get(key)
+        if available is None:
+            available = engine.dialect.name == "sqlite" and bind.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+            ).first() is not None
+            self._available[key] = available
+        return available
+
+    @staticmethod
+    def _params(rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+        return [{"id": message_id, "scope": f"u{user_id} c{conversation_id}", "content": segment(content)}
+                for message_id, conversation_id, user_id, content in rows]
+
+    def _insert(self, bind: Union[Connection, Session], rows: Iterable[Sequence[Any]]) -> int:
+        params = self._params(rows)
+        if params:
+            bind.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, scope, content) VALUES (:id, :scope, :content)"),
+                         params)
+        return len(params)
+
+    @staticmethod
+    def _indexed_ids(bind: Union[Connection, Session], ids: Sequence[int]) -> set:
+        """这些消息ID中已在索引中的ID"""
+        if not ids:
+            return set()
+        return set(bind.execute(
+            text(f"SELECT rowid FROM {FTS_TABLE} WHERE rowid BETWEEN :first AND :last"),
+            {"first": min(ids), "last": max(ids)}
+        ).scalars())
+
+    def index_messages(self, bind: Union[Connection, Session], rows: Iterable[Sequence[Any]],
+                       skip_indexed: bool = False) -> None:
+        """
+        把新消息加入索引（在写入消息的同一事务中调用）
+
+        Args:
+            bind: 数据库连接或会话
+            rows: (消息ID, 对话ID, 用户ID, 消息内容)
+            skip_indexed: 跳过已在索引中的消息（恢复归档时，归档的消息仍在索引中）
+        """
+        if self.available(bind):
+            if skip_indexed:
+                rows = list(rows)
+                indexed = self._indexed_ids(bind, [row[0] for row in rows])
+                rows = [row for row in rows if row[0] not in indexed]
+            count = self._insert(bind, rows)
+            with self._lock:
+                self.indexed += count
+
+    def remove_conversations(self, bind: Union[Connection, Session], conversation_ids: Sequence[int]) -> None:
+        """
+        从索引中删除这些对话的消息（在删除消息之前、同一事务中调用，已归档的消息一并删除）
+
+        无内容表需要按写入时的原值删除，原文从messages表和归档中读取。
+        """
+        if not conversation_ids or not self.available(bind):
+            return
+        # 索引中属于这些对话的消息（按scope列匹配）
+        scopes = " OR ".join(f'"c{int(conversation_id)}"' for conversation_id in conversation_ids)
+        indexed = set(bind.execute(
+            text(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"), {"match": f"scope : ({scopes})"}
+        ).scalars())
+        if not indexed:
+            return
+        owners = dict(bind.execute(
+            select(Conversation.id, Conversation.user_id).where(Conversation.id.in_(conversation_ids))
+        ).all())
+        rows = []
+        live = bind.execute(
+            select(Message.id, Message.conversation_id, Message.content)
+            .where(Message.conversation_id.in_(conversation_ids))
+        ).all()
+        for message_id, conversation_id, content in live:
+            if message_id in indexed:
+                indexed.discard(message_id)
+                rows.append((message_id, conversation_id, owners[conversation_id], content))
+        if indexed:
+            archived = bind.execute(
+                select(ArchivedConversation.conversation_id, ArchivedConversation.data)
+                .where(ArchivedConversation.conversation_id.in_(conversation_ids))
+            ).all()
+            for conversation_id, data in archived:
+                for row in json.loads(message_codec.decompress(bytes(data))):
+                    if row[0] in indexed:
+                        indexed.discard(row[0])
+                        rows.append((row[0], conversation_id, owners[conversation_id], row[2]))
+        params = self._params(rows)
+        if params:
+            bind.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, scope, content) "
+                              "VALUES ('delete', :id, :scope, :content)"), params)
+        if indexed:
+            logger.warning(f"全文索引中有{len(indexed)}条消息找不到原文，无法删除，可以重建索引")
+        with self._lock:
+            self.removed += len(params)
+
+    def populate(self, conn: Connection) -> int:
+        """创建索引表并从messages表写入全部消息，返回写入的消息数"""
+        conn.execute(CREATE_FTS_TABLE)
+        total = 0
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                text("SELECT m.id, m.conversation_id, c.user_id, m.content FROM messages m "
+                     "JOIN conversations c ON c.id = m.conversation_id "
+                     "WHERE m.id > :last_id ORDER BY m.id LIMIT :limit")
+                .columns(Message.id, Message.conversation_id, Conversation.user_id, Message.content),
+                {"last_id": last_id, "limit": REBUILD_BATCH_SIZE}
+            ).all()
+            if not rows:
+                break
+            total += self._insert(conn, rows)
+            last_id = rows[-1][0]
+        total += self.index_archived(conn)
+        conn.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')"))
+        return total
+
+    def index_archived(self, conn: Connection) -> int:
+        """把已归档的消息写入索引（跳过已在索引中的消息），返回写入的消息数"""
+        if not inspect(conn).has_table(ArchivedConversation.__tablename__):
+            return 0
+        total = 0
+        archived = conn.execute(
+            select(ArchivedConversation.conversation_id, Conversation.user_id, ArchivedConversation.data)
+            .join(Conversation, Conversation.id == ArchivedConversation.conversation_id)
+        )
+        for conversation_id, user_id, data in archived.all():
+            rows = json.loads(message_codec.decompress(bytes(data)))
+            if not rows:
+                continue
+            # 迁移到AUTOINCREMENT之前归档消息的ID可能已被新消息复用，这些消息在恢复时分配新ID后再写入索引
+            taken = set(conn.execute(
+                select(Message.id).where(Message.id.between(rows[0][0], rows[-1][0]))
+            ).scalars())
+            taken |= self._indexed_ids(conn, [rows[0][0], rows[-1][0]])
+            total += self._insert(conn, [(row[0], conversation_id, user_id, row[2]) for row in rows
+                                         if row[0] not in taken])
+        return total
+
+    def rebuild(self, engine: Engine) -> int:
+        """
+        从messages表和归档表重建索引
+
+        在一个事务中删除并重新创建索引表，期间的搜索看到旧索引，
+        消息写入等待写锁。返回写入的消息数。
+        """
+        if engine.dialect.name != "sqlite":
+            raise ValueError(f"全文索引只支持SQLite: {engine.dialect.name}")
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+            total = self.populate(conn)
+        self._available.clear()
+        with self._lock:
+            self.rebuilds += 1
+        logger.info(f"全文索引已重建: messages={total}, seconds={time.perf_counter() - start:.2f}")
+        return total
+
+    def search(self, db: Session, user_id: int, query: str, limit: Optional[int] = None,
+               cursor: Optional[str] = None, conversation_id: Optional[int] = None) -> SearchPage:
+        """
+        搜索用户的对话历史
+
+        Args:
+            db: 数据库会话
+            user_id: 用户ID
+            query: 搜索词，空白分隔的多个词需要同时出现
+            limit: 每页条数，默认为SEARCH_PAGE_SIZE，不超过PAGE_SIZE_MAX
+            cursor: 上一页返回的next游标
+            conversation_id: 只在这个对话中搜索
+
+        Returns:
+            一页搜索结果
+        """
+        limit = page_size(limit, settings.SEARCH_PAGE_SIZE)
+        offset = decode_cursor(cursor, 1)[0] if cursor else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise InvalidCursor("无效的分页游标")
+        phrases = parse_query(query)
+        if not phrases:
+            return SearchPage([], None, False)
+
+        start = time.perf_counter()
+        fts = self.available(db)
+        if fts:
+            candidates = self._fts_candidates(db, user_id, phrases, conversation_id)
+            rows = rank_by_relevance(candidates, phrases)[offset:offset + limit + 1]
+        else:
+            rows = self._search_like(db, user_id, phrases, limit + 1, offset, conversation_id)
+        with self._lock:
+            self.queries += 1
+            self.fallback_queries += 0 if fts else 1
+            self.total_seconds += time.perf_counter() - start
+
+        has_more = len(rows) > limit
+        pattern = highlight_pattern(phrases)
+        items = [
+            SearchHit(row.id, row.conversation_id, row.title, row.role, row.created_at,
+                      make_snippet(row.content, pattern, self.snippet_chars))
+            for row in rows[:limit]
+        ]
+        return SearchPage(items, encode_cursor([offset + limit]) if has_more else None, has_more)
+
+    async def asearch(self, db: AsyncSession, user_id: int, query: str, limit: Optional[int] = None,
+                      cursor: Optional[str] = None, conversation_id: Optional[int] = None) -> SearchPage:
+        """异步搜索用户的对话历史"""
+        return await db.run_sync(self.search, user_id, query, limit, cursor, conversation_id)
+
+    def _fts_candidates(self, db: Session, user_id: int, phrases: List[List[str]],
+                        conversation_id: Optional[int]) -> List[Any]:
+        # 只取最新的max_candidates条匹配：按rowid倒序读取可以提前停止，
+        # 常见词匹配大量消息时也不需要遍历全部匹配
+        rows = db.execute(
+            text(f"SELECT f.rowid AS id, m.conversation_id, c.title, m.role, m.content, m.created_at FROM "
+                 f"(SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match "
+                 "ORDER BY rowid DESC LIMIT :candidates) f "
+                 "LEFT JOIN messages m ON m.id = f.rowid LEFT JOIN conversations c ON c.id = m.conversation_id "
+                 "WHERE c.user_id = :user_id OR m.id IS NULL").columns(
+                Message.id, Message.conversation_id, Conversation.title, Message.role,
+                Message.content, Message.created_at
+            ),
+            {"match": match_expression(user_id, phrases, conversation_id), "user_id": user_id,
+             "candidates": self.max_candidates}
+        ).all()
+        candidates = [row for row in rows if row.conversation_id is not None]
+        archived = {row.id for row in rows if row.conversation_id is None}
+        if archived:
+            candidates.extend(self._archived_candidates(db, user_id, archived, conversation_id))
+        return candidates
+
+    def _archived_candidates(self, db: Session, user_id: int, ids: set,
+                             conversation_id: Optional[int]) -> List[ArchivedCandidate]:
+        # 匹配到的消息不在messages表中：对话已归档，按消息ID范围找到归档，从归档数据中读取原文
+        query = select(
+            ArchivedConversation.conversation_id, Conversation.title, ArchivedConversation.data,
+            ArchivedConversation.first_message_id, ArchivedConversation.last_message_id
+        ).join(Conversation, Conversation.id == ArchivedConversation.conversation_id).where(
+            Conversation.user_id == user_id,
+            ArchivedConversation.first_message_id <= max(ids),
+            ArchivedConversation.last_message_id >= min(ids),
+        )
+        if conversation_id is not None:
+            query = query.where(ArchivedConversation.conversation_id == conversation_id)
+        candidates = []
+        for archived_id, title, data, first_id, last_id in db.execute(query):
+            if not any(first_id <= message_id <= last_id for message_id in ids):
+                continue
+            for row in json.loads(message_codec.decompress(bytes(data))):
+                if row[0] in ids:
+                    ids.discard(row[0])
+                    candidates.append(ArchivedCandidate(row[0], archived_id, title, row[1], row[2],
+                                                        _archived_created_at(row[3])))
+        return candidates
+
+    def _search_like(self, db: Session, user_id: int, phrases: List[List[str]], limit: int, offset: int,
+                     conversation_id: Optional[int]) -> List[Any]:
+        query = db.query(
+            Message.id, Message.conversation_id, Conversation.title, Message.role, Message.content, Message.created_at
+        ).join(Conversation, Conversation.id == Message.conversation_id).filter(Conversation.user_id == user_id)
+        if conversation_id is not None:
+            query = query.filter(Message.conversation_id == conversation_id)
+        for tokens in phrases:
+            # 没有全文索引时按原文子串匹配（中文token在原文中相邻）
+            needle = "".join(tokens) if _CJK_CHAR.match(tokens[0]) else " ".join(tokens)
+            escaped = needle.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            query = query.filter(Message.content.ilike(f"%{escaped}%", escape="\\"))
+        return query.order_by(Message.id.desc()).limit(limit).offset(offset).all()
+
+    def stats(self) -> Dict[str, Any]:
+        """全文搜索统计信息"""
+        return {
+            "enabled": self.enabled,
+            "queries": self.queries,
+            "fallback_queries": self.fallback_queries,
+            "avg_query_ms": round(self.total_seconds / self.queries * 1000, 3) if self.queries else 0.0,
+            "indexed_messages": self.indexed,
+            "removed_messages": self.removed,
+            "rebuilds": self.rebuilds,
+        }
+
+
+# 创建全文搜索实例
+search_index = SearchIndex()
+metrics.register("search", search_index.stats)
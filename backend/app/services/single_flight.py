@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class FlightAbandoned(Exception):
+    """领头请求在流式响应结束前退出，跟随者无法获得完整回答"""
+
+
+class _Call:
+    """一次进行中的同步非流式调用"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _SyncStream:
+    """一次进行中的同步流式调用，领头请求在自己的线程中驱动上游"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks: List[str] = []
+        self.done = False
+        self.completed = False
+        self.error: Optional[BaseException] = None
+
+
+class _AsyncStream:
+    """一次进行中的异步流式调用，由后台任务驱动上游，所有订阅者读取同一缓冲区"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional["asyncio.Task"] = None
+        self._event = asyncio.Event()
+
+    def publish(self) -> None:
+        """唤醒所有等待新数据的订阅者"""
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    async def wait(self) -> None:
+        await self._event.wait()
+
+
+class SingleFlight:
+    """
+    相同请求的并发合并（single-flight）
+
+    同一键的请求同时只向上游发起一次：第一个请求成为领头请求，
+    其余请求等待并共享其结果。流式请求的跟随者先收到已产生的片段，
+    再实时收到后续片段。键由调用方提供（通常为规范化请求参数的哈希）。
+    """
+
+    def __init__(self):
+        self.enabled = settings.LLM_SINGLE_FLIGHT_ENABLED
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _SyncStream] = {}
+        self._async_calls: Dict[str, "asyncio.Future"] = {}
+        self._async_streams: Dict[str, _AsyncStream] = {}
+
+        # 统计计数
+        self.leaders = 0
+        self.followers = 0
+        self.abandoned = 0
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """同步执行fn，相同键的并发调用共享一次执行结果"""
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stream(self, key: str, factory: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        同步流式执行，相同键的并发调用共享一个上游流
+
+        领头请求在当前线程中读取上游；跟随者先收到已缓冲的片段，再等待新片段。
+        领头请求提前退出时，跟随者收到FlightAbandoned异常。
+        """
+        if not self.enabled:
+            yield from factory()
+            return
+
+        with self._lock:
+            flight = self._streams.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._streams[key] = _SyncStream()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if leader:
+            try:
+                for chunk in factory():
+                    with flight.cond:
+                        flight.chunks.append(chunk)
+                        flight.cond.notify_all()
+                    yield chunk
+                flight.completed = True
+            except Exception as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._streams[key]
+                    if not flight.completed and flight.error is None:
+                        self.abandoned += 1
+                with flight.cond:
+                    flight.done = True
+                    flight.cond.notify_all()
+            return
+
+        index = 0
+        while True:
+            with flight.cond:
+                while index >= len(flight.chunks) and not flight.done:
+                    flight.cond.wait()
+                batch = flight.chunks[index:]
+                done = flight.done
+            index += len(batch)
+            yield from batch
+            if done:
+                break
+
+        if flight.error is not None:
+            raise flight.error
+        if not flight.completed:
+            raise FlightAbandoned()
+
+    async def ado(self, key: str, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        异步执行，相同键的并发调用共享一个任务
+
+        任务与调用方隔离，某个调用方被取消不会影响其他等待者。
+        """
+        if not self.enabled:
+            return await factory()
+
+        task = self._async_calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._async_calls[key] = task
+            self.leaders += 1
+
+            def _forget(done: "asyncio.Future") -> None:
+                if self._async_calls.get(key) is done:
+                    del self._async_calls[key]
+
+            task.add_done_callback(_forget)
+        else:
+            self.followers += 1
+
+        return await asyncio.shield(task)
+
+    async def astream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        异步流式执行，相同键的并发调用共享一个上游流
+
+        上游由后台任务读取并写入缓冲区，每个订阅者从头读取缓冲区并等待新片段，
+        因此某个订阅者断开不会影响其他订阅者；所有订阅者都断开时取消上游读取。
+        """
+        if not self.enabled:
+            async for chunk in factory():
+                yield chunk
+            return
+
+        flight = self._async_streams.get(key)
+        if flight is None:
+            flight = self._async_streams[key] = _AsyncStream()
+            flight.task = asyncio.ensure_future(self._drive(key, flight, factory))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        flight.subscribers += 1
+        try:
+            index = 0
+            while True:
+                while index < len(flight.chunks):
+                    chunk = flight.chunks[index]
+                    index += 1
+                    yield chunk
+                if flight.done:
+                    break
+                await flight.wait()
+
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # 没有订阅者了，停止读取上游，新请求不再加入这次调用
+                if self._async_streams.get(key) is flight:
+                    del self._async_streams[key]
+                self.abandoned += 1
+                flight.task.cancel()
+
+    async def _drive(self, key: str, flight: _AsyncStream, factory: Callable[[], AsyncIterator[str]]) -> None:
+        """后台读取上游流并发布到缓冲区"""
+        try:
+            async for chunk in factory():
+                flight.chunks.append(chunk)
+                flight.publish()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"合并的上游流式请求失败: error={str(e)}")
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.publish()
+            if self._async_streams.get(key) is flight:
+                del self._async_streams[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计信息"""
+        return {
+            "enabled": self.enabled,
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "abandoned": self.abandoned,
+            "in_flight": len(self._calls) + len(self._streams) + len(self._async_calls) + len(self._async_streams),
+        }
+
+
+# 创建请求合并实例
+single_flight = SingleFlight()
+metrics.register("llm_single_flight", single_flight.stats)
@@ -0,0 +1,165 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# 上游正常结束的标记
+_END = object()
+
+
+class _Failed(NamedTuple):
+    """上游读取出错，合并器输出已缓冲的内容后重新抛出"""
+    error: Exception
+
+
+class StreamCoalescer:
+    """
+    流式回答片段合并
+
+    上游每个增量通常只有1-3个字符，逐个输出时每个字符都要付出一次JSON编码、
+    一次写入和代理/浏览器的分帧开销。这里在上游流和HTTP响应之间合并片段：
+    第一个片段和距上一帧超过STREAM_COALESCE_WINDOW秒到达的片段立即输出，
+    其余片段先缓冲，缓冲达到STREAM_COALESCE_MAX_BYTES字节或窗口到期时合并为一帧输出。
+    上游停顿时窗口到期也会输出已缓冲的内容，不等待下一个片段。
+    """
+
+    def __init__(self):
+        self.enabled = settings.STREAM_COALESCE_ENABLED
+        self.window = settings.STREAM_COALESCE_WINDOW
+        self.max_bytes = settings.STREAM_COALESCE_MAX_BYTES
+
+        # 统计计数
+        self.streams = 0
+        self.chunks = 0
+        self.frames = 0
+        self.flushes = {"leading": 0, "size": 0, "window": 0, "end": 0}
+
+    async def coalesce(self, source: AsyncIterator[str]) -> AsyncIterator[str]:
+        """
+        合并上游片段，输出的内容依次拼接后与上游完全相同
+
+        Args:
+            source: 上游片段的异步迭代器
+
+        Yields:
+            合并后的片段
+        """
+        self.streams += 1
+        if not self.enabled or self.window <= 0:
+            async for chunk in source:
+                self.chunks += 1
+                self.frames += 1
+                yield chunk
+            return
+
+        loop = asyncio.get_running_loop()
+        iterator = source.__aiter__()
+        queue: "asyncio.Queue[Any]" = asyncio.Queue()
+        reader: Optional[asyncio.Future] = None
+        buffer: List[str] = []
+        size = 0
+
+        try:
+            # 第一个片段直接读取并立即输出，与不合并时的路径相同
+            try:
+                first = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            self.chunks += 1
+            self.flushes["leading"] += 1
+            self.frames += 1
+            last_frame = loop.time()
+            yield first
+
+            reader = asyncio.ensure_future(self._read(iterator, queue))
+            while True:
+                if buffer and queue.empty():
+                    # 等待下一个片段，最多等到窗口到期，到期后先输出已缓冲的内容
+                    timeout = last_frame + self.window - loop.time()
+                    try:
+                        if timeout <= 0:
+                            raise asyncio.TimeoutError()
+                        item = await asyncio.wait_for(queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        self.flushes["window"] += 1
+                        self.frames += 1
+                        text = "".join(buffer)
+                        buffer, size = [], 0
+                        last_frame = loop.time()
+                        yield text
+                        continue
+                else:
+                    item = await queue.get()
+
+                if item is _END:
+                    break
+                if isinstance(item, _Failed):
+                    # 上游出错前已收到的内容照常输出，再抛出异常
+                    if buffer:
+                        self.frames += 1
+                        yield "".join(buffer)
+                    raise item.error
+
+                self.chunks += 1
+                if not buffer and loop.time() - last_frame >= self.window:
+                    # 距上一帧已超过窗口，不额外等待
+                    self.flushes["leading"] += 1
+                    self.frames += 1
+                    last_frame = loop.time()
+                    yield item
+                    continue
+
+                buffer.append(item)
+                size += len(item.encode("utf-8"))
+                if size >= self.max_bytes:
+                    self.flushes["size"] += 1
+                    self.frames += 1
+                    text = "".join(buffer)
+                    buffer, size = [], 0
+                    last_frame = loop.time()
+                    yield text
+        finally:
+            # 调用方提前退出（客户端断开）时停止读取上游
+            if reader is None:
+                aclose = getattr(iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            elif not reader.done():
+                reader.cancel()
+                await asyncio.wait((reader,))
+
+        if buffer:
+            self.flushes["end"] += 1
+            self.frames += 1
+            yield "".join(buffer)
+
+    @staticmethod
+    async def _read(iterator: AsyncIterator[str], queue: "asyncio.Queue[Any]") -> None:
+        """在后台任务中读取上游，片段放入队列；同一次网络读取产生的片段一次取完，不逐个等待"""
+        try:
+            async for chunk in iterator:
+                queue.put_nowait(chunk)
+        except Exception as e:
+            queue.put_nowait(_Failed(e))
+        else:
+            queue.put_nowait(_END)
+
+    def stats(self) -> Dict[str, Any]:
+        """合并统计信息"""
+        return {
+            "enabled": self.enabled,
+            "window": self.window,
+            "max_bytes": self.max_bytes,
+            "streams": self.streams,
+            "chunks": self.chunks,
+            "frames": self.frames,
+            "frames_per_stream": round(self.frames / self.streams, 2) if self.streams else 0.0,
+            "chunks_per_frame": round(self.chunks / self.frames, 2) if self.frames else 0.0,
+            "flushes": dict(self.flushes),
+        }
+
+
+# 创建流式片段合并实例
+stream_coalescer = StreamCoalescer()
+metrics.register("stream_coalescer", stream_coalescer.stats)
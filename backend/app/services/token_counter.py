@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 中日韩字符（含假名、韩文音节和全角标点），按Deepseek官方估算每个约0.6个token
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+
+# 短文本直接计算比计算哈希更快，不进入缓存
+MEMO_MIN_LENGTH = 64
+
+
+class EstimateBackend:
+    """按字符类别估算token数，无外部依赖，误差约10%-20%"""
+
+    name = "estimate"
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if text.isascii():
+            return math.ceil(len(text) * OTHER_TOKENS_PER_CHAR)
+        cjk = len(_CJK_RE.findall(text))
+        return math.ceil(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) * OTHER_TOKENS_PER_CHAR)
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        return [self.count(text) for text in texts]
+
+
+class TiktokenBackend:
+    """基于tiktoken的精确BPE计数（编码与Deepseek词表不完全一致，但远比估算准确）"""
+
+    name = "tiktoken"
+
+    def __init__(self, encoding_name: str):
+        import tiktoken
+
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        return len(self.encoding.encode_ordinary(text))
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(list(texts))]
+
+
+def _load_backend(name: str, encoding_name: str):
+    """加载计数后端，tiktoken不可用时回退到估算"""
+    if name == "tiktoken":
+        try:
+            return TiktokenBackend(encoding_name)
+        except Exception as e:
+            logger.warning(f"tiktoken不可用，使用估算计数: encoding={encoding_name}, error={str(e)}")
+    elif name != "estimate":
+        logger.warning(f"未知的token计数后端，使用估算计数: backend={name}")
+    return EstimateBackend()
+
+
+def _content_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class TokenCounter:
+    """
+    Token计数服务
+
+    后端由TOKENIZER_BACKEND选择（estimate或tiktoken），
+    结果按内容哈希记忆，同一段内容（如重复发送的历史消息）只计算一次。
+    """
+
+    def __init__(self):
+        self.backend = _load_backend(settings.TOKENIZER_BACKEND, settings.TOKENIZER_ENCODING)
+        self.max_entries = settings.TOKENIZER_CACHE_SIZE
+        self._memo: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+
+    def _get_memo(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            count = self._memo.get(key)
+            if count is not None:
+                self._memo.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return count
+
+    def _set_memo(self, key: bytes, count: int) -> None:
+        with self._lock:
+            self._memo[key] = count
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+
+    def count(self, text: Optional[str]) -> int:
+        """计算一段文本的token数"""
+        if not text:
+            return 0
+        if len(text) < MEMO_MIN_LENGTH:
+            return self.backend.count(text)
+
+        key = _content_key(text)
+        count = self._get_memo(key)
+        if count is None:
+            count = self.backend.count(text)
+            self._set_memo(key, count)
+        return count
+
+    def count_many(self, texts: Sequence[Optional[str]]) -> List[int]:
+        """批量计算token数，未命中缓存的文本一次性交给后端"""
+        results = [0] * len(texts)
+        pending_index: List[int] = []
+        pending_text: List[str] = []
+        pending_key: List[Optional[bytes]] = []
+
+        for i, text in enumerate(texts):
+            if not text:
+                continue
+            key = _content_key(text) if len(text) >= MEMO_MIN_LENGTH else None
+            count = self._get_memo(key) if key is not None else None
+            if count is None:
+                pending_index.append(i)
+                pending_text.append(text)
+                pending_key.append(key)
+            else:
+                results[i] = count
+
+        if pending_text:
+            for i, key, count in zip(pending_index, pending_key, self.backend.count_many(pending_text)):
+                results[i] = count
+                if key is not None:
+                    self._set_memo(key, count)
+        return results
+
+    async def acount(self, text: Optional[str]) -> int:
+        """在线程池中计算token数，避免长文本阻塞事件循环"""
+        return await run_in_threadpool(self.count, text)
+
+    async def acount_many(self, texts: Sequence[Optional[str]]) -> List[int]:
+        """在线程池中批量计算token数"""
+        return await run_in_threadpool(self.count_many, texts)
+
+    def stats(self) -> Dict[str, Any]:
+        """计数统计信息"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "memo_entries": len(self._memo),
+            "memo_max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# 创建token计数实例
+token_counter = TokenCounter()
+metrics.register("tokenizer", token_counter.stats)
@@ -1,30 +1,99 @@
 from typing import Optional, Dict, Any
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 from app.models.user import User as UserModel
 from app.models.user_settings import UserSettings as UserSettingsModel
 from app.schemas.user import UserCreate, UserUpdate
-from app.utils import get_password_hash, verify_password
+from app.services.llm_profile import llm_profiles, validate_llm_settings
+from app.services.password_hasher import PasswordHasherBusy, password_hasher
+from app.services.principal_cache import principal_cache
 
 
 class UserService:
     """用户服务类"""
     
+    @staticmethod
+    def _hash_password(password: str) -> str:
+        """在密码哈希进程池中计算哈希并等待结果，进程池繁忙时返回503"""
+        try:
+            return password_hasher.hash(password)
+        except PasswordHasherBusy as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="当前请求较多，请稍后重试",
+                headers={"Retry-After": "1"}
+            ) from e
+    
+    @staticmethod
+    def _verify_password(password: str, hashed_password: str) -> bool:
+        """在密码哈希进程池中校验密码并等待结果，进程池繁忙时返回503"""
+        try:
+            return password_hasher.verify(password, hashed_password)
+        except PasswordHasherBusy as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="当前请求较多，请稍后重试",
+                headers={"Retry-After": "1"}
+            ) from e
+    
+    @staticmethod
+    async def _ahash_password(password: str) -> str:
+        """在密码哈希进程池中计算哈希，进程池繁忙时返回503"""
+        try:
+            return await password_hasher.ahash(password)
+        except PasswordHasherBusy as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="当前请求较多，请稍后重试",
+                headers={"Retry-After": "1"}
+            ) from e
+    
+    @staticmethod
+    async def _averify_password(password: str, hashed_password: str) -> bool:
+        """在密码哈希进程池中校验密码，进程池繁忙时返回503"""
+        try:
+            return await password_hasher.averify(password, hashed_password)
+        except PasswordHasherBusy as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="当前请求较多，请稍后重试",
+                headers={"Retry-After": "1"}
+            ) from e
+    
     @staticmethod
     def get_user_by_email(db: Session, email: str) -> Optional[UserModel]:
         """通过邮箱获取用户"""
         return db.query(UserModel).filter(UserModel.email == email).first()
     
+    @staticmethod
+    async def aget_user_by_email(db: AsyncSession, email: str) -> Optional[UserModel]:
+        """异步通过邮箱获取用户"""
+        result = await db.execute(select(UserModel).where(UserModel.email == email))
+        return result.scalars().first()
+    
     @staticmethod
     def get_user_by_username(db: Session, username: str) -> Optional[UserModel]:
         """通过用户名获取用户"""
         return db.query(UserModel).filter(UserModel.username == username).first()
     
+    @staticmethod
+    async def aget_user_by_username(db: AsyncSession, username: str) -> Optional[UserModel]:
+        """异步通过用户名获取用户"""
+        result = await db.execute(select(UserModel).where(UserModel.username == username))
+        return result.scalars().first()
+    
     @staticmethod
     def get_user_by_id(db: Session, user_id: int) -> Optional[UserModel]:
         """通过ID获取用户"""
         return db.query(UserModel).filter(UserModel.id == user_id).first()
     
+    @staticmethod
+    async def aget_user_by_id(db: AsyncSession, user_id: int) -> Optional[UserModel]:
+        """异步通过ID获取用户"""
+        return await db.get(UserModel, user_id)
+    
     @staticmethod
     def create_user(db: Session, user_create: UserCreate) -> UserModel:
         """创建用户"""
@@ -45,7 +114,7 @@ class UserService:
             )
         
         # 创建新用户
-        hashed_password = get_password_hash(user_create.password)
+        hashed_password = UserService._hash_password(user_create.password)
         db_user = UserModel(
             username=user_create.username,
             email=user_create.email,
@@ -56,6 +125,31 @@ class UserService:
         db.refresh(db_user)
         return db_user
     
+    @staticmethod
+    async def acreate_user(db: AsyncSession, user_create: UserCreate) -> UserModel:
+        """异步创建用户（密码哈希在专用进程池中计算，不阻塞事件循环）"""
+        if await UserService.aget_user_by_email(db, user_create.email):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="邮箱已被注册"
+            )
+        if await UserService.aget_user_by_username(db, user_create.username):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="用户名已被使用"
+            )
+        
+        hashed_password = await UserService._ahash_password(user_create.password)
+        db_user = UserModel(
+            username=user_create.username,
+            email=user_create.email,
+            password_hash=hashed_password
+        )
+        db.add(db_user)
+        await db.commit()
+        await db.refresh(db_user)
+        return db_user
+    
     @staticmethod
     def authenticate_user(db: Session, email_or_username: str, password: str) -> Optional[UserModel]:
         """验证用户，支持邮箱或用户名登录"""
@@ -67,7 +161,20 @@ class UserService:
         
         if not user:
             return None
-        if not verify_password(password, user.password_hash):
+        if not UserService._verify_password(password, user.password_hash):
+            return None
+        return user
+    
+    @staticmethod
+    async def aauthenticate_user(db: AsyncSession, email_or_username: str, password: str) -> Optional[UserModel]:
+        """异步验证用户，支持邮箱或用户名登录（密码校验在专用进程池中执行）"""
+        user = await UserService.aget_user_by_email(db, email_or_username)
+        if not user:
+            user = await UserService.aget_user_by_username(db, email_or_username)
+        
+        if not user:
+            return None
+        if not await UserService._averify_password(password, user.password_hash):
             return None
         return user
     
@@ -103,12 +210,61 @@ class UserService:
             user.email = user_update.email
         
         if user_update.password:
-            user.password_hash = get_password_hash(user_update.password)
+            user.password_hash = UserService._hash_password(user_update.password)
         
         db.commit()
         db.refresh(user)
+        # 使认证缓存中的旧用户快照失效
+        principal_cache.invalidate_user(user_id)
         return user
     
+    @staticmethod
+    async def aupdate_user(db: AsyncSession, user_id: int, user_update: UserUpdate) -> UserModel:
+        """异步更新用户信息"""
+        user = await UserService.aget_user_by_id(db, user_id)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="用户不存在"
+            )
+        
+        if user_update.username:
+            existing_user = await UserService.aget_user_by_username(db, user_update.username)
+            if existing_user and existing_user.id != user_id:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="用户名已被使用"
+                )
+            user.username = user_update.username
+        
+        if user_update.email:
+            existing_user = await UserService.aget_user_by_email(db, user_update.email)
+            if existing_user and existing_user.id != user_id:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="邮箱已被注册"
+                )
+            user.email = user_update.email
+        
+        if user_update.password:
+            user.password_hash = await UserService._ahash_password(user_update.password)
+        
+        await db.commit()
+        await db.refresh(user)
+        principal_cache.invalidate_user(user_id)
+        return user
+    
+    @staticmethod
+    def _validate_settings(settings: Dict[str, Any]) -> None:
+        """校验用户设置中的生成参数，无效时返回400"""
+        try:
+            validate_llm_settings(settings)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    
     @staticmethod
     def get_user_settings(db: Session, user_id: int) -> Dict[str, Any]:
         """
@@ -120,12 +276,23 @@ class UserService:
             return user_settings.settings
         return {}
     
+    @staticmethod
+    async def aget_user_settings(db: AsyncSession, user_id: int) -> Dict[str, Any]:
+        """异步获取用户设置"""
+        result = await db.execute(select(UserSettingsModel).where(UserSettingsModel.user_id == user_id))
+        user_settings = result.scalars().first()
+        if user_settings:
+            return user_settings.settings
+        return {}
+    
     @staticmethod
     def update_user_settings(db: Session, user_id: int, settings: Dict[str, Any]) -> Dict[str, Any]:
         """
         更新用户设置
-        如果用户没有设置记录，则创建新记录
+        如果用户没有设置记录，则创建新记录；其中的生成参数（settings["llm"]）必须有效
         """
+        UserService._validate_settings(settings)
+        
         # 验证用户是否存在
         user = UserService.get_user_by_id(db, user_id)
         if not user:
@@ -144,6 +311,32 @@ class UserService:
         
         db.commit()
         db.refresh(user_settings)
+        # 使缓存的生成参数失效
+        llm_profiles.invalidate(user_id)
+        return user_settings.settings
+    
+    @staticmethod
+    async def aupdate_user_settings(db: AsyncSession, user_id: int, settings: Dict[str, Any]) -> Dict[str, Any]:
+        """异步更新用户设置"""
+        UserService._validate_settings(settings)
+        user = await UserService.aget_user_by_id(db, user_id)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="用户不存在"
+            )
+        
+        result = await db.execute(select(UserSettingsModel).where(UserSettingsModel.user_id == user_id))
+        user_settings = result.scalars().first()
+        if not user_settings:
+            user_settings = UserSettingsModel(user_id=user_id, settings=settings)
+            db.add(user_settings)
+        else:
+            user_settings.settings = settings
+        
+        await db.commit()
+        await db.refresh(user_settings)
+        llm_profiles.invalidate(user_id)
         return user_settings.settings
 
 
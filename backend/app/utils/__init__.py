@@ -10,6 +10,12 @@ from .message import (
     generate_system_prompt,
     extract_conversation_title
 )
+from .sse import (
+    SSEDecoder,
+    ChatStreamParser,
+    StreamDelta,
+    parse_chat_chunk
+)
 
 __all__ = [
     "create_access_token",
@@ -19,5 +25,9 @@ __all__ = [
     "get_password_hash",
     "format_messages_for_llm",
     "generate_system_prompt",
-    "extract_conversation_title"
+    "extract_conversation_title",
+    "SSEDecoder",
+    "ChatStreamParser",
+    "StreamDelta",
+    "parse_chat_chunk"
 ]
\ No newline at end of file
@@ -88,12 +88,13 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 
-def get_password_hash(password: str) -> str:
+def get_password_hash(password: str, rounds: Optional[int] = None) -> str:
     """
     获取密码哈希
     
     Args:
         password: 明文密码
+        rounds: bcrypt成本因子，默认为BCRYPT_ROUNDS
     
     Returns:
         哈希密码
@@ -101,6 +102,6 @@ def get_password_hash(password: str) -> str:
     # 处理bcrypt密码长度限制 - 最多72字节
     if len(password.encode('utf-8')) > 72:
         password = password[:72]
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds or settings.BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
\ No newline at end of file
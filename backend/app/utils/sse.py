@@ -0,0 +1,165 @@
+import json
+from json.decoder import scanstring
+from typing import Any, Dict, List, NamedTuple, Optional
+
+_DONE = b"[DONE]"
+_DELTA_CONTENT_KEY = b'"delta":{"content":"'
+_FINISH_NULL = b'"finish_reason":null'
+
+
+class StreamDelta(NamedTuple):
+    """流式响应中的一个数据块"""
+    content: Optional[str] = None
+    finish_reason: Optional[str] = None
+    usage: Optional[Dict[str, Any]] = None
+
+
+class SSEDecoder:
+    """
+    增量Server-Sent Events解码器
+
+    直接在原始字节上工作，不逐行解码为字符串。支持一个事件被拆分到
+    多次网络读取中、一个事件包含多行data字段（按规范以换行拼接），
+    忽略注释行和其他字段。
+    """
+
+    def __init__(self):
+        self._pending: List[bytes] = []
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """
+        输入一段网络数据，返回其中已完整的事件的data内容
+
+        Args:
+            chunk: 原始字节数据
+
+        Returns:
+            完整事件的data字段列表
+        """
+        # 不含换行的数据不可能结束事件，先暂存，避免反复拼接
+        if b"\n" not in chunk:
+            self._pending.append(chunk)
+            return []
+        if self._pending:
+            self._pending.append(chunk)
+            chunk = b"".join(self._pending)
+        if b"\r" in chunk:
+            chunk = chunk.replace(b"\r\n", b"\n")
+
+        # 事件以空行分隔，最后一段可能不完整，留到下次
+        blocks = chunk.split(b"\n\n")
+        tail = blocks.pop()
+        self._pending = [tail] if tail else []
+
+        events: List[bytes] = []
+        for block in blocks:
+            # 快速路径：单行data事件
+            if block.startswith(b"data:") and b"\n" not in block:
+                events.append(block[6:] if block[5:6] == b" " else block[5:])
+                continue
+
+            data_lines = []
+            for line in block.split(b"\n"):
+                if line.startswith(b"data:"):
+                    data_lines.append(line[6:] if line[5:6] == b" " else line[5:])
+                # 注释行（以冒号开头）和event/id/retry字段直接跳过
+            if data_lines:
+                events.append(b"\n".join(data_lines))
+        return events
+
+    def flush(self) -> List[bytes]:
+        """流结束时调用，返回缺少结尾空行的最后一个事件"""
+        if not b"".join(self._pending).strip():
+            self._pending = []
+            return []
+        events = self.feed(b"\n\n")
+        self._pending = []
+        return events
+
+
+def _read_json_string(data: bytes, start: int) -> str:
+    """读取从start开始（引号之后）的JSON字符串，无转义时直接解码"""
+    end = data.find(b'"', start)
+    if end >= 0:
+        raw = data[start:end]
+        if b"\\" not in raw:
+            return raw.decode("utf-8")
+    # 含转义字符时交给json的C实现扫描字符串
+    return scanstring(data[start:].decode("utf-8"), 0)[0]
+
+
+def parse_chat_chunk(data: bytes) -> StreamDelta:
+    """
+    解析一个chat.completion.chunk数据块
+
+    常见的 choices[0].delta.content 形状（紧凑JSON、未结束）走快速路径，
+    只定位并解码content字段，不做完整JSON解析；其他情况（首个role块、
+    结束块、usage块等）回退到json.loads。
+
+    Args:
+        data: 事件的data字段
+
+    Returns:
+        解析出的数据块
+    """
+    content_start = data.find(_DELTA_CONTENT_KEY)
+    if content_start >= 0 and _FINISH_NULL in data:
+        content = _read_json_string(data, content_start + len(_DELTA_CONTENT_KEY))
+        return StreamDelta(content=content or None)
+
+    # 慢速路径：完整解析JSON
+    chunk = json.loads(data)
+    content = None
+    finish_reason = None
+    choices = chunk.get("choices")
+    if choices:
+        choice = choices[0]
+        content = (choice.get("delta") or {}).get("content") or None
+        finish_reason = choice.get("finish_reason")
+    return StreamDelta(content=content, finish_reason=finish_reason, usage=chunk.get("usage"))
+
+
+class ChatStreamParser:
+    """
+    Deepseek/OpenAI兼容的流式响应解析器
+
+    组合SSEDecoder和parse_chat_chunk，输入原始字节，输出数据块；
+    遇到[DONE]或finish_reason后将done置为True。
+    """
+
+    def __init__(self):
+        self.decoder = SSEDecoder()
+        self.done = False
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[Dict[str, Any]] = None
+        self.errors = 0
+
+    def _parse_events(self, events: List[bytes]) -> List[StreamDelta]:
+        deltas: List[StreamDelta] = []
+        for data in events:
+            if self.done:
+                break
+            if data == _DONE:
+                self.done = True
+                break
+            try:
+                delta = parse_chat_chunk(data)
+            except (ValueError, AttributeError, IndexError, TypeError):
+                # 单个数据块解析失败不影响整个流
+                self.errors += 1
+                continue
+            if delta.usage:
+                self.usage = delta.usage
+            if delta.finish_reason:
+                self.finish_reason = delta.finish_reason
+                self.done = True
+            deltas.append(delta)
+        return deltas
+
+    def feed(self, chunk: bytes) -> List[StreamDelta]:
+        """输入一段网络数据，返回解析出的数据块"""
+        return self._parse_events(self.decoder.feed(chunk))
+
+    def flush(self) -> List[StreamDelta]:
+        """流结束时调用，解析剩余数据"""
+        return self._parse_events(self.decoder.flush())
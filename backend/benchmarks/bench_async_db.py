@@ -0,0 +1,175 @@
+"""
+异步数据库层并发延迟基准测试
+
+在临时SQLite数据库上用并发协程模拟两类请求：
+- read: 查询当前用户、读取一页对话列表和一页消息（侧边栏和对话详情）
+- write: 查询当前用户、读取一页对话列表、写入一条消息（发送消息）
+
+比较三种数据库访问方式：
+- blocking: 在协程中直接使用同步Session（原get_current_user依赖的做法），查询阻塞事件循环
+- threadpool: 同步Session放到线程池中执行（原路由的做法），受线程池大小限制
+- async: AsyncSession（aiosqlite），事件循环不阻塞
+
+同时运行一个心跳协程（每5ms唤醒一次），记录事件循环的最大延迟；
+SQLite写锁等待超过busy_timeout的请求记为locked错误。
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_async_db
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from app.database.engine import create_async_db_engine, create_db_engine
+from app.database.session import Base
+from app.models.conversation import Conversation  # noqa: F401 注册模型
+from app.models.message import Message  # noqa: F401
+from app.models.user import User  # noqa: F401
+from app.models.user_settings import UserSettings  # noqa: F401
+from app.services.chat import ChatService
+from app.services.history_cache import history_cache
+from app.services.user_service import user_service
+
+USERS = 50
+CONVERSATIONS_PER_USER = 40
+REQUESTS = 2000
+HEARTBEAT_INTERVAL = 0.005
+
+
+def populate(engine) -> None:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO users (id, username, email, password_hash, is_active) VALUES (:id, :name, :email, 'x', 1)"),
+            [{"id": i, "name": f"user{i}", "email": f"user{i}@example.com"} for i in range(1, USERS + 1)]
+        )
+        conn.execute(
+            text("INSERT INTO conversations (user_id, title, updated_at) VALUES (:uid, '对话', CURRENT_TIMESTAMP)"),
+            [{"uid": uid} for uid in range(1, USERS + 1) for _ in range(CONVERSATIONS_PER_USER)]
+        )
+
+
+def _sync_request(db, user_id: int, conversation_id: int, write: bool) -> None:
+    user_service.get_user_by_id(db, user_id)
+    ChatService.get_conversations(db, user_id, limit=20)
+    if write:
+        ChatService.add_message(db, conversation_id, "user", "你好，请介绍一下自己" * 5)
+    else:
+        ChatService.get_conversation_messages(db, conversation_id, limit=20)
+
+
+def blocking_handler(session_factory, write: bool):
+    async def handle(user_id: int, conversation_id: int) -> None:
+        db = session_factory()
+        try:
+            _sync_request(db, user_id, conversation_id, write)
+        finally:
+            db.close()
+    return handle
+
+
+def threadpool_handler(session_factory, write: bool):
+    def work(user_id: int, conversation_id: int) -> None:
+        db = session_factory()
+        try:
+            _sync_request(db, user_id, conversation_id, write)
+        finally:
+            db.close()
+
+    async def handle(user_id: int, conversation_id: int) -> None:
+        await run_in_threadpool(work, user_id, conversation_id)
+    return handle
+
+
+def async_handler(session_factory, write: bool):
+    async def handle(user_id: int, conversation_id: int) -> None:
+        async with session_factory() as db:
+            await user_service.aget_user_by_id(db, user_id)
+            await ChatService.aget_conversations(db, user_id, limit=20)
+            if write:
+                await ChatService.aadd_message(db, conversation_id, "user", "你好，请介绍一下自己" * 5)
+            else:
+                await ChatService.aget_conversation_messages(db, conversation_id, limit=20)
+    return handle
+
+
+async def run(handle, concurrency: int) -> dict:
+    latencies = []
+    locked = 0
+    max_lag = 0.0
+    stop = asyncio.Event()
+
+    async def heartbeat():
+        nonlocal max_lag
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            max_lag = max(max_lag, time.perf_counter() - start - HEARTBEAT_INTERVAL)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(i: int):
+        async with semaphore:
+            user_id = i % USERS + 1
+            conversation_id = (user_id - 1) * CONVERSATIONS_PER_USER + i % CONVERSATIONS_PER_USER + 1
+            start = time.perf_counter()
+            try:
+                await handle(user_id, conversation_id)
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                nonlocal locked
+                locked += 1
+            latencies.append(time.perf_counter() - start)
+
+    ticker = asyncio.create_task(heartbeat())
+    start = time.perf_counter()
+    await asyncio.gather(*(request(i) for i in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+
+    latencies.sort()
+    return {
+        "rps": REQUESTS / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "max_lag": max_lag * 1000,
+        "locked": locked,
+    }
+
+
+async def main():
+    # 只测数据库访问，不使用对话历史缓存
+    history_cache.enabled = False
+    for workload in ("read", "write"):
+        for concurrency in (10, 100):
+            print(f"\n{workload}, concurrency {concurrency}, {REQUESTS} requests")
+            for name, make_handler in (("blocking", blocking_handler), ("threadpool", threadpool_handler),
+                                       ("async", async_handler)):
+                with tempfile.TemporaryDirectory() as tmp:
+                    url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+                    engine = create_db_engine(url)
+                    populate(engine)
+                    async_engine = create_async_db_engine(url)
+                    if name == "async":
+                        factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+                    else:
+                        factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                    result = await run(make_handler(factory, workload == "write"), concurrency)
+                    await async_engine.dispose()
+                    engine.dispose()
+                print(f"{name:<11} {result['rps']:8.1f} req/s  p50 {result['p50']:7.2f} ms  "
+                      f"p99 {result['p99']:8.2f} ms  max loop lag {result['max_lag']:8.2f} ms  locked {result['locked']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""
+认证开销基准测试
+
+在临时SQLite数据库中创建用户和访问令牌，分别在关闭和开启认证主体缓存时测量:
+- 认证依赖（get_current_active_user）单次调用的延迟和每次请求的SQL查询数
+- 通过ASGI调用GET /api/user/me（只做认证并返回用户信息）的吞吐量和延迟
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_auth
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.api import deps
+from app.database.engine import create_async_db_engine, create_db_engine
+from app.database.routing import get_async_read_db
+from app.database.session import Base
+from app.main import app
+from app.models.conversation import Conversation  # noqa: F401 注册模型
+from app.models.message import Message  # noqa: F401
+from app.models.user import User  # noqa: F401
+from app.models.user_settings import UserSettings  # noqa: F401
+from app.services.principal_cache import principal_cache
+from app.utils.auth import create_access_token
+
+USERS = 100
+CALLS = 5000
+REQUESTS = 5000
+CONCURRENCY = 50
+
+
+def populate(path: str) -> None:
+    engine = create_db_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO users (id, username, email, password_hash, is_active) VALUES (:id, :name, :email, 'x', 1)"),
+            [{"id": i, "name": f"user{i}", "email": f"user{i}@example.com"} for i in range(1, USERS + 1)]
+        )
+    engine.dispose()
+
+
+async def dependency_latency(factory, tokens, queries) -> dict:
+    """直接调用认证依赖（每次使用新的会话，与请求中相同）"""
+    latencies = []
+    queries[0] = 0
+    for i in range(CALLS):
+        start = time.perf_counter()
+        async with factory() as db:
+            user = await deps.get_current_user(tokens[i % USERS], db)
+            await deps.get_current_active_user(user)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies) * 1e6,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1e6,
+        "queries": queries[0] / CALLS,
+    }
+
+
+async def endpoint_load(tokens) -> dict:
+    latencies = []
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def request(i: int):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get("/api/user/me", headers={"Authorization": f"Bearer {tokens[i % USERS]}"})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(request(i) for i in range(REQUESTS)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": REQUESTS / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+async def run(path: str) -> None:
+    engine = create_async_db_engine(f"sqlite:///{path}")
+    factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    queries = [0]
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count_query(*args):
+        queries[0] += 1
+
+    async def read_db():
+        async with factory() as db:
+            yield db
+
+    app.dependency_overrides[get_async_read_db] = read_db
+    tokens = [create_access_token({"sub": str(i), "username": f"user{i}"}) for i in range(1, USERS + 1)]
+
+    for enabled in (False, True):
+        principal_cache.enabled = enabled
+        principal_cache.clear()
+        dep = await dependency_latency(factory, tokens, queries)
+        load = await endpoint_load(tokens)
+        name = "cached" if enabled else "uncached"
+        print(f"{name:9} auth dependency p50 {dep['p50']:7.1f} us  p99 {dep['p99']:7.1f} us  "
+              f"{dep['queries']:.2f} queries/call   "
+              f"GET /api/user/me {load['rps']:7.1f} req/s  p50 {load['p50']:6.2f} ms  p99 {load['p99']:6.2f} ms")
+
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        populate(path)
+        asyncio.run(run(path))
+
+
+if __name__ == "__main__":
+    main()
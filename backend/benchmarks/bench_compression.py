@@ -0,0 +1,201 @@
+"""
+消息压缩和冷归档基准测试
+
+在临时SQLite数据库中生成模拟对话（中文问题、带固定句式和代码块的回答），分别以
+不压缩、zlib、zlib+字典、zstd、zstd+字典保存消息，报告VACUUM后的数据库文件大小（包含
+全文索引）和读取一页消息的延迟；然后归档全部对话，报告归档后的文件大小和恢复一个对话的延迟。
+另外对比全文索引保存原文副本（旧的表结构）和无内容表时索引占用的空间。
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_compression
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.database.compression import compress_existing, message_codec
+from app.database.engine import create_db_engine
+from app.database.session import Base
+from app.models.archive import ArchivedConversation, CompressionDictionary  # noqa: F401 注册模型
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.models.user import User  # noqa: F401
+from app.models.user_settings import UserSettings  # noqa: F401
+from app.services.archive import ConversationArchiver
+from app.services.history_cache import history_cache
+from app.services.search import FTS_TABLE, search_index, segment
+
+USERS = 10
+CONVERSATIONS_PER_USER = 50
+MESSAGES_PER_CONVERSATION = 60
+PAGE_SIZE = 50
+RUNS = 200
+RESTORES = 50
+
+MODES = [("none", False), ("zlib", False), ("zlib", True), ("zstd", False), ("zstd", True)]
+
+CHARS = [chr(code) for code in range(0x4E00, 0x4E00 + 2500)]
+OPENINGS = ["好的，下面详细解释一下这个问题。", "这是一个很常见的问题，主要有以下几个原因：",
+            "可以按照下面的步骤来处理：", "简单来说，答案取决于具体的使用场景。"]
+CLOSINGS = ["希望这些信息对你有帮助！如果还有其他问题，欢迎继续提问。",
+            "如果需要更详细的示例代码，请告诉我。", "总结一下：先确认需求，再选择合适的方案。"]
+CODE = ["```python\nimport os\n\ndef main():\n    path = os.path.join(base_dir, name)\n    with open(path, encoding=\"utf-8\") as f:\n        return f.read()\n```\n",
+        "```sql\nSELECT id, title, updated_at FROM conversations WHERE user_id = ? ORDER BY updated_at DESC LIMIT 20;\n```\n"]
+
+
+def sentence(rng: random.Random, words) -> str:
+    return "".join(rng.choices(words, k=rng.randint(6, 16))) + rng.choice("，。；")
+
+
+def make_message(rng: random.Random, words, role: str) -> str:
+    if role == "user":
+        return "".join(sentence(rng, words) for _ in range(rng.randint(1, 3))) + "？"
+    parts = [rng.choice(OPENINGS)]
+    for i in range(rng.randint(2, 6)):
+        parts.append(f"\n{i + 1}. **{''.join(rng.choices(words, k=2))}**：{sentence(rng, words)}{sentence(rng, words)}")
+    if rng.random() < 0.4:
+        parts.append("\n" + rng.choice(CODE))
+    parts.append("\n" + rng.choice(CLOSINGS))
+    return "".join(parts)
+
+
+def populate(engine, rng: random.Random) -> None:
+    words = ["".join(rng.choice(CHARS) for _ in range(rng.choice((1, 2, 2, 3)))) for _ in range(3000)]
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO users (id, username, email, password_hash, is_active) VALUES (:id, :name, :email, 'x', 1)"),
+            [{"id": i, "name": f"user{i}", "email": f"user{i}@example.com"} for i in range(1, USERS + 1)]
+        )
+        conn.execute(
+            text("INSERT INTO conversations (user_id, title, updated_at) VALUES (:uid, '对话', '2000-01-01 00:00:00')"),
+            [{"uid": uid} for uid in range(1, USERS + 1) for _ in range(CONVERSATIONS_PER_USER)]
+        )
+        for cid in range(1, USERS * CONVERSATIONS_PER_USER + 1):
+            conn.execute(
+                text("INSERT INTO messages (conversation_id, role, content, token_count) VALUES (:cid, :role, :content, 50)"),
+                [{"cid": cid, "role": role, "content": make_message(rng, words, role)}
+                 for role in ("user", "assistant") * (MESSAGES_PER_CONVERSATION // 2)]
+            )
+        search_index.populate(conn)
+
+
+def index_size(engine) -> float:
+    """全文索引占用的空间（MiB）"""
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name LIKE :name"), {"name": f"{FTS_TABLE}%"}
+        ).scalar() / 2**20
+
+
+def stored_content_index_size(path: str) -> float:
+    """索引同时保存原文副本（之前的表结构）时占用的空间（MiB）"""
+    engine = create_db_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {FTS_TABLE}"))
+        conn.execute(text(f"CREATE VIRTUAL TABLE {FTS_TABLE} "
+                          "USING fts5(scope, content, tokenize='unicode61 remove_diacritics 2')"))
+        rows = conn.execute(text("SELECT m.id, c.user_id, m.conversation_id, m.content FROM messages m "
+                                 "JOIN conversations c ON c.id = m.conversation_id")).all()
+        conn.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, scope, content) VALUES (:id, :scope, :content)"),
+                     [{"id": mid, "scope": f"u{uid} c{cid}", "content": segment(content)} for mid, uid, cid, content in rows])
+    vacuum(engine)
+    size = index_size(engine)
+    engine.dispose()
+    return size
+
+
+def vacuum(engine) -> float:
+    """VACUUM后的数据库文件大小（MiB）"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        conn.execute(text("VACUUM"))
+        return conn.execute(text("PRAGMA page_count")).scalar() * conn.execute(text("PRAGMA page_size")).scalar() / 2**20
+
+
+def read_latency(engine, rng: random.Random) -> dict:
+    """读取一页最新消息（解压全部内容）的延迟"""
+    db = sessionmaker(bind=engine)()
+    conversations = USERS * CONVERSATIONS_PER_USER
+    latencies = []
+    for _ in range(RUNS):
+        cid = rng.randint(1, conversations)
+        start = time.perf_counter()
+        messages = (db.query(Message).filter(Message.conversation_id == cid)
+                    .order_by(Message.created_at.desc(), Message.id.desc()).limit(PAGE_SIZE).all())
+        sum(len(message.content) for message in messages)
+        latencies.append(time.perf_counter() - start)
+        db.rollback()
+    db.close()
+    latencies.sort()
+    return {"p50": statistics.median(latencies) * 1000, "p99": latencies[int(len(latencies) * 0.99)] * 1000}
+
+
+def run(path: str, algorithm: str, dictionary: bool, rng: random.Random) -> None:
+    engine = create_db_engine(f"sqlite:///{path}")
+    message_codec.algorithm = algorithm
+    message_codec.bind(engine)
+    if dictionary:
+        message_codec.train(engine, algorithm)
+    compress_existing(engine)
+    size = vacuum(engine)
+    fts_size = index_size(engine)
+    read = read_latency(engine, rng)
+
+    archiver = ConversationArchiver()
+    db = sessionmaker(bind=engine)()
+    start = time.perf_counter()
+    result = archiver.archive_idle(db)
+    archive_seconds = time.perf_counter() - start
+    archived_size = vacuum(engine)
+    archived_fts_size = index_size(engine)
+    latencies = []
+    for cid in rng.sample(range(1, USERS * CONVERSATIONS_PER_USER + 1), RESTORES):
+        start = time.perf_counter()
+        archiver.restore(db, cid)
+        latencies.append(time.perf_counter() - start)
+    db.close()
+    engine.dispose()
+
+    name = algorithm + ("+dict" if dictionary else "")
+    print(f"{name:10} db {size:7.1f} MiB (index {fts_size:.1f})  page read p50 {read['p50']:6.2f} ms p99 {read['p99']:6.2f} ms  "
+          f"archived {archived_size:6.1f} MiB (index {archived_fts_size:.1f}, {result.conversations} conversations in {archive_seconds:.1f}s)  "
+          f"restore p50 {statistics.median(latencies) * 1000:6.2f} ms")
+
+
+def main():
+    history_cache.enabled = False
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        engine = create_db_engine(f"sqlite:///{template}")
+        populate(engine, random.Random(42))
+        with engine.connect() as conn:
+            text_bytes = conn.execute(text("SELECT sum(length(CAST(content AS BLOB))) FROM messages")).scalar()
+        engine.dispose()
+        messages = USERS * CONVERSATIONS_PER_USER * MESSAGES_PER_CONVERSATION
+        print(f"{messages} messages, {text_bytes / 2**20:.1f} MiB of content, avg {text_bytes / messages:.0f} bytes")
+        copy = os.path.join(tmp, "stored-content.db")
+        with open(template, "rb") as src, open(copy, "wb") as dst:
+            dst.write(src.read())
+        engine = create_db_engine(f"sqlite:///{template}")
+        vacuum(engine)
+        print(f"full-text index: contentless {index_size(engine):.1f} MiB, "
+              f"with stored content {stored_content_index_size(copy):.1f} MiB\n")
+        engine.dispose()
+        os.remove(copy)
+
+        for algorithm, dictionary in MODES:
+            path = os.path.join(tmp, f"{algorithm}-{dictionary}.db")
+            with open(template, "rb") as src, open(path, "wb") as dst:
+                dst.write(src.read())
+            run(path, algorithm, dictionary, random.Random(7))
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
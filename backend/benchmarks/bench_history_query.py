@@ -0,0 +1,91 @@
+"""
+历史消息加载延迟基准测试
+
+在临时SQLite数据库中构造不同规模的messages表，测量迁移（组合索引）前后
+以下查询的延迟：
+- detail: 加载一个对话的全部消息（conversation_id过滤，created_at排序）
+- history: 对话历史的一页（conversation_id过滤，id倒序，LIMIT 50）
+- list: 用户的对话列表（user_id过滤，updated_at倒序）
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_history_query
+"""
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, text
+
+from app.database.migrations import migrate
+
+# 迁移前的表结构（只有主键索引）
+BASELINE_DDL = [
+    "CREATE TABLE conversations (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, title VARCHAR NOT NULL, "
+    "created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME)",
+    "CREATE INDEX ix_conversations_id ON conversations (id)",
+    "CREATE TABLE messages (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL, role VARCHAR NOT NULL, "
+    "content TEXT NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, token_count INTEGER)",
+    "CREATE INDEX ix_messages_id ON messages (id)",
+]
+
+QUERIES = {
+    "detail": "SELECT id, role, content, created_at FROM messages WHERE conversation_id = :cid ORDER BY created_at ASC",
+    "history": "SELECT id, role, content, token_count FROM messages WHERE conversation_id = :cid ORDER BY id DESC LIMIT 50",
+    "list": "SELECT id, title, updated_at FROM conversations WHERE user_id = :uid ORDER BY updated_at DESC",
+}
+
+USERS = 100
+CONVERSATIONS = 2000
+
+
+def populate(engine, message_count: int) -> None:
+    """随机交错写入消息，模拟多个对话同时进行"""
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        for statement in BASELINE_DDL:
+            conn.execute(text(statement))
+        conn.execute(
+            text("INSERT INTO conversations (id, user_id, title, updated_at) VALUES (:id, :uid, :title, :updated_at)"),
+            [{"id": i, "uid": i % USERS + 1, "title": f"对话{i}", "updated_at": f"2026-01-01 00:{i % 60:02d}:00"}
+             for i in range(1, CONVERSATIONS + 1)]
+        )
+        conn.execute(
+            text("INSERT INTO messages (conversation_id, role, content, created_at, token_count) "
+                 "VALUES (:cid, :role, :content, :created_at, 10)"),
+            [{"cid": rng.randint(1, CONVERSATIONS), "role": "user" if i % 2 else "assistant",
+              "content": "消息内容" * 8, "created_at": f"2026-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}"}
+             for i in range(message_count)]
+        )
+
+
+def bench(engine, sql: str, rounds: int) -> float:
+    """返回每次查询的平均延迟（毫秒）"""
+    rng = random.Random(7)
+    with engine.connect() as conn:
+        statement = text(sql)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            conn.execute(statement, {"cid": rng.randint(1, CONVERSATIONS), "uid": rng.randint(1, USERS)}).fetchall()
+        return (time.perf_counter() - start) / rounds * 1000
+
+
+def main():
+    rounds = 200
+    for message_count in (10_000, 100_000, 500_000):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            populate(engine, message_count)
+            before = {name: bench(engine, sql, rounds) for name, sql in QUERIES.items()}
+            migrate(engine)
+            after = {name: bench(engine, sql, rounds) for name, sql in QUERIES.items()}
+            engine.dispose()
+
+        print(f"\n{message_count} messages, {CONVERSATIONS} conversations")
+        for name in QUERIES:
+            print(f"{name:<8} before {before[name]:8.3f} ms  after {after[name]:8.3f} ms  "
+                  f"speedup {before[name] / after[name]:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+用户生成参数解析开销基准测试
+
+在临时SQLite数据库中为用户保存生成参数设置，比较每轮对话获取生成参数的开销:
+- uncached: 每轮读取用户设置并校验、解析（不使用缓存）
+- cached: 使用llm_profiles缓存（只有第一次和设置修改后读取）
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_llm_profile
+"""
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.database.engine import create_async_db_engine, create_db_engine
+from app.database.session import Base
+from app.models.conversation import Conversation  # noqa: F401 注册模型
+from app.models.message import Message  # noqa: F401
+from app.models.user import User  # noqa: F401
+from app.models.user_settings import UserSettings
+from app.services.llm_profile import llm_profiles, resolve_profile
+
+USERS = 100
+TURNS = 5000
+
+
+def populate(path: str) -> None:
+    engine = create_db_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO users (id, username, email, password_hash, is_active) VALUES (:id, :name, :email, 'x', 1)"),
+            [{"id": i, "name": f"user{i}", "email": f"user{i}@example.com"} for i in range(1, USERS + 1)]
+        )
+        conn.execute(UserSettings.__table__.insert(), [
+            {"user_id": i, "settings": {"theme": "dark", "llm": {"max_tokens": 256, "temperature": 0.3,
+                                                                 "system_prompt": "请简短回答。"}}}
+            for i in range(1, USERS + 1)
+        ])
+    engine.dispose()
+
+
+async def uncached(db, user_id: int):
+    user_settings = (await db.execute(select(UserSettings.settings).where(UserSettings.user_id == user_id))).scalar()
+    return resolve_profile(user_settings)
+
+
+async def measure(factory, resolve) -> dict:
+    latencies = []
+    for i in range(TURNS):
+        async with factory() as db:
+            start = time.perf_counter()
+            profile = await resolve(db, i % USERS + 1)
+            latencies.append(time.perf_counter() - start)
+        assert profile.max_tokens == 256
+    latencies.sort()
+    return {"p50": statistics.median(latencies) * 1e6, "p99": latencies[int(len(latencies) * 0.99)] * 1e6}
+
+
+async def run(path: str) -> None:
+    engine = create_async_db_engine(f"sqlite:///{path}")
+    factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    for name, resolve in (("uncached", uncached), ("cached", llm_profiles.aget)):
+        llm_profiles.clear()
+        result = await measure(factory, resolve)
+        print(f"{name:9} profile per turn p50 {result['p50']:7.1f} us  p99 {result['p99']:7.1f} us")
+    print(f"\n{llm_profiles.stats()}")
+    await engine.dispose()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        populate(path)
+        asyncio.run(run(path))
+
+
+if __name__ == "__main__":
+    main()
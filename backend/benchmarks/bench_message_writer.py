@@ -0,0 +1,118 @@
+"""
+消息写入吞吐基准测试
+
+在临时SQLite数据库上用多个线程并发添加消息（每个线程一个会话，模拟并发请求），
+比较原来的逐条写入（每条消息commit + refresh）与MessageWriter合并提交的
+消息吞吐、单条写入延迟和平均每批消息数；分别在synchronous=NORMAL和FULL下测试。
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_message_writer
+"""
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+import app.services.chat as chat_module
+from app.core.config import settings
+from app.database.engine import create_db_engine
+from app.database.session import Base
+from app.models.user import User  # noqa: F401 注册模型
+from app.models.user_settings import UserSettings  # noqa: F401
+from app.services.chat import ChatService
+from app.services.history_cache import history_cache
+from app.services.message_writer import MessageWriter
+
+CONVERSATIONS = 100
+MESSAGES = 3000
+CONTENT = "你好，请介绍一下自己" * 5
+
+
+def populate(engine) -> None:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username, email, password_hash, is_active) "
+                          "VALUES (1, 'user', 'user@example.com', 'x', 1)"))
+        conn.execute(text("INSERT INTO conversations (user_id, title) VALUES (1, '对话')"),
+                     [{} for _ in range(CONVERSATIONS)])
+
+
+def run(session_factory, threads: int) -> dict:
+    latencies = []
+    locked = 0
+    lock = threading.Lock()
+    per_thread = MESSAGES // threads
+
+    def worker(seed: int) -> None:
+        nonlocal locked
+        db = session_factory()
+        local = []
+        errors = 0
+        try:
+            for i in range(per_thread):
+                start = time.perf_counter()
+                try:
+                    ChatService.add_message(db, (seed * per_thread + i) % CONVERSATIONS + 1, "user", CONTENT,
+                                            token_count=50)
+                except OperationalError as e:
+                    if "locked" not in str(e):
+                        raise
+                    db.rollback()
+                    errors += 1
+                local.append(time.perf_counter() - start)
+        finally:
+            db.close()
+        with lock:
+            latencies.extend(local)
+            locked += errors
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "mps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "locked": locked,
+    }
+
+
+def main():
+    # 只测写入，不维护对话历史缓存
+    history_cache.enabled = False
+    default_synchronous = settings.SQLITE_SYNCHRONOUS
+    for synchronous in ("NORMAL", "FULL"):
+        settings.SQLITE_SYNCHRONOUS = synchronous
+        for threads in (1, 16, 64):
+            print(f"\nsynchronous={synchronous}, {threads} threads, {MESSAGES} messages")
+            for name in ("commit+refresh", "group commit"):
+                with tempfile.TemporaryDirectory() as tmp:
+                    url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+                    engine = create_db_engine(url)
+                    populate(engine)
+                    writer = MessageWriter(url)
+                    writer.enabled = name == "group commit"
+                    chat_module.message_writer = writer
+                    result = run(sessionmaker(autocommit=False, autoflush=False, bind=engine), threads)
+                    stats = writer.stats()
+                    writer.close()
+                    engine.dispose()
+                batch = f"avg batch {stats['avg_batch']:6.1f}" if writer.enabled else ""
+                print(f"{name:<15} {result['mps']:8.1f} msg/s  p50 {result['p50']:7.2f} ms  "
+                      f"p99 {result['p99']:8.2f} ms  locked {result['locked']}  {batch}")
+    settings.SQLITE_SYNCHRONOUS = default_synchronous
+
+
+if __name__ == "__main__":
+    main()
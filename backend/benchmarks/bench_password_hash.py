@@ -0,0 +1,98 @@
+"""
+登录风暴基准测试
+
+模拟集中登录（LOGINS个并发的bcrypt密码校验），同时每隔PROBE_INTERVAL秒发起一次
+占用默认线程池的轻量调用（模拟聊天路由中的同步数据库查询），比较:
+- threadpool: 密码校验用run_in_threadpool放到默认线程池中（原做法）
+- process: 密码校验提交到专用的有界进程池（password_hasher）
+
+报告登录吞吐量和延迟、被拒绝（503）的登录数，以及轻量调用的延迟。
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_password_hash
+"""
+import asyncio
+import sqlite3
+import statistics
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from app.services.password_hasher import PasswordHasherBusy, password_hasher
+from app.utils.auth import get_password_hash, verify_password
+
+LOGINS = 200
+ROUNDS = 10
+PROBE_INTERVAL = 0.01
+PASSWORD = "correct horse battery staple"
+
+
+def probe_work(conn: sqlite3.Connection) -> None:
+    conn.execute("SELECT 1").fetchone()
+
+
+async def storm(mode: str, hashed: str) -> None:
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    login_latencies, probe_latencies = [], []
+    rejected = 0
+    done = asyncio.Event()
+
+    async def login():
+        nonlocal rejected
+        start = time.perf_counter()
+        try:
+            if mode == "threadpool":
+                ok = await run_in_threadpool(verify_password, PASSWORD, hashed)
+            else:
+                ok = await password_hasher.averify(PASSWORD, hashed)
+            assert ok
+            login_latencies.append(time.perf_counter() - start)
+        except PasswordHasherBusy:
+            rejected += 1
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await run_in_threadpool(probe_work, conn)
+            probe_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(PROBE_INTERVAL)
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+    conn.close()
+
+    login_latencies.sort()
+    probe_latencies.sort()
+    print(f"{mode:10} logins {len(login_latencies):3} ok {rejected:3} rejected in {elapsed:5.1f}s "
+          f"({len(login_latencies) / elapsed:5.1f}/s)  login p50 {statistics.median(login_latencies) * 1000:7.1f} ms  "
+          f"probe p50 {statistics.median(probe_latencies) * 1000:7.2f} ms  "
+          f"p99 {probe_latencies[int(len(probe_latencies) * 0.99)] * 1000:7.2f} ms  "
+          f"max {probe_latencies[-1] * 1000:7.2f} ms")
+
+
+async def run() -> None:
+    hashed = get_password_hash(PASSWORD, rounds=ROUNDS)
+    start = time.perf_counter()
+    verify_password(PASSWORD, hashed)
+    print(f"bcrypt rounds={ROUNDS}: one verify takes {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"{LOGINS} concurrent logins, {password_hasher.workers} hash workers, queue {password_hasher.max_queue}\n")
+
+    await storm("threadpool", hashed)
+    # 启动工作进程并等待其完成导入
+    password_hasher.start()
+    await asyncio.sleep(5)
+    await storm("process", hashed)
+    print(f"\n{password_hasher.stats()}")
+    password_hasher.close()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
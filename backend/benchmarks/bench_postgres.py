@@ -0,0 +1,212 @@
+"""
+PostgreSQL与SQLite对比基准测试
+
+用并发协程模拟聊天负载（每个请求查询当前用户、读取一页对话列表，然后一半请求写入一条消息、
+一半读取一页消息），比较SQLite（aiosqlite）和PostgreSQL（asyncpg）的吞吐量和延迟；
+并比较导出/导入全部消息的耗时（PostgreSQL使用COPY，SQLite逐批读写CSV），
+以及流式读取一个长对话全部历史的耗时。
+
+PostgreSQL的来源（按顺序）:
+- 环境变量POSTGRES_BENCH_URL（如postgresql://postgres@localhost:5432/postgres），
+  测试在其中新建并删除一个临时数据库
+- PATH或环境变量PG_BIN目录中的initdb/pg_ctl：在临时目录中初始化并启动一个本地实例
+  （以root运行时用nobody用户启动，PostgreSQL不允许以root运行）
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_postgres
+"""
+import asyncio
+import os
+import pwd
+import shutil
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+import app.services.chat as chat_module
+from app.database.bulk_copy import export_tables, import_tables
+from app.database.engine import create_async_db_engine, create_db_engine
+from app.database.session import Base
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.models.user import User
+from app.services.chat import ChatService
+from app.services.history_cache import history_cache, iter_history_from_db
+from app.services.message_writer import MessageWriter
+from app.services.user_service import user_service
+
+USERS = 50
+CONVERSATIONS_PER_USER = 40
+MESSAGES = 100_000
+LONG_CONVERSATION_MESSAGES = 10_000
+REQUESTS = 2000
+CONTENT = "你好，请介绍一下自己。" * 10
+
+
+@contextmanager
+def local_postgres():
+    """返回一个可用的PostgreSQL服务器URL（见模块说明），没有可用的PostgreSQL时返回None"""
+    url = os.getenv("POSTGRES_BENCH_URL")
+    if url:
+        yield url
+        return
+    bin_dir = os.getenv("PG_BIN") or os.path.dirname(shutil.which("initdb") or "")
+    if not bin_dir:
+        yield None
+        return
+    # PostgreSQL拒绝以root运行，root时切换到nobody用户
+    run_as = {}
+    if os.geteuid() == 0:
+        nobody = pwd.getpwnam("nobody")
+        run_as = {"user": nobody.pw_uid, "group": nobody.pw_gid}
+    with tempfile.TemporaryDirectory() as tmp:
+        if run_as:
+            os.chown(tmp, run_as["user"], run_as["group"])
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        data = os.path.join(tmp, "data")
+        subprocess.run([os.path.join(bin_dir, "initdb"), "-D", data, "-U", "postgres", "--auth=trust", "-E", "UTF8"],
+                       check=True, stdout=subprocess.DEVNULL, **run_as)
+        subprocess.run([os.path.join(bin_dir, "pg_ctl"), "-D", data, "-l", os.path.join(tmp, "log"), "-w",
+                        "-o", f"-p {port} -k {tmp} -c fsync=on -c max_connections=200", "start"],
+                       check=True, stdout=subprocess.DEVNULL, **run_as)
+        try:
+            yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+        finally:
+            subprocess.run([os.path.join(bin_dir, "pg_ctl"), "-D", data, "-m", "fast", "stop"],
+                           check=True, stdout=subprocess.DEVNULL, **run_as)
+
+
+@contextmanager
+def temporary_database(server_url: str):
+    """在PostgreSQL服务器上新建临时数据库，结束后删除"""
+    name = f"bench_{uuid.uuid4().hex[:8]}"
+    admin = create_db_engine(server_url, isolation_level="AUTOCOMMIT")
+    with admin.connect() as conn:
+        conn.execute(text(f"CREATE DATABASE {name}"))
+    try:
+        yield make_url(server_url).set(database=name).render_as_string(hide_password=False)
+    finally:
+        with admin.connect() as conn:
+            conn.execute(text(f"DROP DATABASE {name} WITH (FORCE)"))
+        admin.dispose()
+
+
+def populate(engine) -> None:
+    Base.metadata.create_all(bind=engine)
+    conversations = USERS * CONVERSATIONS_PER_USER
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "password_hash": "x", "is_active": True}
+            for i in range(1, USERS + 1)
+        ])
+        conn.execute(Conversation.__table__.insert(), [
+            {"id": (uid - 1) * CONVERSATIONS_PER_USER + i + 1, "user_id": uid, "title": "对话"}
+            for uid in range(1, USERS + 1) for i in range(CONVERSATIONS_PER_USER)
+        ])
+        # 第一个对话是长对话，其余消息均匀分布
+        for start in range(0, MESSAGES, 10_000):
+            conn.execute(Message.__table__.insert(), [
+                {"conversation_id": 1 if i < LONG_CONVERSATION_MESSAGES else i % conversations + 1,
+                 "role": "user", "content": CONTENT, "token_count": 50}
+                for i in range(start, min(start + 10_000, MESSAGES))
+            ])
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            for table in ("users", "conversations"):
+                conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"))
+
+
+async def chat_load(session_factory, concurrency: int) -> dict:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(i: int):
+        async with semaphore:
+            user_id = i % USERS + 1
+            conversation_id = (user_id - 1) * CONVERSATIONS_PER_USER + i % CONVERSATIONS_PER_USER + 1
+            start = time.perf_counter()
+            async with session_factory() as db:
+                await user_service.aget_user_by_id(db, user_id)
+                await ChatService.aget_conversations(db, user_id, limit=20)
+                if i % 2:
+                    await ChatService.aadd_message(db, conversation_id, "user", CONTENT)
+                else:
+                    await ChatService.aget_conversation_messages(db, conversation_id, limit=20)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(request(i) for i in range(REQUESTS)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": REQUESTS / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+    }
+
+
+def run_backend(name: str, url: str, tmp: str) -> None:
+    engine = create_db_engine(url)
+    start = time.perf_counter()
+    populate(engine)
+    print(f"\n{name}: {MESSAGES} messages inserted in {time.perf_counter() - start:.1f}s")
+
+    # 流式读取长对话的全部历史
+    db = sessionmaker(bind=engine)()
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_history_from_db(db, 1))
+    db.close()
+    print(f"full history read     {count} messages in {(time.perf_counter() - start) * 1000:7.1f} ms")
+
+    # 导出后导入到同类型的空数据库
+    directory = os.path.join(tmp, f"{name}-export")
+    exported = export_tables(engine, directory, ("messages",))[0]
+    print(f"export messages       {exported.rows} rows in {exported.seconds * 1000:7.1f} ms")
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM messages"))
+    imported = import_tables(engine, directory, ("messages",))[0]
+    print(f"import messages       {imported.rows} rows in {imported.seconds * 1000:7.1f} ms")
+
+    writer = MessageWriter(url)
+    chat_module.message_writer = writer
+    asyncio.run(run_chat_load(url))
+    writer.close()
+    engine.dispose()
+
+
+async def run_chat_load(url: str) -> None:
+    async_engine = create_async_db_engine(url)
+    factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    for concurrency in (10, 100):
+        result = await chat_load(factory, concurrency)
+        print(f"chat load, concurrency {concurrency:<3} {result['rps']:8.1f} req/s  "
+              f"p50 {result['p50']:7.2f} ms  p99 {result['p99']:8.2f} ms")
+    await async_engine.dispose()
+
+
+def main():
+    # 只测数据库访问，不使用对话历史缓存
+    history_cache.enabled = False
+    with tempfile.TemporaryDirectory() as tmp:
+        run_backend("sqlite", f"sqlite:///{os.path.join(tmp, 'bench.db')}", tmp)
+        with local_postgres() as server_url:
+            if server_url is None:
+                print("\n没有可用的PostgreSQL：设置POSTGRES_BENCH_URL，或把initdb/pg_ctl加入PATH（PG_BIN）")
+                return
+            with temporary_database(server_url) as url:
+                run_backend("postgresql", url, tmp)
+
+
+if __name__ == "__main__":
+    main()
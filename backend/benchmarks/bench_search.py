@@ -0,0 +1,125 @@
+"""
+对话历史全文搜索查询延迟基准测试
+
+在临时SQLite数据库中生成随机中文消息（以及少量英文），比较FTS5全文索引搜索与
+LIKE '%词%'扫描当前用户消息（没有索引时的做法）的查询延迟，
+并报告建立索引的耗时和数据库文件大小的增加。
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_search
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.database.engine import create_db_engine
+from app.database.session import Base
+from app.models.conversation import Conversation  # noqa: F401 注册模型
+from app.models.message import Message  # noqa: F401
+from app.models.user import User  # noqa: F401
+from app.models.user_settings import UserSettings  # noqa: F401
+from app.services.search import SearchIndex
+
+USERS = 10
+CONVERSATIONS_PER_USER = 100
+MESSAGES = 200_000
+WORDS_PER_MESSAGE = 30
+RUNS = 50
+
+# 常用汉字中随机组成的词表，词频近似Zipf分布
+CHARS = [chr(code) for code in range(0x4E00, 0x4E00 + 3000)]
+ENGLISH = ["python", "database", "index", "query", "cache", "thread", "async", "latency"]
+
+
+def make_vocabulary(rng: random.Random):
+    words = ["".join(rng.choice(CHARS) for _ in range(rng.choice((1, 2, 2, 2, 3, 4)))) for _ in range(20_000)]
+    words += ENGLISH
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    return words, weights
+
+
+def populate(engine, words, weights, rng: random.Random) -> None:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO users (id, username, email, password_hash, is_active) VALUES (:id, :name, :email, 'x', 1)"),
+            [{"id": i, "name": f"user{i}", "email": f"user{i}@example.com"} for i in range(1, USERS + 1)]
+        )
+        conn.execute(text("INSERT INTO conversations (user_id, title) VALUES (:uid, '对话')"),
+                     [{"uid": uid} for uid in range(1, USERS + 1) for _ in range(CONVERSATIONS_PER_USER)])
+        conversations = USERS * CONVERSATIONS_PER_USER
+        batch = []
+        for _ in range(MESSAGES):
+            content = "".join(rng.choices(words, weights, k=WORDS_PER_MESSAGE))
+            batch.append({"cid": rng.randint(1, conversations), "content": content})
+            if len(batch) == 5000:
+                conn.execute(text("INSERT INTO messages (conversation_id, role, content, token_count) "
+                                  "VALUES (:cid, 'user', :content, 50)"), batch)
+                batch = []
+
+
+def measure(search, db, queries, fts: bool) -> dict:
+    latencies = []
+    results = 0
+    search.enabled = fts
+    search._available.clear()
+    for run in range(RUNS):
+        for user_id, query in queries:
+            start = time.perf_counter()
+            page = search.search(db, user_id, query, limit=20)
+            latencies.append(time.perf_counter() - start)
+            results += len(page.items)
+        db.rollback()
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "results": results / RUNS / len(queries),
+    }
+
+
+def main():
+    rng = random.Random(42)
+    words, weights = make_vocabulary(rng)
+    cases = {
+        "common 2-char": words[[len(w) for w in words].index(2)],
+        "rare 3-char": next(w for w in words[2000:] if len(w) == 3),
+        "two terms": f"{words[0]} {words[5]}",
+        "english": "latency",
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = create_db_engine(f"sqlite:///{path}")
+        populate(engine, words, weights, rng)
+        engine.dispose()
+        size_before = os.path.getsize(path)
+
+        engine = create_db_engine(f"sqlite:///{path}")
+        search = SearchIndex()
+        start = time.perf_counter()
+        indexed = search.rebuild(engine)
+        elapsed = time.perf_counter() - start
+        with engine.begin() as conn:
+            conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        print(f"{indexed} messages indexed in {elapsed:.1f}s, "
+              f"database {size_before / 2**20:.0f} MiB -> {os.path.getsize(path) / 2**20:.0f} MiB")
+
+        db = sessionmaker(bind=engine)()
+        for name, query in cases.items():
+            queries = [(user_id, query) for user_id in range(1, USERS + 1)]
+            like = measure(search, db, queries, fts=False)
+            fts = measure(search, db, queries, fts=True)
+            print(f"\n{name} ({query})")
+            print(f"LIKE scan  p50 {like['p50']:8.2f} ms  p99 {like['p99']:8.2f} ms  results {like['results']:5.1f}")
+            print(f"FTS5       p50 {fts['p50']:8.2f} ms  p99 {fts['p99']:8.2f} ms  results {fts['results']:5.1f}")
+        db.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+响应序列化基准测试
+
+在临时SQLite数据库中生成一个5000条消息的对话，读取全部消息后比较两种序列化方式
+（使用FastAPI内部的serialize_response，与路由返回后的处理相同）:
+- dict+json: 逐条拼字典并调用isoformat，无response_model，经jsonable_encoder后由JSONResponse输出（原做法）
+- model+orjson: 直接返回ORM对象，由response_model（MessagePage）校验和转换后由ORJSONResponse输出
+
+同时比较流式响应的分行JSON：json.dumps与orjson.dumps各输出CHUNKS个片段事件。
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_serialization
+"""
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import orjson
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from app.database.engine import create_db_engine
+from app.database.session import Base
+from app.models.conversation import Conversation  # noqa: F401 注册模型
+from app.models.message import Message
+from app.models.user import User  # noqa: F401
+from app.models.user_settings import UserSettings  # noqa: F401
+from app.schemas.message import MessagePage
+
+MESSAGES = 5000
+RUNS = 20
+CHUNKS = 2000
+CONTENT = "你好，请介绍一下自己。这是一条用于测试序列化的消息，包含中文和English混合内容。" * 4
+
+
+def populate(engine) -> None:
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username, email, password_hash, is_active) VALUES (1, 'u', 'u@x', 'x', 1)"))
+        conn.execute(text("INSERT INTO conversations (id, user_id, title) VALUES (1, 1, '长对话')"))
+        conn.execute(
+            text("INSERT INTO messages (conversation_id, role, content, token_count) VALUES (1, :role, :content, 80)"),
+            [{"role": "user" if i % 2 == 0 else "assistant", "content": CONTENT} for i in range(MESSAGES)]
+        )
+
+
+def message_dict(msg: Message) -> dict:
+    return {
+        "id": msg.id,
+        "conversation_id": msg.conversation_id,
+        "role": msg.role,
+        "content": msg.content,
+        "created_at": msg.created_at.isoformat() if msg.created_at else None,
+        "token_count": msg.token_count
+    }
+
+
+async def old_path(messages) -> bytes:
+    content = {"items": [message_dict(msg) for msg in messages], "before": None, "after": None, "has_more": False}
+    encoded = await serialize_response(field=None, response_content=content)
+    return JSONResponse(encoded).body
+
+
+async def new_path(field, messages) -> bytes:
+    content = {"items": messages, "before": None, "after": None, "has_more": False}
+    encoded = await serialize_response(field=field, response_content=content)
+    return ORJSONResponse(encoded).body
+
+
+async def measure(label: str, make_body) -> bytes:
+    timings = []
+    body = b""
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        body = await make_body()
+        timings.append(time.perf_counter() - start)
+    print(f"{label:14} {MESSAGES} messages  p50 {statistics.median(timings) * 1000:7.2f} ms  "
+          f"min {min(timings) * 1000:7.2f} ms  body {len(body) / 1024:7.1f} KiB")
+    return body
+
+
+def stream_framing() -> None:
+    events = [{"type": "chunk", "content": "你好，这是一个流式片段。"} for _ in range(CHUNKS)]
+    for label, dump in (
+        ("json.dumps", lambda event: (json.dumps(event) + "\n").encode("utf-8")),
+        ("orjson.dumps", lambda event: orjson.dumps(event) + b"\n"),
+    ):
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            size = sum(len(dump(event)) for event in events)
+            timings.append(time.perf_counter() - start)
+        print(f"{label:14} {CHUNKS} stream events  p50 {statistics.median(timings) * 1000:7.2f} ms  "
+              f"({statistics.median(timings) / CHUNKS * 1e6:.2f} us/event, {size / CHUNKS:.0f} bytes/event)")
+
+
+async def run(engine) -> None:
+    db = sessionmaker(bind=engine)()
+    messages = db.query(Message).filter(Message.conversation_id == 1).order_by(Message.id).all()
+    db.close()
+    field = create_response_field(name="Response_get_messages", type_=MessagePage)
+
+    old = await measure("dict+json", lambda: old_path(messages))
+    new = await measure("model+orjson", lambda: new_path(field, messages))
+    assert json.loads(old) == json.loads(new)
+    print()
+    stream_framing()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        populate(engine)
+        asyncio.run(run(engine))
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+SSE流式解析微基准测试
+
+对比原先逐行处理的解析循环（iter_lines + decode + strip + json.loads）
+与app.utils.sse中基于字节缓冲区的增量解析器。
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_sse_parser
+"""
+import json
+import time
+from typing import Iterator, List
+
+from app.utils.sse import ChatStreamParser
+
+
+def build_stream(chunk_count: int) -> bytes:
+    """构造一个模拟的Deepseek流式响应"""
+    pieces = ["你好", "，", "这是", "一个", "测试", "\n\n", "```python", "print(\"hi\")", "```"]
+    events = []
+    for i in range(chunk_count):
+        data = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "deepseek-chat",
+            "system_fingerprint": "fp_bench",
+            "choices": [{
+                "index": 0,
+                "delta": {"content": pieces[i % len(pieces)]},
+                "logprobs": None,
+                "finish_reason": None
+            }]
+        }
+        # 与上游一致，使用紧凑的JSON格式
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        events.append(f"data: {payload}\n\n")
+    final = {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion.chunk",
+        "choices": [{"index": 0, "delta": {"content": ""}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": chunk_count, "total_tokens": 100 + chunk_count}
+    }
+    payload = json.dumps(final, separators=(",", ":"))
+    events.append(f"data: {payload}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode("utf-8")
+
+
+def split_reads(stream: bytes, read_size: int) -> List[bytes]:
+    """按固定大小切分，模拟网络读取"""
+    return [stream[i:i + read_size] for i in range(0, len(stream), read_size)]
+
+
+def iter_lines(reads: List[bytes]) -> Iterator[bytes]:
+    """模拟requests的iter_lines"""
+    pending = b""
+    for chunk in reads:
+        pending += chunk
+        lines = pending.splitlines(keepends=True)
+        pending = lines.pop() if lines and not lines[-1].endswith(b"\n") else b""
+        for line in lines:
+            yield line.rstrip(b"\r\n")
+    if pending:
+        yield pending
+
+
+def legacy_parse(reads: List[bytes]) -> List[str]:
+    """原先的逐行解析循环"""
+    result = []
+    for line in iter_lines(reads):
+        if line:
+            line = line.decode('utf-8').strip()
+            if not line or line.startswith('event:'):
+                continue
+            if line.startswith('data: '):
+                data_str = line[6:]
+                if data_str == '[DONE]':
+                    break
+                data = json.loads(data_str)
+                if data.get('choices') and len(data['choices']) > 0:
+                    choice = data['choices'][0]
+                    delta = choice.get('delta', {})
+                    if delta.get('content'):
+                        result.append(delta['content'])
+                    if choice.get('finish_reason'):
+                        break
+    return result
+
+
+def incremental_parse(reads: List[bytes]) -> List[str]:
+    """基于字节缓冲区的增量解析"""
+    result = []
+    parser = ChatStreamParser()
+    for chunk in reads:
+        for delta in parser.feed(chunk):
+            if delta.content:
+                result.append(delta.content)
+        if parser.done:
+            break
+    return result
+
+
+def bench(name: str, func, reads: List[bytes], rounds: int, chunk_count: int, repeat: int = 5) -> float:
+    func(reads)  # 预热
+    # 取多次测量中的最小值，减少噪声影响
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func(reads)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    per_chunk_us = elapsed / (rounds * chunk_count) * 1e6
+    print(f"{name:<12} {elapsed * 1000:9.1f} ms  {per_chunk_us:6.2f} us/chunk")
+    return elapsed
+
+
+def main():
+    chunk_count = 2000
+    rounds = 20
+    stream = build_stream(chunk_count)
+
+    for read_size in (64, 1024, 16384):
+        reads = split_reads(stream, read_size)
+        assert legacy_parse(reads) == incremental_parse(reads)
+        print(f"\n{chunk_count} chunks x {rounds} rounds, read_size={read_size}")
+        legacy = bench("legacy", legacy_parse, reads, rounds, chunk_count)
+        incremental = bench("incremental", incremental_parse, reads, rounds, chunk_count)
+        print(f"speedup: {legacy / incremental:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+流式响应片段合并基准测试
+
+在临时SQLite数据库中创建用户和对话，用模拟的上游流替换LLM服务（每个增量1-3个字符），
+在本进程中用uvicorn启动应用，通过本地回环连接并发发起流式发送消息请求，
+分别在关闭和开启片段合并时测量:
+- 每个回答的NDJSON帧数和响应字节数
+- 每个回答的CPU时间（进程CPU时间除以回答数，包含服务端的路由、数据库写入、分帧、
+  套接字写入，以及客户端逐行解析）
+- 第一个片段帧的到达延迟（相对于上游产生第一个增量的时间）
+
+两种上游节奏:
+- burst: 每次网络读取带来BURST个增量，读取间隔BURST_INTERVAL秒（高速生成）
+- sparse: 每SPARSE_INTERVAL秒一个增量（慢速生成，合并不应增加延迟）
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_stream_coalesce
+"""
+import asyncio
+import os
+import socket
+import statistics
+import tempfile
+import time
+
+import httpx
+import orjson
+import uvicorn
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.session import get_current_active_user
+from app.database.engine import create_async_db_engine, create_db_engine
+from app.database.routing import get_async_read_db, get_async_write_db
+from app.database.session import Base
+from app.main import app
+from app.models.conversation import Conversation  # noqa: F401 注册模型
+from app.models.message import Message  # noqa: F401
+from app.models.user import User  # noqa: F401
+from app.models.user_settings import UserSettings  # noqa: F401
+from app.services.llm_service import llm_service
+from app.services.principal_cache import UserSnapshot
+from app.services.stream_coalescer import stream_coalescer
+
+ANSWERS = 20
+DELTAS = 600
+BURST = 8
+BURST_INTERVAL = 0.01
+SPARSE_DELTAS = 40
+SPARSE_INTERVAL = 0.03
+PIECES = ["你", "好", "，", "我是", "助手", "。", " the", " model", "\n", "**"]
+
+# 每个请求上游产生第一个增量的时间，用于计算第一帧延迟
+first_delta_at = {}
+
+
+def populate(path: str) -> None:
+    engine = create_db_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username, email, password_hash, is_active) VALUES (1, 'u', 'u@x', 'x', 1)"))
+        conn.execute(
+            text("INSERT INTO conversations (id, user_id, title) VALUES (:id, 1, 'bench')"),
+            [{"id": i} for i in range(1, ANSWERS + 1)]
+        )
+    engine.dispose()
+
+
+def make_upstream(mode: str):
+    async def fake_stream(messages, usage=None, profile=None):
+        key = messages[-1]["content"]
+        if mode == "burst":
+            for i in range(DELTAS):
+                if i % BURST == 0:
+                    await asyncio.sleep(BURST_INTERVAL)
+                if i == 0:
+                    first_delta_at[key] = time.perf_counter()
+                yield PIECES[i % len(PIECES)]
+        else:
+            for i in range(SPARSE_DELTAS):
+                await asyncio.sleep(SPARSE_INTERVAL)
+                if i == 0:
+                    first_delta_at[key] = time.perf_counter()
+                yield PIECES[i % len(PIECES)]
+    return fake_stream
+
+
+async def run_answers(client: httpx.AsyncClient, round_id: str) -> dict:
+    frames, sizes, first_frame = [], [], []
+
+    async def answer(conversation_id: int):
+        key = f"{round_id}-{conversation_id}"
+        count = size = 0
+        contents = []
+        async with client.stream("POST", f"/api/conversations/{conversation_id}/messages",
+                                 json={"content": key, "use_stream": True}) as response:
+            async for line in response.aiter_lines():
+                size += len(line.encode("utf-8")) + 1
+                event = orjson.loads(line)
+                if event.get("type") == "chunk":
+                    if not contents:
+                        first_frame.append(time.perf_counter() - first_delta_at[key])
+                    count += 1
+                    contents.append(event["content"])
+                elif event.get("type") == "end":
+                    assert event["ai_message"]["content"] == "".join(contents)
+        frames.append(count)
+        sizes.append(size)
+
+    cpu = time.process_time()
+    await asyncio.gather(*(answer(i) for i in range(1, ANSWERS + 1)))
+    cpu = time.process_time() - cpu
+    return {
+        "frames": statistics.mean(frames),
+        "bytes": statistics.mean(sizes),
+        "cpu_ms": cpu / ANSWERS * 1000,
+        "first_p50": statistics.median(first_frame) * 1000,
+        "first_max": max(first_frame) * 1000,
+    }
+
+
+async def run(path: str) -> None:
+    engine = create_async_db_engine(f"sqlite:///{path}")
+    factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def db():
+        async with factory() as session:
+            yield session
+
+    app.dependency_overrides[get_async_read_db] = db
+    app.dependency_overrides[get_async_write_db] = db
+    user = UserSnapshot(1, "u", "u@x", True, False, None, None)
+    app.dependency_overrides[get_current_active_user] = lambda: user
+
+    print(f"{ANSWERS} concurrent answers, burst: {DELTAS} deltas in groups of {BURST} every {BURST_INTERVAL * 1000:.0f} ms, "
+          f"sparse: {SPARSE_DELTAS} deltas every {SPARSE_INTERVAL * 1000:.0f} ms; "
+          f"window {stream_coalescer.window * 1000:.0f} ms, max {stream_coalescer.max_bytes} bytes\n")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off", log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60) as client:
+        for mode in ("burst", "sparse"):
+            llm_service.agenerate_stream_response = make_upstream(mode)
+            for enabled in (False, True):
+                stream_coalescer.enabled = enabled
+                result = await run_answers(client, f"{mode}-{enabled}")
+                name = "coalesced" if enabled else "per-delta"
+                print(f"{mode:6} {name:9} frames/answer {result['frames']:6.1f}  bytes/answer {result['bytes']:7.0f}  "
+                      f"cpu/answer {result['cpu_ms']:6.2f} ms  first frame p50 {result['first_p50']:5.2f} ms  "
+                      f"max {result['first_max']:5.2f} ms")
+
+    server.should_exit = True
+    await serving
+    print(f"\n{stream_coalescer.stats()}")
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        populate(path)
+        asyncio.run(run(path))
+
+
+if __name__ == "__main__":
+    main()
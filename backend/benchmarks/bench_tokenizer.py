@@ -0,0 +1,62 @@
+"""
+Token计数吞吐量基准测试
+
+对比估算后端和tiktoken后端（如已安装）的tokens/sec，
+以及按内容哈希记忆后重复计数同一批消息的开销。
+
+运行方式（在backend目录下）:
+    python -m benchmarks.bench_tokenizer
+"""
+import time
+from typing import Callable, List
+
+from app.services.token_counter import EstimateBackend, TiktokenBackend, TokenCounter
+
+
+def build_corpus(count: int) -> List[str]:
+    """构造中英文混合、长短不一的消息"""
+    samples = [
+        "你好，请帮我解释一下Python中的装饰器是如何工作的？",
+        "Sure! A decorator is a callable that takes a function and returns a new function. " * 4,
+        "```python\ndef retry(times):\n    def wrap(fn):\n        return fn\n    return wrap\n```\n" * 3,
+        "这是一个比较长的回答，包含了多个段落。\n\n第一，我们需要理解闭包；第二，理解函数是一等公民。" * 6,
+        "ok",
+    ]
+    return [f"{samples[i % len(samples)]} #{i}" for i in range(count)]
+
+
+def bench(name: str, func: Callable[[List[str]], List[int]], corpus: List[str], repeat: int = 5) -> None:
+    total_tokens = sum(func(corpus))  # 预热
+    # 取多次测量中的最小值，减少噪声影响
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(corpus)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    print(f"{name:<22} {elapsed * 1000:9.1f} ms  {total_tokens / elapsed / 1e6:7.2f} M tokens/s  ({total_tokens} tokens)")
+
+
+def main():
+    corpus = build_corpus(20000)
+    print(f"{len(corpus)} messages, {sum(len(text) for text in corpus)} chars")
+
+    estimate = EstimateBackend()
+    bench("estimate", estimate.count_many, corpus)
+
+    try:
+        tiktoken_backend = TiktokenBackend("cl100k_base")
+    except Exception as e:
+        print(f"tiktoken不可用，跳过: {e}")
+    else:
+        bench("tiktoken", lambda texts: [tiktoken_backend.count(text) for text in texts], corpus)
+        bench("tiktoken (batch)", tiktoken_backend.count_many, corpus)
+
+    # 记忆命中：同一批消息第二次计数
+    counter = TokenCounter()
+    counter.max_entries = len(corpus)
+    counter.count_many(corpus)
+    bench(f"memoized ({counter.backend.name})", counter.count_many, corpus)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+归档长期未活动的对话
+
+超过--days天（默认为ARCHIVE_IDLE_DAYS）没有新消息的对话，其消息整体压缩后移入
+archived_conversations表；读取或继续对话时自动恢复。SQLite上可以在归档后执行VACUUM收缩数据库文件。
+
+运行方式（在backend目录下）:
+    python -m scripts.archive_conversations [--days N] [--limit N] [--vacuum]
+"""
+import argparse
+
+from sqlalchemy import text
+
+from app.database.session import SessionLocal, engine
+from app.services.archive import conversation_archiver
+
+
+def main():
+    parser = argparse.ArgumentParser(description="归档长期未活动的对话")
+    parser.add_argument("--days", type=int, default=None, help="未活动天数，默认为ARCHIVE_IDLE_DAYS")
+    parser.add_argument("--limit", type=int, default=None, help="最多归档的对话数")
+    parser.add_argument("--vacuum", action="store_true", help="归档后执行VACUUM收缩数据库文件（SQLite）")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        result = conversation_archiver.archive_idle(db, args.days, args.limit)
+    finally:
+        db.close()
+    print(f"归档对话: {result.conversations}, 消息: {result.messages}, "
+          f"字节: {result.original_bytes} -> {result.archived_bytes}")
+    if args.vacuum and engine.dialect.name == "sqlite":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+        print("已执行VACUUM")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+回填messages表的token_count
+
+按主键分批读取消息内容，批量计算token数后按主键批量更新。
+默认只处理token_count为空或为0的消息，--all重新计算全部消息
+（例如切换了TOKENIZER_BACKEND之后）。
+
+运行方式（在backend目录下）:
+    python -m scripts.backfill_token_counts [--chunk-size 1000] [--all]
+"""
+import argparse
+import time
+
+from sqlalchemy import or_, update
+
+from app.database.session import SessionLocal
+from app.models.message import Message
+from app.services.token_counter import token_counter
+
+
+def backfill(chunk_size: int, recount_all: bool) -> int:
+    """回填token_count，返回更新的消息数"""
+    db = SessionLocal()
+    updated = 0
+    last_id = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            query = db.query(Message.id, Message.content).filter(Message.id > last_id)
+            if not recount_all:
+                query = query.filter(or_(Message.token_count.is_(None), Message.token_count == 0))
+            rows = query.order_by(Message.id.asc()).limit(chunk_size).all()
+            if not rows:
+                break
+
+            counts = token_counter.count_many([content for _, content in rows])
+            db.execute(
+                update(Message),
+                [{"id": message_id, "token_count": count} for (message_id, _), count in zip(rows, counts)]
+            )
+            db.commit()
+
+            updated += len(rows)
+            last_id = rows[-1][0]
+            print(f"已更新 {updated} 条消息，最后ID: {last_id}")
+    finally:
+        db.close()
+
+    print(f"回填完成，共 {updated} 条消息，后端: {token_counter.backend.name}，耗时 {time.perf_counter() - start:.1f}s")
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回填messages表的token_count")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="每批处理的消息数")
+    parser.add_argument("--all", action="store_true", help="重新计算所有消息，而不只是token_count为空或0的消息")
+    args = parser.parse_args()
+    backfill(args.chunk_size, args.all)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+训练消息压缩字典或压缩已有消息
+
+train: 从已有消息中采样训练新的压缩字典（之后写入的消息使用新字典）
+compress: 按MESSAGE_COMPRESSION的当前配置重新编码已有消息
+
+运行方式（在backend目录下）:
+    python -m scripts.compress_messages train|compress
+"""
+import argparse
+import sys
+
+from app.database.compression import compress_existing, message_codec
+from app.database.session import engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="训练消息压缩字典或压缩已有消息")
+    parser.add_argument("command", choices=("train", "compress"))
+    args = parser.parse_args()
+
+    if args.command == "train":
+        dictionary = message_codec.train(engine)
+        print(f"新字典: id={dictionary.id}, size={len(dictionary.data)}" if dictionary else "样本消息不足")
+    else:
+        if not message_codec.enabled:
+            print("未启用MESSAGE_COMPRESSION")
+            sys.exit(1)
+        print(f"已处理消息数: {compress_existing(engine)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+"""
+手动执行数据库迁移
+
+应用启动时会自动执行迁移；这里用于部署前单独执行，或迁移到指定版本。
+
+运行方式（在backend目录下）:
+    python -m scripts.migrate [--target N]
+"""
+import argparse
+
+from app.database.migrations import current_version, migrate
+from app.database.session import engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description="执行尚未应用的数据库迁移")
+    parser.add_argument("--target", type=int, default=None, help="迁移到的版本，默认为最新版本")
+    args = parser.parse_args()
+
+    print(f"当前版本: {current_version(engine)}")
+    print(f"本次应用: {migrate(engine, args.target) or '无'}")
+
+
+if __name__ == "__main__":
+    main()
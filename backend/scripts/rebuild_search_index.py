@@ -0,0 +1,21 @@
+"""
+重建消息全文索引（SQLite FTS5）
+
+从messages表和归档表重新生成索引，例如修改了分词方式之后。
+
+运行方式（在backend目录下）:
+    python -m scripts.rebuild_search_index
+"""
+import argparse
+
+from app.database.session import engine
+from app.services.search import search_index
+
+
+def main():
+    argparse.ArgumentParser(description="重建消息全文索引（SQLite FTS5）").parse_args()
+    print(f"已索引消息数: {search_index.rebuild(engine)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+测试公共配置
+
+运行方式（在backend目录下）:
+    python -m pytest
+
+应用的全局引擎在导入时按DATABASE_URL创建，这里先指向临时目录中的SQLite文件，
+关闭启动时的上游预热；每个测试使用自己的临时数据库（engine/db夹具）。
+"""
+import os
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="assistant-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_TMP, 'app.db')}")
+os.environ.setdefault("LLM_HTTP_WARMUP", "False")
+
+import pytest  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import app.models  # noqa: E402,F401 注册模型
+from app.database.engine import create_db_engine  # noqa: E402
+from app.database.migrations import migrate  # noqa: E402
+from app.database.session import Base  # noqa: E402
+from app.models.conversation import Conversation  # noqa: E402
+from app.models.message import Message  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services.history_cache import history_cache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clear_history_cache():
+    """各测试的数据库中对话ID重复，缓存不能跨测试保留"""
+    history_cache.clear()
+    yield
+    history_cache.clear()
+
+
+@pytest.fixture
+def db_url(tmp_path) -> str:
+    return f"sqlite:///{tmp_path / 'test.db'}"
+
+
+@pytest.fixture
+def engine(db_url):
+    """按模型建表并执行迁移的临时SQLite数据库"""
+    engine = create_db_engine(db_url)
+    Base.metadata.create_all(bind=engine)
+    migrate(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine, autoflush=False)()
+    yield session
+    session.close()
+
+
+def create_user(db, user_id: int = 1) -> User:
+    user = User(id=user_id, username=f"user{user_id}", email=f"user{user_id}@example.com",
+                password_hash="x", is_active=True)
+    db.add(user)
+    db.commit()
+    return user
+
+
+def create_conversation(db, user_id: int = 1, title: str = "对话") -> Conversation:
+    conversation = Conversation(user_id=user_id, title=title)
+    db.add(conversation)
+    db.commit()
+    return conversation
+
+
+def add_messages(db, conversation_id: int, contents) -> list:
+    """按顺序写入消息（同时写入全文索引），返回消息ID"""
+    from app.services.search import search_index
+
+    user_id = db.get(Conversation, conversation_id).user_id
+    messages = [Message(conversation_id=conversation_id, role="user" if i % 2 == 0 else "assistant",
+                        content=content, token_count=1)
+                for i, content in enumerate(contents)]
+    db.add_all(messages)
+    db.flush()
+    search_index.index_messages(db, [(m.id, conversation_id, user_id, m.content) for m in messages])
+    db.commit()
+    return [m.id for m in messages]
+
+
+def fts_rowids(engine) -> list:
+    with engine.connect() as conn:
+        return list(conn.execute(text("SELECT rowid FROM messages_fts ORDER BY rowid")).scalars())
@@ -0,0 +1,98 @@
+"""冷归档和恢复"""
+from sqlalchemy import select, text
+
+from app.models.archive import ArchivedConversation
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services.archive import ConversationArchiver
+from app.services.bulk_delete import BulkDeleter
+from app.services.search import FTS_TABLE, search_index, segment
+from tests.conftest import add_messages, create_conversation, create_user, fts_rowids
+
+
+def messages(db, conversation_id):
+    return db.execute(
+        select(Message.id, Message.content).where(Message.conversation_id == conversation_id).order_by(Message.id)
+    ).all()
+
+
+def test_archive_and_restore_keeps_ids(db, engine):
+    create_user(db)
+    conversation_id = create_conversation(db).id
+    ids = add_messages(db, conversation_id, ["first apple", "second banana", "third cherry"])
+    before = messages(db, conversation_id)
+
+    archiver = ConversationArchiver()
+    result = archiver.archive_conversation(db, conversation_id)
+    assert (result.conversations, result.messages) == (1, 3)
+    assert messages(db, conversation_id) == []
+    archive = db.get(ArchivedConversation, conversation_id)
+    assert (archive.first_message_id, archive.last_message_id) == (ids[0], ids[-1])
+    # 已归档的消息仍在索引中，可以被搜索到
+    assert fts_rowids(engine) == ids
+    hits = search_index.search(db, 1, "banana").items
+    assert [(hit.message_id, hit.conversation_id) for hit in hits] == [(ids[1], conversation_id)]
+
+    assert archiver.restore(db, conversation_id)
+    assert messages(db, conversation_id) == before
+    assert db.get(ArchivedConversation, conversation_id) is None
+    assert db.execute(select(Conversation.archived_at).where(Conversation.id == conversation_id)).scalar() is None
+    assert fts_rowids(engine) == ids
+    assert not archiver.restore(db, conversation_id)
+
+
+def test_new_messages_do_not_reuse_archived_ids(db):
+    create_user(db)
+    archived_id = create_conversation(db).id
+    ids = add_messages(db, archived_id, ["a", "b"])
+    ConversationArchiver().archive_conversation(db, archived_id)
+    other = add_messages(db, create_conversation(db).id, ["c"])
+    assert other[0] > ids[-1]
+
+
+def test_restore_with_id_collision(db, engine):
+    create_user(db)
+    archived_id = create_conversation(db).id
+    ids = add_messages(db, archived_id, ["old apple", "old banana"])
+    archiver = ConversationArchiver()
+    archiver.archive_conversation(db, archived_id)
+
+    # 迁移到AUTOINCREMENT之前的数据库会把已归档消息的ID分配给新消息，
+    # 之前的归档也会从索引中删除消息，索引中这个ID对应新消息
+    other_id = create_conversation(db).id
+    db.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, scope, content) "
+                    "VALUES ('delete', :id, :scope, :content)"),
+               {"id": ids[1], "scope": f"u1 c{archived_id}", "content": segment("old banana")})
+    db.execute(text("INSERT INTO messages (id, conversation_id, role, content, token_count) "
+                    "VALUES (:id, :cid, 'user', 'reused id', 1)"), {"id": ids[1], "cid": other_id})
+    search_index.index_messages(db, [(ids[1], other_id, 1, "reused id")])
+    db.commit()
+
+    assert archiver.restore(db, archived_id)
+    restored = messages(db, archived_id)
+    assert [content for _, content in restored] == ["old apple", "old banana"]
+    assert restored[0][0] == ids[0]
+    new_id = restored[1][0]
+    assert new_id > ids[1]
+    assert messages(db, other_id) == [(ids[1], "reused id")]
+    # 分配了新ID的消息写入索引
+    assert new_id in fts_rowids(engine)
+    assert [hit.message_id for hit in search_index.search(db, 1, "banana").items] == [new_id]
+    assert [hit.message_id for hit in search_index.search(db, 1, "reused").items] == [ids[1]]
+
+
+def test_delete_removes_archives_and_index_rows(db, engine):
+    create_user(db)
+    archived_id = create_conversation(db).id
+    live_id = create_conversation(db).id
+    kept_id = create_conversation(db).id
+    add_messages(db, archived_id, ["archived apple"])
+    add_messages(db, live_id, ["live apple", "live banana"])
+    kept = add_messages(db, kept_id, ["kept apple"])
+    ConversationArchiver().archive_conversation(db, archived_id)
+
+    result = BulkDeleter().delete(db, 1, [archived_id, live_id])
+    assert (result.conversations, result.messages) == (2, 2)
+    assert db.execute(select(ArchivedConversation)).first() is None
+    assert fts_rowids(engine) == kept
+    assert [hit.message_id for hit in search_index.search(db, 1, "apple").items] == kept
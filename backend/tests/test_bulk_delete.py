@@ -0,0 +1,63 @@
+"""对话批量删除"""
+from sqlalchemy import func, select
+
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services.bulk_delete import BulkDeleter, DeleteJob
+from tests.conftest import add_messages, create_conversation, create_user
+
+
+def setup_conversations(db):
+    create_user(db, 1)
+    create_user(db, 2)
+    mine = [create_conversation(db, 1).id for _ in range(5)]
+    theirs = create_conversation(db, 2).id
+    for i, conversation_id in enumerate(mine + [theirs]):
+        add_messages(db, conversation_id, [f"消息{j}" for j in range(i + 1)])
+    return mine, theirs
+
+
+def count(db, model) -> int:
+    return db.execute(select(func.count()).select_from(model)).scalar()
+
+
+def test_owned_ids_filters_other_users(db):
+    mine, theirs = setup_conversations(db)
+    deleter = BulkDeleter()
+    deleter.chunk_size = 2
+    assert deleter.owned_ids(db, 1, mine + [theirs, 999]) == mine
+    assert deleter.owned_ids(db, 1) == mine
+    assert deleter.owned_ids(db, 2, mine) == []
+
+
+def test_delete_in_chunks(db):
+    mine, theirs = setup_conversations(db)
+    deleter = BulkDeleter()
+    deleter.chunk_size = 2
+    assert deleter.count_messages(db, mine) == 15
+
+    job = DeleteJob(1, mine)
+    result = deleter.delete(db, 1, mine, job)
+    assert (result.conversations, result.messages) == (5, 15)
+    assert (job.deleted_conversations, job.deleted_messages) == (5, 15)
+    assert deleter.stats()["statements"] == 9
+    assert count(db, Conversation) == 1
+    assert count(db, Message) == 6
+    assert db.get(Conversation, theirs) is not None
+
+
+def test_delete_checks_owner(db):
+    mine, theirs = setup_conversations(db)
+    result = BulkDeleter().delete(db, 1, [theirs])
+    # 对话归属不符时不删除对话
+    assert result.conversations == 0
+    assert db.get(Conversation, theirs) is not None
+
+
+def test_background_threshold(db):
+    mine, _ = setup_conversations(db)
+    deleter = BulkDeleter()
+    deleter.background_threshold = 10
+    assert not deleter.should_run_in_background(db, mine[:3])
+    assert deleter.should_run_in_background(db, mine)
+    assert not deleter.should_run_in_background(db, [])
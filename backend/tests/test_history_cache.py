@@ -0,0 +1,35 @@
+"""对话历史缓存"""
+from app.services.history_cache import history_cache
+from tests.conftest import add_messages, create_conversation, create_user
+
+
+def window_ids(db, conversation_id: int) -> list:
+    return [message.id for message in history_cache.get_window(db, conversation_id).messages]
+
+
+def test_reloads_when_another_worker_writes(db):
+    create_user(db)
+    conversation = create_conversation(db)
+    first = add_messages(db, conversation.id, ["你好", "你好！"])
+
+    assert window_ids(db, conversation.id) == first
+    assert window_ids(db, conversation.id) == first
+    assert history_cache.stale_reloads == 0
+
+    # 其他进程直接写入数据库，本进程的缓存没有追加
+    second = add_messages(db, conversation.id, ["再问一个问题"])
+    reloads = history_cache.stale_reloads
+    assert window_ids(db, conversation.id) == first + second
+    assert history_cache.stale_reloads == reloads + 1
+
+
+def test_conversation_deleted_by_another_worker(db):
+    create_user(db)
+    conversation = create_conversation(db)
+    add_messages(db, conversation.id, ["你好"])
+    assert history_cache.get_window(db, conversation.id) is not None
+
+    db.delete(conversation)
+    db.commit()
+    assert history_cache.get_window(db, conversation.id) is None
+    assert not history_cache.contains(conversation.id)
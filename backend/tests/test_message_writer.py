@@ -0,0 +1,95 @@
+"""消息合并提交写入"""
+from concurrent.futures import Future
+
+import pytest
+from sqlalchemy import select
+
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services.message_writer import MessageWriter, PendingMessage
+from tests.conftest import create_conversation, create_user, fts_rowids
+
+
+@pytest.fixture
+def writer(db_url, engine):
+    writer = MessageWriter(url=db_url, window_ms=5, max_batch=16, synchronous="")
+    writer._engine = engine
+    yield writer
+    writer.close()
+
+
+@pytest.fixture
+def conversation_id(db):
+    create_user(db)
+    return create_conversation(db).id
+
+
+def pending(conversation_id, content, usage=None) -> PendingMessage:
+    future = Future()
+    future.set_running_or_notify_cancel()
+    return PendingMessage(conversation_id, "user", content, 1, usage, future)
+
+
+def test_batch_written_in_one_commit(writer, engine, db, conversation_id):
+    batch = [pending(conversation_id, f"消息{i}", {"prompt_cache_hit_tokens": 2, "prompt_cache_miss_tokens": 1})
+             for i in range(3)]
+    writer._flush(batch)
+    messages = [p.future.result() for p in batch]
+    assert [m.content for m in messages] == ["消息0", "消息1", "消息2"]
+    assert messages[0].id < messages[1].id < messages[2].id
+    assert writer.batches == 1 and writer.retries == 0
+    assert fts_rowids(engine) == [m.id for m in messages]
+    conversation = db.get(Conversation, conversation_id)
+    assert (conversation.prompt_cache_hit_tokens, conversation.prompt_cache_miss_tokens) == (6, 3)
+
+
+def test_failed_batch_retried_per_message(writer, engine, conversation_id, monkeypatch):
+    commit = writer._commit
+    calls = []
+
+    def flaky_commit(batch):
+        calls.append(len(batch))
+        if len(batch) > 1 or batch[0].content == "坏消息":
+            raise RuntimeError("commit failed")
+        return commit(batch)
+
+    monkeypatch.setattr(writer, "_commit", flaky_commit)
+    batch = [pending(conversation_id, "消息1"), pending(conversation_id, "坏消息"), pending(conversation_id, "消息2")]
+    writer._flush(batch)
+
+    assert calls == [3, 1, 1, 1]
+    assert batch[0].future.result().content == "消息1"
+    with pytest.raises(RuntimeError):
+        batch[1].future.result()
+    assert batch[2].future.result().content == "消息2"
+    assert (writer.retries, writer.failed) == (1, 1)
+    with engine.connect() as conn:
+        assert list(conn.execute(select(Message.content).order_by(Message.id)).scalars()) == ["消息1", "消息2"]
+
+
+def test_single_message_failure_not_retried(writer, monkeypatch):
+    monkeypatch.setattr(writer, "_commit", lambda batch: (_ for _ in ()).throw(RuntimeError("boom")))
+    item = pending(1, "消息")
+    writer._flush([item])
+    assert writer.retries == 0 and writer.failed == 1
+    with pytest.raises(RuntimeError):
+        item.future.result()
+
+
+def test_cancelled_before_take_is_skipped(writer):
+    future = Future()
+    future.cancel()
+    assert not writer._take(PendingMessage(1, "user", "消息", 1, None, future))
+    assert writer.cancelled == 1
+    live = Future()
+    assert writer._take(PendingMessage(1, "user", "消息", 1, None, live))
+    # 取出后不能再取消
+    assert not live.cancel()
+
+
+def test_write_through_thread(writer, conversation_id):
+    futures = [writer.write(conversation_id, "assistant", f"回答{i}", 1) for i in range(5)]
+    messages = [f.result(timeout=10) for f in futures]
+    assert [m.content for m in messages] == [f"回答{i}" for i in range(5)]
+    assert writer.messages == 5 and writer.failed == 0
+
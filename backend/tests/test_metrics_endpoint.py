@@ -0,0 +1,26 @@
+"""运行时指标接口"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.session import get_current_superuser
+from app.services.principal_cache import UserSnapshot
+
+
+def snapshot(is_superuser: bool) -> UserSnapshot:
+    return UserSnapshot(1, "user", "user@example.com", True, is_superuser, None, None)
+
+
+def test_metrics_route_disabled_by_default():
+    from app.main import app
+
+    assert "/metrics" not in {route.path for route in app.routes}
+
+
+def test_superuser_required():
+    admin = snapshot(True)
+    assert asyncio.run(get_current_superuser(admin)) is admin
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(get_current_superuser(snapshot(False)))
+    assert exc.value.status_code == 403
@@ -0,0 +1,91 @@
+"""数据库迁移"""
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from app.database.engine import create_db_engine
+from app.database.migrations import MIGRATIONS, current_version, migrate
+from app.database.session import Base
+from app.services.search import FTS_TABLE, search_index, segment
+from tests.conftest import add_messages, create_conversation, create_user, fts_rowids
+
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR NOT NULL, email VARCHAR NOT NULL, "
+    "password_hash VARCHAR NOT NULL, is_active BOOLEAN, is_superuser BOOLEAN, "
+    "created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME)",
+    "CREATE TABLE conversations (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users (id), "
+    "title VARCHAR NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME)",
+    "CREATE TABLE messages (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL REFERENCES conversations (id), "
+    "role VARCHAR NOT NULL, content VARCHAR NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, "
+    "token_count INTEGER)",
+]
+# 迁移9之前的全文索引保存原文副本
+STORED_CONTENT_FTS = f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(scope, content, tokenize='unicode61 remove_diacritics 2')"
+
+
+def sql_of(engine, name):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT sql FROM sqlite_master WHERE name = :name"), {"name": name}).scalar()
+
+
+def test_fresh_database_is_idempotent(engine):
+    assert current_version(engine) == MIGRATIONS[-1].version
+    assert migrate(engine) == []
+    assert "AUTOINCREMENT" in sql_of(engine, "messages").upper()
+    assert "content=''" in sql_of(engine, FTS_TABLE)
+
+
+def test_legacy_database_upgrade(tmp_path):
+    engine = create_db_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO users (id, username, email, password_hash, is_active) "
+                          "VALUES (1, 'u', 'u@example.com', 'x', 1)"))
+        conn.execute(text("INSERT INTO conversations (id, user_id, title, created_at) "
+                          "VALUES (1, 1, '旧对话', '2024-01-01 00:00:00')"))
+        conn.execute(text("INSERT INTO messages (id, conversation_id, role, content) VALUES "
+                          "(1, 1, 'user', 'legacy apple'), (2, 1, 'assistant', 'legacy banana')"))
+    Base.metadata.create_all(bind=engine)
+
+    assert migrate(engine, target=5) == [1, 2, 3, 4, 5]
+    # 没有AUTOINCREMENT时已删除消息的ID可能仍留在索引中
+    with engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, scope, content) VALUES (7, 'u1 c9', 'deleted')"))
+    assert migrate(engine) == [migration.version for migration in MIGRATIONS[5:]]
+    assert migrate(engine) == []
+
+    columns = {column["name"] for column in inspect(engine).get_columns("conversations")}
+    assert {"prompt_cache_hit_tokens", "archived_at", "restored_at"} <= columns
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT updated_at FROM conversations")).scalar() == "2024-01-01 00:00:00"
+        # 新ID从索引中用过的最大ID之后开始
+        assert conn.execute(text("SELECT seq FROM sqlite_sequence WHERE name = 'messages'")).scalar() == 7
+    assert "AUTOINCREMENT" in sql_of(engine, "messages").upper()
+    assert "content=''" in sql_of(engine, FTS_TABLE)
+    assert fts_rowids(engine) == [1, 2, 7]
+
+    with Session(engine) as db:
+        assert [hit.message_id for hit in search_index.search(db, 1, "banana").items] == [2]
+        assert add_messages(db, 1, ["new"]) == [8]
+    engine.dispose()
+
+
+def test_contentless_migration_keeps_archived_messages_searchable(db, engine):
+    from app.services.archive import ConversationArchiver
+
+    create_user(db)
+    conversation_id = create_conversation(db).id
+    ids = add_messages(db, conversation_id, ["archived apple"])
+    ConversationArchiver().archive_conversation(db, conversation_id)
+    # 回到迁移9之前的表结构
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {FTS_TABLE}"))
+        conn.execute(text(STORED_CONTENT_FTS))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, scope, content) VALUES (:id, :scope, :content)"),
+                     {"id": ids[0], "scope": f"u1 c{conversation_id}", "content": segment("archived apple")})
+        conn.execute(text("DELETE FROM schema_migrations WHERE version = 9"))
+    search_index._available.clear()
+
+    assert migrate(engine) == [9]
+    assert fts_rowids(engine) == ids
+    assert [hit.message_id for hit in search_index.search(db, 1, "apple").items] == ids
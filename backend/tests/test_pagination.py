@@ -0,0 +1,84 @@
+"""键集分页和分页游标"""
+from datetime import datetime
+
+import pytest
+
+from app.core.config import settings
+from app.models.message import Message
+from app.services.pagination import (
+    InvalidCursor, decode_cursor, encode_cursor, keyset_paginate, page_size
+)
+from tests.conftest import add_messages, create_conversation, create_user
+
+
+def test_cursor_roundtrip():
+    values = [datetime(2024, 5, 1, 12, 30, 15, 123456), "2024-05-01 12:30:15", 42]
+    assert decode_cursor(encode_cursor(values), 3) == values
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "bm90IGpzb24", encode_cursor([1]), encode_cursor([{"x": 1}, 2])])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, 2)
+
+
+def test_page_size_clamped():
+    assert page_size(None, 20) == 20
+    assert page_size(0, 20) == 20
+    assert page_size(-5, 20) == 1
+    assert page_size(10 ** 6, 20) == settings.PAGE_SIZE_MAX
+
+
+@pytest.fixture
+def message_ids(db):
+    create_user(db)
+    conversation = create_conversation(db)
+    return conversation.id, add_messages(db, conversation.id, [f"消息{i}" for i in range(7)])
+
+
+def paginate(db, conversation_id, **kwargs):
+    query = db.query(Message).filter(Message.conversation_id == conversation_id)
+    return keyset_paginate(query, (Message.created_at, Message.id), 3, **kwargs)
+
+
+def test_keyset_pages_backwards_and_forwards(db, message_ids):
+    conversation_id, ids = message_ids
+    newest = ids[::-1]
+
+    first = paginate(db, conversation_id)
+    assert [m.id for m in first.items] == newest[:3]
+    assert first.has_more and first.after is None
+
+    second = paginate(db, conversation_id, before=first.before)
+    assert [m.id for m in second.items] == newest[3:6]
+    assert second.has_more and second.after is not None
+
+    last = paginate(db, conversation_id, before=second.before)
+    assert [m.id for m in last.items] == newest[6:]
+    assert not last.has_more and last.before is None
+
+    back = paginate(db, conversation_id, after=last.after)
+    assert [m.id for m in back.items] == newest[3:6]
+    assert back.has_more and back.before is not None
+
+
+def test_keyset_sees_new_rows_without_duplicates(db, message_ids):
+    conversation_id, ids = message_ids
+    first = paginate(db, conversation_id)
+    added = add_messages(db, conversation_id, ["新消息"])
+    # 翻页期间插入的消息不会让下一页重复出现上一页的数据
+    second = paginate(db, conversation_id, before=first.before)
+    assert [m.id for m in second.items] == ids[::-1][3:6]
+    # 向新的方向翻页时能看到新插入的消息
+    newer = paginate(db, conversation_id, after=second.after)
+    assert [m.id for m in newer.items] == ids[::-1][:3]
+    assert newer.has_more
+    newest = paginate(db, conversation_id, after=newer.after)
+    assert [m.id for m in newest.items] == added
+
+
+def test_before_and_after_together_rejected(db, message_ids):
+    conversation_id, _ = message_ids
+    page = paginate(db, conversation_id)
+    with pytest.raises(InvalidCursor):
+        paginate(db, conversation_id, before=page.before, after=page.before)
@@ -0,0 +1,127 @@
+"""
+PostgreSQL：批量导出/导入和asyncpg引擎
+
+PostgreSQL的来源与benchmarks.bench_postgres相同（POSTGRES_BENCH_URL，或PATH/PG_BIN中的
+initdb/pg_ctl启动的临时实例），没有可用的PostgreSQL时跳过。
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+import app.services.chat as chat_module
+from app.database.bulk_copy import export_tables, import_tables
+from app.database.engine import create_async_db_engine, create_db_engine
+from app.database.migrations import migrate
+from app.database.session import Base
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.services.archive import ConversationArchiver
+from app.services.chat import ChatService
+from app.services.message_writer import MessageWriter
+from benchmarks.bench_postgres import local_postgres, temporary_database
+from tests.conftest import add_messages, create_conversation, create_user
+
+
+@pytest.fixture(scope="module")
+def postgres_server():
+    with local_postgres() as url:
+        if url is None:
+            pytest.skip("没有可用的PostgreSQL：设置POSTGRES_BENCH_URL，或把initdb/pg_ctl加入PATH（PG_BIN）")
+        yield url
+
+
+@pytest.fixture
+def pg_url(postgres_server):
+    with temporary_database(postgres_server) as url:
+        yield url
+
+
+@pytest.fixture
+def pg_engine(pg_url):
+    engine = create_db_engine(pg_url)
+    Base.metadata.create_all(bind=engine)
+    migrate(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_export_sqlite_import_postgres(db, engine, pg_engine, tmp_path):
+    create_user(db)
+    conversation_ids = [create_conversation(db, title=f"对话{i}").id for i in range(3)]
+    for conversation_id in conversation_ids:
+        add_messages(db, conversation_id, ["你好", 'quote " and, comma', "多行\n内容"])
+
+    exported = export_tables(engine, str(tmp_path))
+    assert [(r.table, r.rows) for r in exported] == [("users", 1), ("conversations", 3), ("messages", 9)]
+    imported = import_tables(pg_engine, str(tmp_path))
+    assert [(r.table, r.rows) for r in imported] == [(r.table, r.rows) for r in exported]
+
+    with Session(pg_engine) as pg:
+        rows = pg.execute(select(Message.id, Message.content).order_by(Message.id)).all()
+        assert rows == db.execute(select(Message.id, Message.content).order_by(Message.id)).all()
+        # 导入后序列推进到最大ID之后，新数据不会与导入的ID冲突
+        max_id = rows[-1][0]
+        conversation = Conversation(user_id=1, title="新对话")
+        pg.add(conversation)
+        pg.flush()
+        assert conversation.id > max(conversation_ids)
+        message = Message(conversation_id=conversation.id, role="user", content="新消息", token_count=1)
+        pg.add(message)
+        pg.commit()
+        assert message.id > max_id
+
+    # 再从PostgreSQL导出（COPY）得到相同的数据
+    again = tmp_path / "again"
+    assert [r.rows for r in export_tables(pg_engine, str(again), ("messages",))] == [10]
+
+
+def test_import_into_non_empty_table_rejected(pg_engine, tmp_path):
+    export_tables(pg_engine, str(tmp_path), ("users",))
+    with pg_engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (username, email, password_hash, is_active) "
+                          "VALUES ('u', 'u@example.com', 'x', true)"))
+    with pytest.raises(ValueError):
+        import_tables(pg_engine, str(tmp_path), ("users",))
+
+
+def test_asyncpg_chat_service(pg_url, pg_engine, monkeypatch):
+    with Session(pg_engine) as db:
+        create_user(db)
+        conversation_id = create_conversation(db).id
+        add_messages(db, conversation_id, [f"消息{i}" for i in range(5)])
+        ConversationArchiver().archive_conversation(db, conversation_id)
+
+    writer = MessageWriter(pg_url, window_ms=5, synchronous="")
+    monkeypatch.setattr(chat_module, "message_writer", writer)
+
+    async def run():
+        async_engine = create_async_db_engine(pg_url)
+        assert async_engine.dialect.driver == "asyncpg"
+        factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        try:
+            async with factory() as db:
+                # 读取归档的对话时在同一会话中恢复
+                page = await ChatService.aget_conversation_messages(db, conversation_id, limit=3)
+                assert [m.content for m in page.items] == ["消息2", "消息3", "消息4"]
+                older = await ChatService.aget_conversation_messages(db, conversation_id, limit=3, before=page.before)
+                assert [m.content for m in older.items] == ["消息0", "消息1"]
+
+                message = await ChatService.aadd_message(db, conversation_id, "user", "新消息")
+                conversations = await ChatService.aget_conversations(db, 1)
+                assert [c.id for c in conversations.items] == [conversation_id]
+            async with factory() as db:
+                count = (await db.execute(
+                    select(func.count()).select_from(Message).where(Message.conversation_id == conversation_id)
+                )).scalar()
+                assert count == 6
+                assert (await ChatService.aget_conversation_messages(db, conversation_id, limit=1)).items[0].id == message.id
+        finally:
+            await async_engine.dispose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        writer.close()
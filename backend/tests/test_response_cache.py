@@ -0,0 +1,32 @@
+"""LLM回答缓存"""
+from app.services.response_cache import ResponseCache, make_cache_key
+
+
+def payload(temperature):
+    return {"model": "deepseek-chat", "messages": [{"role": "user", "content": "你好"}],
+            "max_tokens": 100, "temperature": temperature, "stream": True}
+
+
+def test_only_deterministic_requests_cacheable():
+    cache = ResponseCache()
+    cache.enabled = True
+    assert cache.cacheable(payload(0))
+    assert not cache.cacheable(payload(0.7))
+    cache.enabled = False
+    assert not cache.cacheable(payload(0))
+
+
+def test_key_ignores_stream_flag():
+    streamed, once = payload(0), dict(payload(0), stream=False)
+    assert make_cache_key(streamed) == make_cache_key(once)
+    assert make_cache_key(payload(0)) != make_cache_key(payload(0.7))
+
+
+def test_get_and_set():
+    cache = ResponseCache()
+    cache.enabled = True
+    key = make_cache_key(payload(0))
+    assert cache.get(key) is None
+    cache.set(key, "回答")
+    assert cache.get(key) == "回答"
+    assert (cache.hits, cache.misses, cache.stores) == (1, 1, 1)
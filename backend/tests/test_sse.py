@@ -0,0 +1,63 @@
+"""SSE解码和流式数据块解析"""
+import json
+
+from app.utils.sse import ChatStreamParser, SSEDecoder, StreamDelta, parse_chat_chunk
+
+
+def chunk(content=None, finish_reason=None, **extra) -> bytes:
+    delta = {} if content is None else {"content": content}
+    payload = {"choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra}
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def test_decoder_joins_events_split_across_reads():
+    decoder = SSEDecoder()
+    assert decoder.feed(b"data: {\"a\"") == []
+    assert decoder.feed(b":1}\n") == []
+    assert decoder.feed(b"\ndata: 2\n\ndata: 3") == [b'{"a":1}', b"2"]
+    assert decoder.flush() == [b"3"]
+    assert decoder.flush() == []
+
+
+def test_decoder_multiline_data_comments_and_crlf():
+    decoder = SSEDecoder()
+    events = decoder.feed(b": keep-alive\r\n\r\nevent: message\r\nid: 1\r\ndata: a\r\ndata:b\r\n\r\n")
+    assert events == [b"a\nb"]
+
+
+def test_decoder_flush_ignores_trailing_whitespace():
+    decoder = SSEDecoder()
+    assert decoder.feed(b"data: x\n\n\n") == [b"x"]
+    assert decoder.flush() == []
+
+
+def test_parse_fast_path_and_escapes():
+    assert parse_chat_chunk(chunk("你好")) == StreamDelta(content="你好")
+    assert parse_chat_chunk(chunk('引号"和\n换行')) == StreamDelta(content='引号"和\n换行')
+    assert parse_chat_chunk(chunk("")) == StreamDelta()
+
+
+def test_parse_slow_path_finish_and_usage():
+    usage = {"prompt_tokens": 3, "completion_tokens": 5}
+    delta = parse_chat_chunk(chunk("完", finish_reason="stop", usage=usage))
+    assert delta == StreamDelta(content="完", finish_reason="stop", usage=usage)
+    # 不是紧凑JSON时回退到完整解析
+    assert parse_chat_chunk(b'{"choices": [{"delta": {"content": "a"}, "finish_reason": null}]}').content == "a"
+
+
+def test_chat_stream_parser_stops_at_finish_reason():
+    parser = ChatStreamParser()
+    stream = b"".join(b"data: " + data + b"\n\n" for data in (
+        chunk("你"), b"not json", chunk("好", finish_reason="stop"), chunk("多余")
+    ))
+    deltas = parser.feed(stream[:7]) + parser.feed(stream[7:]) + parser.flush()
+    assert "".join(d.content for d in deltas if d.content) == "你好"
+    assert parser.done and parser.finish_reason == "stop"
+    assert parser.errors == 1
+
+
+def test_chat_stream_parser_done_marker():
+    parser = ChatStreamParser()
+    deltas = parser.feed(b"data: " + chunk("a") + b"\n\ndata: [DONE]\n\ndata: " + chunk("b") + b"\n\n")
+    assert [d.content for d in deltas] == ["a"]
+    assert parser.done and parser.finish_reason is None
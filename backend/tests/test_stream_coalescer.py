@@ -0,0 +1,68 @@
+"""流式回答片段合并"""
+import asyncio
+
+import pytest
+
+from app.services.stream_coalescer import StreamCoalescer
+
+
+def coalescer(window=0.05, max_bytes=512, enabled=True) -> StreamCoalescer:
+    c = StreamCoalescer()
+    c.enabled, c.window, c.max_bytes = enabled, window, max_bytes
+    return c
+
+
+async def source(chunks, delay=0.0, error=None):
+    for chunk in chunks:
+        if delay:
+            await asyncio.sleep(delay)
+        yield chunk
+    if error is not None:
+        raise error
+
+
+async def collect(c: StreamCoalescer, upstream) -> list:
+    return [frame async for frame in c.coalesce(upstream)]
+
+
+def test_burst_is_merged_and_content_preserved():
+    chunks = [f"字{i}" for i in range(100)]
+    c = coalescer()
+    frames = asyncio.run(collect(c, source(chunks)))
+    assert "".join(frames) == "".join(chunks)
+    assert frames[0] == chunks[0]
+    assert len(frames) < len(chunks)
+    assert c.stats()["chunks"] == len(chunks)
+
+
+def test_max_bytes_flushes_buffer():
+    c = coalescer(window=10, max_bytes=8)
+    frames = asyncio.run(collect(c, source(["a"] * 33)))
+    assert frames == ["a"] + ["a" * 8] * 4
+    assert c.flushes["size"] == 4
+
+
+def test_slow_upstream_is_not_delayed():
+    c = coalescer(window=0.01)
+    frames = asyncio.run(collect(c, source(["a", "b", "c"], delay=0.03)))
+    assert frames == ["a", "b", "c"]
+
+
+def test_error_after_partial_output():
+    c = coalescer(window=10)
+
+    async def run():
+        frames = []
+        with pytest.raises(RuntimeError):
+            async for frame in c.coalesce(source(["a", "b", "c"], error=RuntimeError("upstream"))):
+                frames.append(frame)
+        return frames
+
+    # 出错前已收到的内容先输出，再抛出异常
+    assert "".join(asyncio.run(run())) == "abc"
+
+
+def test_disabled_passthrough():
+    c = coalescer(enabled=False)
+    assert asyncio.run(collect(c, source(["a", "b"]))) == ["a", "b"]
+    assert asyncio.run(collect(c, source([]))) == []
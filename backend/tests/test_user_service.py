@@ -0,0 +1,26 @@
+"""用户服务的密码哈希"""
+import pytest
+
+from app.schemas.user import UserCreate, UserUpdate
+from app.services.password_hasher import password_hasher
+from app.services.user_service import UserService
+
+
+@pytest.fixture
+def hasher(monkeypatch):
+    monkeypatch.setattr(password_hasher, "rounds", 4)
+    yield password_hasher
+    password_hasher.close()
+
+
+def test_sync_paths_use_hasher_pool(db, hasher):
+    completed = dict(hasher.completed)
+    user = UserService.create_user(db, UserCreate(username="alice", email="alice@example.com", password="secret1"))
+    assert user.password_hash.startswith("$2b$04$")
+    assert UserService.authenticate_user(db, "alice", "secret1").id == user.id
+    assert UserService.authenticate_user(db, "alice@example.com", "wrong") is None
+
+    UserService.update_user(db, user.id, UserUpdate(password="secret2"))
+    assert UserService.authenticate_user(db, "alice", "secret2").id == user.id
+    assert hasher.completed["hash"] - completed["hash"] == 2
+    assert hasher.completed["verify"] - completed["verify"] == 3
@@ -73,9 +73,9 @@ export const authApi = {
 
 // 对话相关API
 export const conversationApi = {
-  // 获取所有对话
-  getAll: () => {
-    return api.get('/api/conversations')
+  // 分页获取对话（params: limit、before、after）
+  getAll: (params = {}) => {
+    return api.get('/api/conversations', { params })
   },
   
   // 创建对话
@@ -104,9 +104,9 @@ export const conversationApi = {
 
 // 消息相关API
 export const messageApi = {
-  // 获取对话的消息列表
-  getByConversation: (conversationId) => {
-    return api.get(`/api/conversations/${conversationId}/messages`)
+  // 分页获取对话的消息列表（params: limit、before、after）
+  getByConversation: (conversationId, params = {}) => {
+    return api.get(`/api/conversations/${conversationId}/messages`, { params })
   },
   
   // 创建消息
@@ -129,4 +129,12 @@ export const chatApi = {
   }
 }
 
+// 搜索相关API
+export const searchApi = {
+  // 搜索对话历史（params: limit、cursor、conversation_id），snippet中匹配部分用<mark>包裹
+  search: (q, params = {}) => {
+    return api.get('/api/search', { params: { q, ...params } })
+  }
+}
+
 export default api
\ No newline at end of file
@@ -7,6 +7,9 @@ export const useChatStore = defineStore('chat', {
     conversations: [],
     currentConversation: null,
     messages: [],
+    // 分页游标：加载更早的对话/消息，为null表示已全部加载
+    conversationsBefore: null,
+    messagesBefore: null,
     isLoading: false,
     isSending: false,
     error: null
@@ -20,9 +23,10 @@ export const useChatStore = defineStore('chat', {
       
       try {
         // 注意：api响应拦截器直接返回response.data，所以不需要再访问response.data
-        const conversationsData = await api.get('/api/conversations');
-        this.conversations = conversationsData;
-        return conversationsData;
+        const page = await api.get('/api/conversations');
+        this.conversations = page.items;
+        this.conversationsBefore = page.before;
+        return page.items;
       } catch (error) {
         this.error = error.response?.data?.detail || '获取对话列表失败';
         console.error('获取对话列表失败:', error);
@@ -32,6 +36,42 @@ export const useChatStore = defineStore('chat', {
       }
     },
     
+    // 加载更早的一页对话
+    async loadMoreConversations() {
+      if (!this.conversationsBefore) return [];
+      
+      try {
+        const page = await api.get('/api/conversations', {
+          params: { before: this.conversationsBefore }
+        });
+        this.conversations.push(...page.items);
+        this.conversationsBefore = page.before;
+        return page.items;
+      } catch (error) {
+        this.error = error.response?.data?.detail || '获取对话列表失败';
+        console.error('获取对话列表失败:', error);
+        throw error;
+      }
+    },
+    
+    // 加载当前对话更早的一页消息
+    async loadOlderMessages() {
+      if (!this.currentConversation || !this.messagesBefore) return [];
+      
+      try {
+        const page = await api.get(`/api/conversations/${this.currentConversation.id}/messages`, {
+          params: { before: this.messagesBefore }
+        });
+        this.messages.unshift(...page.items);
+        this.messagesBefore = page.before;
+        return page.items;
+      } catch (error) {
+        this.error = error.response?.data?.detail || '获取消息失败';
+        console.error('获取消息失败:', error);
+        throw error;
+      }
+    },
+    
     // 创建新对话
     async createConversation(title = '新对话') {
       this.isLoading = true;
@@ -69,6 +109,7 @@ export const useChatStore = defineStore('chat', {
         
         this.currentConversation = conversationData;
         this.messages = conversationData.messages || [];
+        this.messagesBefore = conversationData.messages_before;
         
         console.log('设置后的消息数量:', this.messages.length);
         return conversationData;
@@ -153,6 +194,7 @@ export const useChatStore = defineStore('chat', {
         
         // 清空所有对话
         this.conversations = [];
+        this.conversationsBefore = null;
         this.currentConversation = null;
         this.messages = [];
         
@@ -315,7 +357,7 @@ export const useChatStore = defineStore('chat', {
         return response;
       } catch (error) {
         console.error('发送消息失败:', error);
-        this.error = error.response?.detail || error.message || '发送消息失败';
+        this.error = error.response?.data?.detail || error.message || '发送消息失败';
         
         // 清理临时AI消息
         const aiTempMessages = this.messages.filter(m => m.id.startsWith('ai-temp-'));
@@ -348,7 +390,8 @@ export const useChatStore = defineStore('chat', {
         });
         
         if (!response.ok) {
-          throw new Error(`HTTP error! status: ${response.status}`);
+          const body = await response.json().catch(() => null);
+          throw new Error(body?.detail || `HTTP error! status: ${response.status}`);
         }
         
         const reader = response.body.getReader();
@@ -366,35 +409,40 @@ export const useChatStore = defineStore('chat', {
           
           for (const line of lines) {
             if (line.trim()) {
+              let data;
               try {
-                const data = JSON.parse(line);
-                
-                if (data.type === 'chunk') {
-                  // 更新流式内容
-                  const messageIndex = this.messages.findIndex(m => m.id === aiTempId);
-                  if (messageIndex !== -1) {
-                    const currentMessage = this.messages[messageIndex];
-                    this.messages.splice(messageIndex, 1, {
-                      ...currentMessage,
-                      content: currentMessage.content + data.content
-                    });
-                  }
-                } else if (data.type === 'end') {
-                  // 流式响应结束
-                  const messageIndex = this.messages.findIndex(m => m.id === aiTempId);
-                  if (messageIndex !== -1) {
-                    this.messages.splice(messageIndex, 1, {
-                      ...this.messages[messageIndex],
-                      streaming: false,
-                      id: data.ai_message?.id || aiTempId
-                    });
-                  }
-                  return data;
-                } else if (data.type === 'error') {
-                  throw new Error(data.error);
-                }
+                data = JSON.parse(line);
               } catch (parseError) {
                 console.error('解析流式数据失败:', parseError);
+                continue;
+              }
+              
+              // 上游不可用等错误：后端不会保存助手消息，移除临时消息并抛出错误
+              if (data.type === 'error' || (data.error && !data.type)) {
+                throw new Error(data.error);
+              }
+              
+              if (data.type === 'chunk') {
+                // 更新流式内容
+                const messageIndex = this.messages.findIndex(m => m.id === aiTempId);
+                if (messageIndex !== -1) {
+                  const currentMessage = this.messages[messageIndex];
+                  this.messages.splice(messageIndex, 1, {
+                    ...currentMessage,
+                    content: currentMessage.content + data.content
+                  });
+                }
+              } else if (data.type === 'end') {
+                // 流式响应结束
+                const messageIndex = this.messages.findIndex(m => m.id === aiTempId);
+                if (messageIndex !== -1) {
+                  this.messages.splice(messageIndex, 1, {
+                    ...this.messages[messageIndex],
+                    streaming: false,
+                    id: data.ai_message?.id || aiTempId
+                  });
+                }
+                return data;
               }
             }
           }